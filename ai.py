@@ -1,467 +1,662 @@
 # ai_editor_with_ml.py
-import re
 import tkinter as tk
-from tkinter import scrolledtext, messagebox
-import subprocess
-import tempfile
+from tkinter import scrolledtext, messagebox, ttk
+from tkinter import font as tkfont
+import builtins
+import keyword
+import mmap
 import os
-import numpy as np
-import pickle
-from collections import Counter
-from datetime import datetime
+import queue
+import re
+import threading
+import time
+import tokenize
+from collections import deque
+
+# Analysis engine (re-exported so "from ai import ..." keeps working)
+from ai_analyzer import (
+    RuleEngine, LineIndex, ASTMetricsVisitor, collect_ast_metrics,
+    FeatureCache, MLCodeAnalyzer, EnhancedAIAnalyzer, IncrementalAnalyzer,
+    AnalysisCache
+)
+from ai_runner import (
+    ProcessRunner, SpillReader, WarmPool, WarmRunner, tail_lines, LIMITS_SUPPORTED,
+    load_profile, save_profile, profile_rows, diff_profiles,
+    load_memory_profile, save_memory_profile, memory_rows, diff_memory
+)
 
 # ========================================================
-# ML MODEL IMPLEMENTATIONS
+# ANALYSIS SCHEDULING
 # ========================================================
 
-class MLCodeAnalyzer:
-    """Machine Learning-based code analyzer"""
+class AnalysisScheduler:
+    """Debounced scheduler that coalesces analysis requests per buffer"""
+    
+    def __init__(self, root, callback, delay_ms=1000, max_wait_ms=3000):
+        self.root = root
+        self.callback = callback
+        self.delay_ms = delay_ms  # Trailing debounce after the last keystroke
+        self.max_wait_ms = max_wait_ms  # Ceiling so continuous typing still gets analyzed
+        self.pending = {}  # buffer key -> {'after_id', 'first_request'}
+        self.stats = {'requested': 0, 'coalesced': 0, 'executed': 0}
     
-    def __init__(self):
-        self.pattern_model = self.load_or_create_model()
-        self.code_features = {}
-        self.learning_rate = 0.1
+    def request(self, key='editor'):
+        """Schedule an analysis, replacing any pending job for the same buffer"""
+        self.stats['requested'] += 1
+        now = time.monotonic()
+        
+        job = self.pending.get(key)
+        if job:
+            # Stale job - cancel it and fold this request into the burst
+            self.root.after_cancel(job['after_id'])
+            self.stats['coalesced'] += 1
+            first_request = job['first_request']
+        else:
+            first_request = now
         
-    def load_or_create_model(self):
-        """Load existing model or create new one"""
-        model_file = "code_patterns_model.pkl"
+        waited_ms = (now - first_request) * 1000
+        delay = max(0, min(self.delay_ms, self.max_wait_ms - waited_ms))
         
-        if os.path.exists(model_file):
-            try:
-                with open(model_file, 'rb') as f:
-                    return pickle.load(f)
-            except:
-                pass
-        
-        # Initialize with basic patterns
-        base_patterns = {
-            'performance': {
-                'range_len_pattern': {'weight': 0.9, 'count': 0},
-                'inefficient_concatenation': {'weight': 0.8, 'count': 0},
-                'list_membership': {'weight': 0.7, 'count': 0}
-            },
-            'style': {
-                'redundant_bool': {'weight': 0.6, 'count': 0},
-                'bare_except': {'weight': 0.8, 'count': 0},
-                'print_debugging': {'weight': 0.5, 'count': 0}
-            },
-            'security': {
-                'eval_usage': {'weight': 0.95, 'count': 0},
-                'exec_usage': {'weight': 0.9, 'count': 0}
-            }
-        }
-        return base_patterns
-    
-    def save_model(self):
-        """Save trained model to file"""
-        with open("code_patterns_model.pkl", 'wb') as f:
-            pickle.dump(self.pattern_model, f)
-    
-    def extract_features(self, code):
-        """Extract features from code for ML analysis"""
-        features = {}
-        
-        # Basic metrics
-        lines = code.split('\n')
-        features['line_count'] = len(lines)
-        features['indentation_depth'] = self.calculate_avg_indentation(code)
-        features['function_count'] = len(re.findall(r'def\s+\w+', code))
-        features['class_count'] = len(re.findall(r'class\s+\w+', code))
-        
-        # Complexity metrics - FIXED: Added this method
-        features['complexity_score'] = self.calculate_complexity(code)
-        features['nesting_depth'] = self.calculate_max_nesting(code)
-        
-        # Pattern frequencies
-        pattern_counts = self.count_patterns(code)
-        for category, patterns in pattern_counts.items():
-            for pattern, count in patterns.items():
-                features[f'{category}_{pattern}'] = count
-        
-        return features
-    
-    # ADDED THIS MISSING METHOD
-    def calculate_complexity(self, code):
-        """Calculate code complexity score"""
-        lines = code.split('\n')
-        score = 0
-        
-        for line in lines:
-            # Skip comments and empty lines
-            if line.strip().startswith('#') or not line.strip():
-                continue
-                
-            # Add points for control structures
-            if any(keyword in line for keyword in ['if ', 'elif ', 'else:', 'for ', 'while ', 
-                                                  'try:', 'except ', 'finally:', 'with ']):
-                score += 1
+        after_id = self.root.after(int(delay), lambda: self._run(key))
+        self.pending[key] = {'after_id': after_id, 'first_request': first_request}
+    
+    def cancel(self, key='editor'):
+        """Cancel the pending job for a buffer, if any"""
+        job = self.pending.pop(key, None)
+        if job:
+            self.root.after_cancel(job['after_id'])
+    
+    def cancel_all(self):
+        """Cancel every pending job"""
+        for key in list(self.pending):
+            self.cancel(key)
+    
+    def get_stats(self):
+        """Return a copy of the request/coalesce/execute counters"""
+        stats = dict(self.stats)
+        stats['pending'] = len(self.pending)
+        return stats
+    
+    def _run(self, key):
+        """Fire the pending job for a buffer"""
+        self.pending.pop(key, None)
+        self.stats['executed'] += 1
+        self.callback()
+
+class AnalysisWorker:
+    """Background thread that analyzes buffer snapshots off the Tk main thread"""
+    
+    def __init__(self, root, analyzer, get_revision, on_result, on_error, poll_ms=50):
+        self.root = root
+        self.analyzer = analyzer
+        self.get_revision = get_revision  # Current buffer revision on the UI side
+        self.on_result = on_result
+        self.on_error = on_error
+        self.poll_ms = poll_ms
+        
+        # Held while the analyzer runs so other callers can share it safely
+        self.lock = threading.Lock()
+        
+        self._condition = threading.Condition()
+        self._snapshot = None  # Only the newest (revision, code) is kept
+        self._results = queue.Queue()
+        self._stopped = False
+        self.stats = {'submitted': 0, 'superseded': 0, 'completed': 0, 'discarded': 0}
+        
+        self._thread = threading.Thread(target=self._loop, name="analysis-worker", daemon=True)
+        self._thread.start()
+        self.root.after(self.poll_ms, self._poll)
+    
+    def submit(self, revision, code, dirty_ranges=None):
+        """Hand a buffer snapshot to the worker, replacing any unstarted one"""
+        with self._condition:
+            if self._snapshot is not None:
+                self.stats['superseded'] += 1
+                # Keep the replaced snapshot's edits; None means "all dirty"
+                previous = self._snapshot[2]
+                if previous is None or dirty_ranges is None:
+                    dirty_ranges = None
+                else:
+                    dirty_ranges = previous + dirty_ranges
+            self._snapshot = (revision, code, dirty_ranges)
+            self.stats['submitted'] += 1
+            self._condition.notify()
+    
+    def stop(self, timeout=None):
+        """Stop the worker thread and result polling
+        
+        Waits (up to timeout seconds) for an analysis in progress to finish,
+        so it is not cut off in the middle of a model flush at exit.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join(timeout)
+    
+    def get_stats(self):
+        """Return a copy of the worker counters"""
+        return dict(self.stats)
+    
+    def _loop(self):
+        """Worker thread: analyze the newest snapshot, post the result"""
+        while True:
+            with self._condition:
+                while self._snapshot is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                revision, code, dirty_ranges = self._snapshot
+                self._snapshot = None
             
-            # Add points for logical operators
-            if ' and ' in line or ' or ' in line:
-                score += 0.5
+            try:
+                with self.lock:
+                    suggestions, metrics = self.analyzer.analyze(code, dirty_ranges)
+                    line_index = self.analyzer.ml_analyzer.get_line_index(code)
+                self._results.put((revision, (suggestions, metrics, line_index), None))
+            except Exception as e:
+                self._results.put((revision, None, e))
+    
+    def _poll(self):
+        """UI thread: deliver finished results, dropping stale revisions"""
+        while True:
+            try:
+                revision, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
             
-            # Add points for function definitions
-            if 'def ' in line:
-                score += 1
+            if revision < self.get_revision():
+                # The buffer changed while this was running
+                self.stats['discarded'] += 1
+                continue
             
-            # Add points for class definitions
-            if 'class ' in line:
-                score += 2
+            self.stats['completed'] += 1
+            if error is not None:
+                self.on_error(revision, error)
+            else:
+                self.on_result(revision, *result)
         
-        return int(score)
+        if not self._stopped:
+            self.root.after(self.poll_ms, self._poll)
+
+class TextEditTracker:
+    """Records which lines of a Text widget each edit touches
     
-    def calculate_avg_indentation(self, code):
-        """Calculate average indentation level"""
-        lines = code.split('\n')
-        indent_levels = []
-        
-        for line in lines:
-            if line.strip():
-                indent = len(line) - len(line.lstrip())
-                indent_levels.append(indent // 4)  # Assuming 4-space indents
-        
-        return np.mean(indent_levels) if indent_levels else 0
+    The widget's Tcl command is renamed and replaced by a Tcl proc that
+    notes each command here before forwarding it, so typing, paste and
+    programmatic inserts/deletes all pass through. Forwarding stays in Tcl
+    so the widget's errors reach their callers unchanged: tk_textCopy, for
+    one, learns there is no selection from the error of "get sel.first
+    sel.last". An error raised from a Python command would instead resurface
+    in mainloop.
+    """
     
-    def calculate_max_nesting(self, code):
-        """Calculate maximum nesting depth"""
-        max_depth = 0
-        current_depth = 0
-        
-        lines = code.split('\n')
-        for line in lines:
-            # Skip comments
-            if line.strip().startswith('#'):
+    MAX_RANGES = 64  # Beyond this, collapse to one covering range
+    
+    def __init__(self, widget):
+        self.widget = widget
+        self.dirty = []  # [(first_line, last_line)] in current line numbers
+        self.listeners = []  # callback(first, removed, added), or (None, None, None) after undo/redo
+        self._pending = []  # Stack of edits noted before their command ran
+        self._orig = widget._w + "_orig"
+        hook = widget._w + "_edit"
+        widget.tk.call("rename", widget._w, self._orig)
+        widget.tk.createcommand(hook, self._hook)
+        widget.tk.call("proc", widget._w, "args", f"""
+            {hook} before {{*}}$args
+            try {{
+                return [{self._orig} {{*}}$args]
+            }} finally {{
+                {hook} after
+            }}""")
+    
+    def take_dirty(self):
+        """Return and reset the dirty line ranges since the last call"""
+        dirty, self.dirty = self.dirty, []
+        return dirty
+    
+    def _line(self, index):
+        return int(str(self.widget.tk.call(self._orig, "index", index)).split('.')[0])
+    
+    def _hook(self, phase, *args):
+        """Called before and after each widget command"""
+        if phase == 'before':
+            self._pending.append(self._edit_of(args))
+        else:
+            self._apply(*self._pending.pop())
+    
+    def _edit_of(self, args):
+        """(edit, reset) for a widget command: the lines it changes, or
+        reset if it can change any line"""
+        edit = None
+        reset = False
+        try:
+            op = args[0] if args else None
+            if op == 'insert' and len(args) >= 3:
+                first = self._line(args[1])
+                edit = (first, 0, sum(str(text).count('\n') for text in args[2::2]))
+            elif op == 'delete' and len(args) >= 2:
+                indices = args[1:] if len(args) > 2 else (args[1], f"{args[1]} +1c")
+                lines = [self._line(index) for index in indices]
+                edit = (min(lines), max(lines) - min(lines), 0)
+            elif op == 'replace' and len(args) >= 4:
+                first, last = self._line(args[1]), self._line(args[2])
+                edit = (first, last - first, sum(str(text).count('\n') for text in args[3::2]))
+            elif op == 'edit' and len(args) >= 2 and args[1] in ('undo', 'redo'):
+                reset = True  # Undo can touch anything
+        except tk.TclError:
+            edit = None  # Bad index; the command itself reports it
+        return edit, reset
+    
+    def _apply(self, edit, reset):
+        """Record a command's edit and tell the listeners; this runs even if
+        the command failed, as a failed replace may have half happened"""
+        if reset:
+            self.dirty = [(1, float('inf'))]
+            edit = (None, None, None)
+        elif edit is not None:
+            self._record(*edit)
+        if edit is not None:
+            for listener in self.listeners:
+                listener(*edit)
+    
+    def _record(self, first, removed, added):
+        """Shift existing ranges past the edit and merge the edited lines in"""
+        delta = added - removed
+        new_first, new_last = first, first + added
+        
+        ranges = []
+        for start, end in self.dirty:
+            if end < first:
+                ranges.append((start, end))
+            elif start > first + removed:
+                ranges.append((start + delta, end + delta))
+            else:
+                new_first = min(new_first, start)
+                new_last = max(new_last, end + delta)
+        
+        ranges.append((new_first, new_last))
+        ranges.sort()
+        if len(ranges) > self.MAX_RANGES:
+            ranges = [(ranges[0][0], max(end for _, end in ranges))]
+        self.dirty = ranges
+
+# ========================================================
+# LINE NUMBER GUTTER
+# ========================================================
+
+class LineNumberGutter:
+    """Line numbers drawn on a Canvas for the visible lines only
+    
+    Numbers are placed at the y of each display line (dlineinfo), so they
+    follow scrolling and word wrap. Canvas items are reused between
+    redraws and only touched when their number or position changes;
+    redraws are coalesced into one idle callback. Edits that keep the line
+    count redraw only if they change the height of a visible line. The
+    owner calls schedule() when the editor scrolls or is resized.
+    """
+    
+    def __init__(self, parent, editor, tracker, font=("Consolas", 11),
+                 bg="#2D3748", fg="white"):
+        self.editor = editor
+        self.font = tkfont.Font(font=font)
+        self.fg = fg
+        self.canvas = tk.Canvas(parent, bg=bg, highlightthickness=0)
+        self.items = []  # Canvas text ids, reused
+        self.placed = []  # (text, x, y) drawn by each item, None if hidden
+        self.heights = {}  # line -> display height, for the visible lines
+        self.digits = 0
+        self.after_id = None
+        
+        tracker.listeners.append(self.on_edit)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.canvas.bind(sequence, self.on_wheel)
+    
+    def on_edit(self, first, removed, added):
+        if first is not None and removed == added:
+            # Same line count: only a wrap change can move numbers
+            height = self.heights.get(first)
+            if height is None:
+                return  # Not visible
+            info = self.editor.dlineinfo(f"{first}.0")
+            if info is not None and info[3] == height:
+                return
+        self.schedule()
+    
+    def on_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.editor.yview_scroll(-3, 'units')
+        else:
+            self.editor.yview_scroll(3, 'units')
+        return "break"
+    
+    def schedule(self):
+        """Redraw once the current burst of events is handled"""
+        if self.after_id is None:
+            self.after_id = self.editor.after_idle(self.redraw)
+    
+    def redraw(self):
+        """Number the visible lines"""
+        self.after_id = None
+        editor = self.editor
+        count = int(editor.index("end-1c").split('.')[0])
+        
+        digits = max(3, len(str(count)))
+        if digits != self.digits:
+            self.digits = digits
+            self.canvas.configure(width=self.font.measure("9" * digits) + 10)
+        x = int(self.canvas.cget('width')) - 5
+        
+        self.heights = {}
+        line = int(editor.index("@0,0").split('.')[0])
+        used = 0
+        while line <= count:
+            info = editor.dlineinfo(f"{line}.0")
+            if info is None:
+                break  # Below the viewport
+            self.heights[line] = info[3]
+            self.place(used, str(line), x, info[1])
+            used += 1
+            line += 1
+        
+        for index in range(used, len(self.items)):
+            if self.placed[index] is not None:
+                self.canvas.itemconfigure(self.items[index], state='hidden')
+                self.placed[index] = None
+    
+    def place(self, index, text, x, y):
+        """Show text at (x, y) with the index-th canvas item"""
+        if index == len(self.items):
+            self.items.append(self.canvas.create_text(x, y, anchor='ne', text=text,
+                                                      font=self.font, fill=self.fg))
+            self.placed.append((text, x, y))
+            return
+        item = self.items[index]
+        placed = self.placed[index]
+        if placed is None:
+            self.canvas.itemconfigure(item, state='normal', text=text)
+            self.canvas.coords(item, x, y)
+        elif placed != (text, x, y):
+            if placed[0] != text:
+                self.canvas.itemconfigure(item, text=text)
+            if placed[1:] != (x, y):
+                self.canvas.coords(item, x, y)
+        self.placed[index] = (text, x, y)
+
+# ========================================================
+# SYNTAX HIGHLIGHTING
+# ========================================================
+
+class SyntaxHighlighter:
+    """Incremental tokenize-based highlighting of a Text widget
+    
+    Lines are tokenized one at a time from the state left by the line
+    above: None, or the delimiter of a string still open at its end. An
+    edit invalidates the lines it touched; re-tokenizing runs from there
+    until a line ends in the same state as before, so typing re-tokenizes
+    one line and opening a triple-quoted string runs to where it closes.
+    
+    Only lines down to the bottom of the window (plus MARGIN) are
+    tokenized, and tags are applied only to the window plus MARGIN lines
+    above and below. The work runs in slices of at most BUDGET_MS, with
+    the event loop running in between.
+    """
+    
+    BUDGET_MS = 8
+    MARGIN = 50  # Lines tagged beyond either edge of the window
+    COLORS = {
+        'syntax_keyword': "#F92672",
+        'syntax_builtin': "#66D9EF",
+        'syntax_definition': "#A6E22E",
+        'syntax_decorator': "#A6E22E",
+        'syntax_string': "#E6DB74",
+        'syntax_number': "#AE81FF",
+        'syntax_comment': "#75715E",
+    }
+    STRING_TOKENS = {'STRING', 'FSTRING_START', 'FSTRING_MIDDLE', 'FSTRING_END'}
+    BUILTINS = {name for name in dir(builtins) if not name.startswith('_')}
+    OPENER = re.compile(r"[rRbBuUfF]{0,2}('\'\'\'|\"\"\"|'|\")")
+    STALE = object()  # Tags on the line are unknown: remove them all
+    
+    def __init__(self, editor, tracker):
+        self.editor = editor
+        self.states = []  # Per line: open string delimiter at its start, or None
+        self.spans = []  # Per line: ((tag, start col, end col), ...), None until tokenized
+        self.applied = []  # Per line: spans currently tagged, None or STALE
+        self.resume = 0  # Every line above this index is tokenized
+        self.after_id = None
+        self.stats = {'tokenized': 0, 'tagged': 0, 'slices': 0}
+        
+        for tag, color in self.COLORS.items():
+            editor.tag_config(tag, foreground=color)
+        tracker.listeners.append(self.on_edit)
+        self.schedule()
+    
+    def reset(self, count):
+        """Forget everything; the buffer has count lines"""
+        for tag in self.COLORS:
+            self.editor.tag_remove(tag, "1.0", tk.END)
+        self.states = [None] * count
+        self.spans = [None] * count
+        self.applied = [None] * count
+        self.resume = 0
+    
+    def on_edit(self, first, removed, added):
+        if first is None:
+            self.spans = []  # Undo/redo: start over at the next slice
+        else:
+            # Old lines first..first+removed became first..first+added
+            index = min(first, len(self.spans)) - 1
+            if index >= 0:
+                self.spans[index:index + removed + 1] = [None] * (added + 1)
+                self.applied[index:index + removed + 1] = [self.STALE] * (added + 1)
+                self.states[index + 1:index + removed + 1] = [None] * added
+                self.resume = min(self.resume, index)
+        self.schedule()
+    
+    def schedule(self):
+        """Process once the current burst of events is handled"""
+        if self.after_id is None:
+            self.after_id = self.editor.after_idle(self.process)
+    
+    def process(self):
+        """One time slice: tokenize, then tag the visible region"""
+        self.after_id = None
+        self.stats['slices'] += 1
+        deadline = time.perf_counter() + self.BUDGET_MS / 1000
+        editor = self.editor
+        count = int(editor.index("end-1c").split('.')[0])
+        if len(self.spans) != count:
+            self.reset(count)
+        top = int(editor.index("@0,0").split('.')[0])
+        bottom = int(editor.index(f"@0,{editor.winfo_height()}").split('.')[0])
+        first, last = max(1, top - self.MARGIN), min(count, bottom + self.MARGIN)
+        
+        done = self.tokenize_until(last, deadline) and self.tag_lines(first, last, deadline)
+        if not done:
+            self.after_id = editor.after(1, self.process)
+    
+    def tokenize_until(self, last, deadline):
+        """Tokenize stale lines down to line number last; False if out of time"""
+        spans, states = self.spans, self.states
+        index = self.resume
+        try:
+            while index < last:
+                if spans[index] is not None:
+                    index = spans.index(None, index, last)  # ValueError: none left
+                if time.perf_counter() > deadline:
+                    return False
+                text = self.editor.get(f"{index + 1}.0", f"{index + 1}.end")
+                spans[index], end = self.tokenize_line(text, states[index])
+                self.stats['tokenized'] += 1
+                index += 1
+                if index < len(states) and states[index] != end:
+                    # The next line starts differently now: not yet in sync
+                    states[index] = end
+                    spans[index] = None
+        except ValueError:
+            index = last
+        finally:
+            self.resume = index
+        return True
+    
+    def tag_lines(self, first, last, deadline):
+        """Bring the tags of lines first..last up to date; False if out of time"""
+        editor = self.editor
+        for line in range(first, last + 1):
+            spans, applied = self.spans[line - 1], self.applied[line - 1]
+            if spans is None or applied is spans:
                 continue
-            
-            # Count opening braces and colons
-            line_depth = current_depth
-            for char in line:
-                if char == ':' and line.strip().endswith(':'):
-                    line_depth += 1
-                elif char == '(' or char == '[' or char == '{':
-                    line_depth += 0.5  # Partial depth for brackets
-            
-            max_depth = max(max_depth, line_depth)
-            
-            # Reset for next line if not continuing
-            if line.strip() and not line.strip().endswith(':'):
-                current_depth = line_depth
-        
-        return max_depth
-    
-    def count_patterns(self, code):
-        """Count pattern occurrences"""
-        patterns = {
-            'performance': {
-                'range_len': len(re.findall(r'range\s*\(\s*len\s*\(', code, re.IGNORECASE)),
-                'string_concat': len(re.findall(r'\w+\s*=\s*\w+\s*\+\s*["\']', code)),
-                'list_comp_missing': len(re.findall(r'for\s+\w+\s+in\s+\w+\s*:', code)) - 
-                                   len(re.findall(r'\[\s*.*?\s+for\s+.*?\s+in\s+.*?\]', code))
-            },
-            'style': {
-                'bare_except': len(re.findall(r'except\s*:', code)),
-                'print_statements': len(re.findall(r'print\s*\(', code)),
-                'todo_comments': len(re.findall(r'#\s*(TODO|FIXME|HACK)', code, re.IGNORECASE))
-            }
-        }
-        return patterns
-    
-    def predict_issues(self, code):
-        """Predict potential issues using ML"""
-        features = self.extract_features(code)
-        
-        predictions = []
-        confidence_scores = {}
-        
-        # Analyze using trained patterns
-        for category, patterns in self.pattern_model.items():
-            for pattern_name, pattern_data in patterns.items():
-                weight = pattern_data['weight']
-                
-                # Check if pattern exists in code
-                if self.check_pattern_existence(code, pattern_name):
-                    confidence = min(weight * 1.5, 0.95)  # Boost confidence
-                    
-                    prediction = {
-                        'category': category,
-                        'pattern': pattern_name,
-                        'confidence': confidence,
-                        'weight': weight,
-                        'suggestion': self.get_suggestion(category, pattern_name)
-                    }
-                    
-                    predictions.append(prediction)
-                    confidence_scores[f"{category}_{pattern_name}"] = confidence
-        
-        # Sort by confidence
-        predictions.sort(key=lambda x: x['confidence'], reverse=True)
-        
-        # Adjust weights based on predictions
-        self.adjust_weights(code, predictions)
-        
-        return predictions[:10], confidence_scores
-    
-    def check_pattern_existence(self, code, pattern_name):
-        """Check if a specific pattern exists in code"""
-        pattern_checks = {
-            'range_len_pattern': lambda c: bool(re.search(r'range\s*\(\s*len\s*\(', c)),
-            'inefficient_concatenation': lambda c: bool(re.search(r'\w+\s*=\s*\w+\s*\+\s*["\']', c)),
-            'list_membership': lambda c: bool(re.search(r'in\s+\[', c)),
-            'redundant_bool': lambda c: bool(re.search(r'bool\s*\(.*?\)\s*==\s*(True|False)', c)),
-            'bare_except': lambda c: bool(re.search(r'except\s*:', c)),
-            'print_debugging': lambda c: bool(re.search(r'print\s*\(.*?(debug|test|temp)', c, re.IGNORECASE)),
-            'eval_usage': lambda c: bool(re.search(r'eval\s*\(', c)),
-            'exec_usage': lambda c: bool(re.search(r'exec\s*\(', c))
-        }
-        
-        return pattern_checks.get(pattern_name, lambda c: False)(code)
-    
-    def get_suggestion(self, category, pattern_name):
-        """Get suggestion for a pattern"""
-        suggestions = {
-            'range_len_pattern': 'Use enumerate() for index and value access',
-            'inefficient_concatenation': 'Use str.join() for string concatenation in loops',
-            'list_membership': 'Convert to set for faster membership testing',
-            'redundant_bool': 'Direct boolean evaluation is cleaner',
-            'bare_except': 'Specify exception types for better error handling',
-            'print_debugging': 'Consider using logging module for debugging',
-            'eval_usage': 'Avoid eval() - use ast.literal_eval() for safety',
-            'exec_usage': 'exec() is a security risk - find alternatives'
-        }
-        return suggestions.get(pattern_name, 'Consider refactoring')
-    
-    def adjust_weights(self, code, predictions):
-        """Adjust ML model weights based on findings"""
-        for prediction in predictions:
-            category = prediction['category']
-            pattern = prediction['pattern']
-            confidence = prediction['confidence']
-            
-            if pattern in self.pattern_model.get(category, {}):
-                current_weight = self.pattern_model[category][pattern]['weight']
-                
-                # Adjust weight based on confidence and frequency
-                adjustment = self.learning_rate * (confidence - current_weight)
-                self.pattern_model[category][pattern]['weight'] = (
-                    current_weight + adjustment
-                )
-                self.pattern_model[category][pattern]['count'] += 1
-        
-        # Periodically save the model
-        if sum(p['confidence'] for p in predictions) > 2:
-            self.save_model()
+            if time.perf_counter() > deadline:
+                return False
+            if applied is self.STALE:
+                stale = self.COLORS
+            else:
+                stale = {tag for tag, _, _ in applied or ()}
+            for tag in stale:
+                editor.tag_remove(tag, f"{line}.0", f"{line}.end")
+            ranges = {}
+            for tag, start, end in spans:
+                ranges.setdefault(tag, []).extend((f"{line}.{start}", f"{line}.{end}"))
+            for tag, indices in ranges.items():
+                editor.tag_add(tag, *indices)
+            self.applied[line - 1] = spans
+            self.stats['tagged'] += 1
+        return True
+    
+    def tokenize_line(self, text, state):
+        """(spans, end state) of one line that starts in state"""
+        if state is None:
+            # Indentation means nothing to the colors; dropping it keeps the
+            # tokenizer from seeing dedents it has no matching indent for
+            source = text.lstrip()
+            offset = len(text) - len(source)
+        else:
+            # Reopen the string so the tokenizer sees where it closes
+            source = state + text
+            offset = -len(state)
+        
+        spans = []
+        end_state = None
+        previous = None
+        decorator = None
+        try:
+            for token in tokenize.generate_tokens(iter([source + '\n']).__next__):
+                kind = tokenize.tok_name[token.type]
+                start = max(0, token.start[1] + offset)
+                end = token.end[1] + offset
+                tag = None
+                if kind == 'COMMENT':
+                    tag = 'syntax_comment'
+                elif kind in self.STRING_TOKENS:
+                    tag = 'syntax_string'
+                elif kind == 'NUMBER':
+                    tag = 'syntax_number'
+                elif kind == 'NAME':
+                    if decorator is not None:
+                        tag, start = 'syntax_decorator', decorator
+                    elif previous in ('def', 'class'):
+                        tag = 'syntax_definition'
+                    elif keyword.iskeyword(token.string):
+                        tag = 'syntax_keyword'
+                    elif token.string in self.BUILTINS and previous != '.':
+                        tag = 'syntax_builtin'
+                decorator = start if token.string == '@' and previous is None else None
+                if tag is not None and end > start:
+                    spans.append((tag, start, end))
+                if kind not in ('NL', 'NEWLINE', 'INDENT', 'DEDENT', 'ENDMARKER'):
+                    previous = token.string
+        except tokenize.TokenError as e:
+            # Raised at the end of the line for an unclosed bracket (harmless)
+            # or an unclosed string, which carries on into the next line
+            message, (_, column) = e.args
+            if 'string' in message:
+                opener = self.OPENER.match(source, column)
+                end_state = opener.group(0) if opener else state
+                spans.append(('syntax_string', max(0, column + offset), len(text)))
+        except SyntaxError:
+            pass
+        # A tuple of tuples of atoms drops out of the garbage collector's
+        # tracking; 100k lists of spans made full collections take 60 ms
+        return tuple(spans), end_state
 
 # ========================================================
-# ENHANCED AI ANALYZER WITH ML
+# LARGE FILES
 # ========================================================
 
-class EnhancedAIAnalyzer:
-    def __init__(self):
-        self.ml_analyzer = MLCodeAnalyzer()
-        self.patterns = self.initialize_patterns()
-        self.history = []
-        
-    def initialize_patterns(self):
-        return [
-            # Performance patterns
-            (r'for\s+i\s+in\s+range\s*\(\s*len\s*\(\s*(\w+)\s*\)\s*\)', 
-             'Use enumerate() for index and value: for idx, item in enumerate(\\1)'),
-            (r'(\w+)\s*=\s*\1\s*\+\s*(\w+)', 
-             'Use augmented assignment: \\1 += \\2'),
-            (r'if\s+(\w+)\s+in\s+\[', 
-             'Use set for membership testing: if \\1 in {value1, value2}'),
-            
-            # Pythonic patterns
-            (r'if\s+bool\s*\(\s*(\w+)\s*\)\s*==\s*True', 
-             'Directly use: if \\1'),
-            (r'if\s+len\s*\(\s*(\w+)\s*\)\s*>\s*0', 
-             'Directly use: if \\1'),
-            (r'if\s+(\w+)\s*==\s*False', 
-             'Use: if not \\1'),
-            
-            # Security patterns
-            (r'eval\s*\(', '⚠️ SECURITY: Avoid eval() - use ast.literal_eval() instead'),
-            (r'exec\s*\(', '⚠️ SECURITY: Avoid exec() - potential security risk'),
-            
-            # Style patterns
-            (r'except\s*:', 'Specify exception type: except ValueError:'),
-            (r'print\s+"', 'Use print() function: print("text")'),
-        ]
+class ChunkedFileLoader:
+    """Loads a file into a Text widget one chunk per event-loop tick
     
-    def analyze_code(self, code):
-        """Analyze code with both rule-based and ML approaches"""
-        suggestions = []
-        
-        # Get rule-based suggestions
-        suggestions.extend(self.rule_based_analysis(code))
-        
-        # Get ML-based predictions
-        ml_predictions, confidence_scores = self.ml_analyzer.predict_issues(code)
-        suggestions.extend(self.ml_to_suggestions(ml_predictions))
-        
-        # Add code smell detection
-        suggestions.extend(self.detect_code_smells(code))
-        
-        # Sort by priority and confidence
-        suggestions.sort(key=lambda x: (
-            {'high': 0, 'medium': 1, 'low': 2}.get(x['priority'], 3),
-            -x.get('confidence', 0)
-        ))
-        
-        # Store in history
-        self.history.append({
-            'timestamp': datetime.now().isoformat(),
-            'suggestion_count': len(suggestions),
-            'features': self.ml_analyzer.extract_features(code)
-        })
-        
-        return suggestions[:20]
+    The file is memory-mapped and cut into CHUNK_BYTES pieces at line
+    ends, so a chunk never splits a line (or a UTF-8 sequence) and the
+    file is never held as one Python string. Undo is off while loading;
+    the undo stack would otherwise hold a copy of the whole file.
+    progress(fraction) is called after each chunk, done() at the end.
+    """
     
-    def rule_based_analysis(self, code):
-        """Traditional rule-based analysis"""
-        suggestions = []
-        
-        for pattern, advice in self.patterns:
-            matches = re.finditer(pattern, code)
-            for match in matches:
-                line_num = code[:match.start()].count('\n') + 1
-                
-                suggestion_text = f"Line {line_num}: {advice}"
-                suggestions.append({
-                    'line': line_num,
-                    'suggestion': suggestion_text,
-                    'category': self.get_category(pattern),
-                    'priority': 'high' if '⚠️' in advice else 'medium',
-                    'source': 'rule_based',
-                    'confidence': 0.8
-                })
-        
-        return suggestions
-    
-    def ml_to_suggestions(self, ml_predictions):
-        """Convert ML predictions to suggestion format"""
-        suggestions = []
-        
-        for pred in ml_predictions:
-            suggestions.append({
-                'line': 0,  # ML doesn't give line numbers
-                'suggestion': f"[ML] {pred['suggestion']} (confidence: {pred['confidence']:.2f})",
-                'category': pred['category'],
-                'priority': 'high' if pred['confidence'] > 0.8 else 'medium' if pred['confidence'] > 0.5 else 'low',
-                'source': 'ml',
-                'confidence': pred['confidence']
-            })
-        
-        return suggestions
-    
-    def detect_code_smells(self, code):
-        """Detect common code smells"""
-        suggestions = []
-        lines = code.split('\n')
-        
-        # Long function detection
-        function_start = -1
-        for i, line in enumerate(lines):
-            if line.strip().startswith('def '):
-                if function_start != -1:
-                    # Check previous function length
-                    func_length = i - function_start
-                    if func_length > 30:
-                        suggestions.append({
-                            'line': function_start + 1,
-                            'suggestion': f"Long function detected ({func_length} lines). Consider splitting.",
-                            'category': 'maintainability',
-                            'priority': 'medium',
-                            'source': 'heuristic',
-                            'confidence': 0.7
-                        })
-                function_start = i
-        
-        # Deep nesting detection
-        max_nesting = self.ml_analyzer.calculate_max_nesting(code)
-        if max_nesting > 4:
-            suggestions.append({
-                'line': 0,
-                'suggestion': f"Deep nesting detected (depth: {max_nesting}). Consider refactoring.",
-                'category': 'complexity',
-                'priority': 'medium',
-                'source': 'heuristic',
-                'confidence': 0.6
-            })
-        
-        # Duplicate code detection (simplified)
-        line_counts = Counter(lines)
-        for line, count in line_counts.items():
-            if count > 3 and len(line.strip()) > 20:
-                suggestions.append({
-                    'line': 0,
-                    'suggestion': f"Possible duplicate code detected (occurs {count} times).",
-                    'category': 'duplication',
-                    'priority': 'low',
-                    'source': 'heuristic',
-                    'confidence': 0.5
-                })
-        
-        return suggestions
-    
-    def get_category(self, pattern):
-        """Get category based on pattern"""
-        if 'eval' in pattern or 'exec' in pattern:
-            return 'security'
-        elif 'for' in pattern or 'range' in pattern:
-            return 'performance'
-        elif 'if' in pattern or 'bool' in pattern:
-            return 'pythonic'
-        elif 'except' in pattern or 'print' in pattern:
-            return 'style'
+    CHUNK_BYTES = 256 * 1024
+    
+    def __init__(self, root, widget, path, progress, done):
+        self.root = root
+        self.widget = widget
+        self.path = path
+        self.progress = progress
+        self.done = done
+        self.file = None
+        self.map = None
+        self.size = 0
+        self.offset = 0
+        self.after_id = None
+    
+    def start(self):
+        """Open and map the file (OSError if it can't be) and start loading"""
+        self.file = open(self.path, 'rb')
+        try:
+            self.size = os.fstat(self.file.fileno()).st_size
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.file.close()
+            raise
+        self.widget.config(undo=False)
+        self.widget.delete("1.0", tk.END)
+        self.after_id = self.root.after(1, self.step)
+    
+    def step(self):
+        """Insert the next chunk"""
+        self.after_id = None
+        end = min(self.offset + self.CHUNK_BYTES, self.size)
+        if end < self.size:
+            newline = self.map.rfind(b'\n', self.offset, end)
+            if newline >= 0:
+                end = newline + 1
+            else:
+                # One very long line: cut it on a UTF-8 character boundary
+                while end > self.offset + 1 and self.map[end] & 0xC0 == 0x80:
+                    end -= 1
+        text = self.map[self.offset:end].decode('utf-8', errors='replace')
+        self.widget.insert("end-1c", text.replace('\r\n', '\n'))
+        self.offset = end
+        
+        self.progress(end / self.size)
+        if end < self.size:
+            self.after_id = self.root.after(1, self.step)
         else:
-            return 'general'
-    
-    def get_advanced_metrics(self, code):
-        """Get advanced ML-based metrics"""
-        features = self.ml_analyzer.extract_features(code)
-        
-        metrics = {
-            'total_lines': features.get('line_count', 0),
-            'avg_indentation': features.get('indentation_depth', 0),
-            'max_nesting': features.get('nesting_depth', 0),
-            'complexity_score': features.get('complexity_score', 0),
-            'function_count': features.get('function_count', 0),
-            'class_count': features.get('class_count', 0),
-            'quality_score': self.calculate_quality_score(features),
-            'patterns_detected': sum(features.get(f'{cat}_{pat}', 0) 
-                                   for cat in ['performance', 'style'] 
-                                   for pat in ['range_len', 'bare_except', 'todo_comments'])
-        }
-        
-        return metrics
-    
-    def calculate_quality_score(self, features):
-        """Calculate overall code quality score (0-100)"""
-        score = 100
-        
-        # Penalize for complexity
-        complexity = features.get('complexity_score', 0)
-        score -= min(complexity * 2, 30)
-        
-        # Penalize for deep nesting
-        nesting = features.get('nesting_depth', 0)
-        score -= min(nesting * 5, 20)
-        
-        # Penalize for anti-patterns
-        anti_patterns = sum(
-            features.get(f'{cat}_{pat}', 0) 
-            for cat in ['performance', 'style'] 
-            for pat in ['range_len', 'bare_except']
-        )
-        score -= min(anti_patterns * 3, 25)
-        
-        # Bonus for functions and classes
-        functions = features.get('function_count', 0)
-        classes = features.get('class_count', 0)
-        score += min((functions + classes) * 2, 15)
-        
-        return max(0, min(100, score))
+            self.close()
+            self.done()
+    
+    def cancel(self):
+        """Stop loading, keeping what was inserted so far"""
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+        self.close()
+    
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+            self.map = None
+        self.widget.config(undo=True)
+        self.widget.edit_reset()
 
 # ========================================================
 # ENHANCED EDITOR WITH ML
@@ -476,8 +671,65 @@ class AIPythonEditorWithML:
         # Initialize enhanced analyzer with ML
         self.ai_analyzer = EnhancedAIAnalyzer()
         
+        # One pending auto-analysis per buffer, no matter how fast the typing
+        self.analysis_scheduler = AnalysisScheduler(self.root, lambda: self.analyze_with_ai())
+        
+        # Analysis runs on a background thread; results are tagged by revision
+        self.buffer_revision = 0
+        self.line_index = None  # LineIndex of the revision the suggestions refer to
+        self.incremental_analyzer = IncrementalAnalyzer(self.ai_analyzer)
+        
+        # Results for previously analyzed files survive restarts
+        self.analysis_cache = AnalysisCache()
+        self.pending_cache_store = None  # (revision, code, content key) to store once analyzed
+        self.analysis_worker = AnalysisWorker(self.root, self.incremental_analyzer,
+                                              lambda: self.buffer_revision,
+                                              self.on_analysis_result,
+                                              self.on_analysis_error)
+        
+        # Code execution: at most one run at a time, drained from the Tk loop
+        self.runner = None
+        self.run_poll_ms = 50
+        
+        # Only the last lines stay in the Output panel; the full output of
+        # the last run is in a temp file that 📄 Full log pages through
+        self.output_max_lines = 5000
+        self.output_max_chars = 500000
+        self.last_output = None
+        
+        # What each run of this session cost, for 📈 Runs
+        self.run_history = deque(maxlen=100)
+        self.run_count = 0
+        
+        # 🔍 Profile runs are saved here so any two can be compared
+        self.profile_dir = "profiles"
+        self.last_profile = None
+        self.last_memory_profile = None
+        
+        # Files this big are loaded in chunks and not analyzed automatically
+        self.large_file_bytes = 1024 * 1024
+        self.large_file = False
+        self.file_loader = None
+        
+        # Warm start: runs fork from interpreters with these modules imported
+        self.warm_pool = None
+        self.warm_preload = ['numpy', 'pandas']
+        
+        # Shares the analyzer's stage timer; the scheduler and toolbar call
+        # analyze_with_ai through lambdas so its wrapper is picked up
+        self.stage_timer = self.ai_analyzer.timer
+        
         self.setup_ui()
         
+        self.stage_timer.attach(self, {
+            'analyze_with_ai': 'snapshot',
+            'update_suggestions_list': 'paint.suggestions',
+            'update_ml_display': 'paint.metrics',
+            'update_model_info': 'paint.model_info'
+        })
+        if self.stage_timing.get():
+            self.stage_timer.enable()
+        
     def setup_ui(self):
         # Create main container with more space
         main_container = tk.PanedWindow(self.root, orient=tk.HORIZONTAL, sashwidth=5)
@@ -509,24 +761,31 @@ class AIPythonEditorWithML:
         editor_container = tk.Frame(parent)
         editor_container.pack(fill=tk.BOTH, expand=True)
         
-        # Line numbers
-        self.line_numbers = tk.Text(editor_container, width=4, padx=5,
-                                   bg="#2D3748", fg="white", state='disabled',
-                                   font=("Consolas", 11))
-        self.line_numbers.pack(side=tk.LEFT, fill=tk.Y)
-        
         # Main editor
         self.editor = scrolledtext.ScrolledText(editor_container,
                                                bg="#1E1F1C", fg="#F8F8F0",
                                                insertbackground="white",
                                                font=("Consolas", 12),
                                                undo=True, wrap=tk.WORD)
-        self.editor.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.editor.tag_config('memory_hotspot', background="#4A3418")
         
         # Add sample code
         self.insert_ml_sample_code()
         
+        # Record which lines each edit touches
+        self.edit_tracker = TextEditTracker(self.editor)
+        
+        # Line numbers and highlighting, updated by edits and scrolling
+        self.line_numbers = LineNumberGutter(editor_container, self.editor, self.edit_tracker)
+        self.highlighter = SyntaxHighlighter(self.editor, self.edit_tracker)
+        self.editor.configure(yscrollcommand=self.on_editor_scroll)
+        self.editor.bind("<Configure>", lambda event: self.on_editor_scroll())
+        self.line_numbers.canvas.pack(side=tk.LEFT, fill=tk.Y)
+        self.editor.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
         # Bind events
+        self.editor.edit_modified(False)
+        self.editor.bind("<<Modified>>", self.on_editor_modified)
         self.editor.bind("<KeyRelease>", self.on_editor_change)
         
         # Toolbar
@@ -536,7 +795,9 @@ class AIPythonEditorWithML:
         # Toolbar buttons
         buttons = [
             ("▶ Run", self.run_code, "#48BB78"),
-            ("🤖 Analyze", self.analyze_with_ai, "#9F7AEA"),
+            ("🔍 Profile", self.profile_code, "#DD6B20"),
+            ("📦 Memory", self.memory_profile_code, "#D69E2E"),
+            ("🤖 Analyze", lambda: self.analyze_with_ai(), "#9F7AEA"),
             ("🧠 ML Train", self.train_ml_model, "#805AD5"),
             ("💾 Save", self.save_file, "#4299E1"),
             ("📂 Open", self.open_file, "#ED8936"),
@@ -549,12 +810,44 @@ class AIPythonEditorWithML:
                            bg=color, fg="white", font=("Arial", 9, "bold"),
                            padx=10, pady=3)
             btn.pack(side=tk.LEFT, padx=2)
+            
+            # Stop sits right next to Run and is only live during a run
+            if command == self.run_code:
+                self.stop_button = tk.Button(toolbar, text="⏹ Stop", command=self.stop_code,
+                                             bg="#E53E3E", fg="white", font=("Arial", 9, "bold"),
+                                             padx=10, pady=3, state='disabled')
+                self.stop_button.pack(side=tk.LEFT, padx=2)
+        
+        # Shown while a large file loads
+        self.load_progress = ttk.Progressbar(toolbar, length=120, maximum=1.0)
         
         # Auto-analyze toggle
         self.auto_analyze = tk.BooleanVar(value=True)
         tk.Checkbutton(toolbar, text="Auto-analyze",
                       variable=self.auto_analyze,
                       fg="white", bg="#2D3748").pack(side=tk.RIGHT, padx=10)
+        
+        # Run timeout in seconds (0 = no limit)
+        self.run_timeout = tk.StringVar(value="10")
+        tk.Spinbox(toolbar, from_=0, to=3600, width=5,
+                  textvariable=self.run_timeout).pack(side=tk.RIGHT, padx=(0, 10))
+        tk.Label(toolbar, text="Timeout (s)",
+                fg="white", bg="#2D3748").pack(side=tk.RIGHT)
+        
+        # Warm start toggle (needs fork; unavailable on Windows)
+        self.warm_start = tk.BooleanVar(value=False)
+        tk.Checkbutton(toolbar, text="🔥 Warm start",
+                      variable=self.warm_start,
+                      command=self.toggle_warm_start,
+                      state='normal' if WarmPool.available else 'disabled',
+                      fg="white", bg="#2D3748").pack(side=tk.RIGHT, padx=10)
+        
+        # Stage timing toggle (off removes the instrumentation entirely)
+        self.stage_timing = tk.BooleanVar(value=True)
+        tk.Checkbutton(toolbar, text="⏱ Timing",
+                      variable=self.stage_timing,
+                      command=self.toggle_stage_timing,
+                      fg="white", bg="#2D3748").pack(side=tk.RIGHT, padx=10)
     
     def setup_suggestions_panel(self, parent):
         """Setup AI suggestions panel"""
@@ -647,10 +940,31 @@ class AIPythonEditorWithML:
                                     font=("Arial", 12, "bold"))
         output_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
+        output_bar = tk.Frame(output_frame)
+        output_bar.pack(fill=tk.X, padx=5)
+        self.full_log_button = tk.Button(output_bar, text="📄 Full log",
+                                         command=self.open_full_log,
+                                         font=("Arial", 9), state='disabled')
+        self.full_log_button.pack(side=tk.RIGHT)
+        tk.Button(output_bar, text="📈 Runs", command=self.show_run_history,
+                  font=("Arial", 9)).pack(side=tk.RIGHT, padx=2)
+        
+        # Resource limits for runs (0 = none); set in the child via setrlimit
+        limit_state = 'normal' if LIMITS_SUPPORTED else 'disabled'
+        self.cpu_limit = tk.StringVar(value="0")
+        self.memory_limit = tk.StringVar(value="0")
+        tk.Label(output_bar, text="CPU limit (s)").pack(side=tk.LEFT)
+        tk.Spinbox(output_bar, from_=0, to=3600, width=5, textvariable=self.cpu_limit,
+                  state=limit_state).pack(side=tk.LEFT, padx=(0, 10))
+        tk.Label(output_bar, text="Memory limit (MB)").pack(side=tk.LEFT)
+        tk.Spinbox(output_bar, from_=0, to=65536, increment=64, width=6,
+                  textvariable=self.memory_limit, state=limit_state).pack(side=tk.LEFT)
+        
         self.output_text = scrolledtext.ScrolledText(output_frame,
                                                     bg="black", fg="#00FF00",
                                                     font=("Consolas", 10))
         self.output_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.output_text.tag_config('stderr', foreground="#FC8181")
     
     def insert_ml_sample_code(self):
         """Insert sample code with ML-detectable patterns"""
@@ -734,23 +1048,36 @@ if __name__ == "__main__":
     
     def analyze_with_ai(self):
         """Analyze code with enhanced AI"""
-        try:
-            code = self.editor.get("1.0", tk.END)
-            
-            # Get enhanced suggestions
-            suggestions = self.ai_analyzer.analyze_code(code)
-            
-            # Get advanced metrics
-            metrics = self.ai_analyzer.get_advanced_metrics(code)
-            
-            # Update UI
-            self.update_suggestions_list(suggestions)
-            self.update_ml_display(metrics)
-            self.update_model_info()
-        except Exception as e:
-            # Handle errors gracefully
-            print(f"Analysis error: {e}")
-            self.output_text.insert(tk.END, f"\n⚠️ Analysis error: {e}\n")
+        # Snapshot the buffer; the worker thread does the heavy lifting
+        code = self.editor.get("1.0", tk.END)
+        self.analysis_worker.submit(self.buffer_revision, code, self.edit_tracker.take_dirty())
+    
+    def on_analysis_result(self, revision, suggestions, metrics, line_index):
+        """Paint analysis results for the current revision"""
+        if self.pending_cache_store and self.pending_cache_store[0] == revision:
+            _, code, key = self.pending_cache_store
+            self.analysis_cache.put(code, self.incremental_analyzer.fingerprint(),
+                                    suggestions, metrics, key)
+            self.pending_cache_store = None
+        
+        self.line_index = line_index
+        self.update_suggestions_list(suggestions)
+        self.update_ml_display(metrics)
+        self.update_model_info()
+    
+    def toggle_stage_timing(self):
+        """Switch per-stage timing on or off"""
+        if self.stage_timing.get():
+            self.stage_timer.enable()
+        else:
+            self.stage_timer.disable()
+        self.update_model_info()
+    
+    def on_analysis_error(self, revision, error):
+        """Report an analysis failure"""
+        # Handle errors gracefully
+        print(f"Analysis error: {error}")
+        self.output_text.insert(tk.END, f"\n⚠️ Analysis error: {error}\n")
     
     def update_suggestions_list(self, suggestions):
         """Update the suggestions listbox with filtering"""
@@ -821,6 +1148,8 @@ Classes: {metrics.get('class_count', 0)}
 Avg Indentation: {metrics.get('avg_indentation', 0):.1f}
 Max Nesting Depth: {metrics.get('max_nesting', 0)}
 Complexity Score: {metrics.get('complexity_score', 0)}
+Max Function Complexity: {metrics.get('max_function_complexity', 0)}
+Longest Function: {metrics.get('max_function_length', 0)} lines
 Patterns Detected: {metrics.get('patterns_detected', 0)}
 
 📈 QUALITY SCORE: {quality}/100
@@ -841,25 +1170,56 @@ Patterns Detected: {metrics.get('patterns_detected', 0)}
             info = "🧠 ML MODEL STATUS\n"
             info += "="*30 + "\n\n"
             
-            total_patterns = sum(
-                len(category) for category in model.values()
-            )
-            info += f"Patterns learned: {total_patterns}\n"
+            info += f"Patterns learned: {len(model)}\n"
             
             # Show top patterns by weight
             info += "\nTop patterns (by weight):\n"
-            all_patterns = []
-            for category, patterns in model.items():
-                for pattern, data in patterns.items():
-                    all_patterns.append((category, pattern, data['weight'], data['count']))
+            top = sorted(range(len(model)), key=lambda i: model.weights[i], reverse=True)
+            
+            for i in top[:5]:
+                category, pattern = model.keys[i]
+                info += f"  • {category}.{pattern}: {model.weights[i]:.2f} ({model.counts[i]}×)\n"
             
-            all_patterns.sort(key=lambda x: x[2], reverse=True)
+            history = self.ai_analyzer.history.summary()
+            info += (f"\nAnalysis history: {history['entries']}/{history['capacity']} entries "
+                     f"({history['total']} total)")
+            if history['entries']:
+                info += (f"\nComplexity p50/p95: {history['p50_complexity']:.0f}/"
+                         f"{history['p95_complexity']:.0f}")
             
-            for category, pattern, weight, count in all_patterns[:5]:
-                info += f"  • {category}.{pattern}: {weight:.2f} ({count}×)\n"
+            cache = self.ai_analyzer.ml_analyzer.feature_cache.get_stats()
+            info += (f"\nFeature cache: {cache['hits']} hits, "
+                     f"{cache['misses']} misses")
             
-            history_len = len(self.ai_analyzer.history)
-            info += f"\nAnalysis history: {history_len} entries"
+            classifier = self.ai_analyzer.ml_analyzer.classifier
+            if classifier is not None:
+                info += (f"\nClassifier: {', '.join(classifier.labels)} "
+                         f"({classifier.samples} samples)")
+            else:
+                info += "\nClassifier: not trained (python ai_train.py <corpus>)"
+            
+            store = self.ai_analyzer.ml_analyzer.model_store.get_stats()
+            info += (f"\nModel saves: {store['flushes']} flushes "
+                     f"(avg {store['avg_ms']:.1f} ms, max {store['max_ms']:.1f} ms), "
+                     f"{store['pending']} pending")
+            
+            stored = self.analysis_cache.get_stats()
+            info += (f"\nResult cache: {stored['hits']} hits, "
+                     f"{stored['misses']} misses")
+            
+            blocks = self.incremental_analyzer.get_stats()
+            info += (f"\nBlocks: {blocks['reused']} reused, "
+                     f"{blocks['recomputed']} recomputed")
+            
+            sched = self.analysis_scheduler.get_stats()
+            info += (f"\nAuto-analysis: {sched['requested']} requested, "
+                     f"{sched['coalesced']} coalesced, {sched['executed']} executed")
+            
+            if self.stage_timer.enabled:
+                info += "\n\n⏱ Stage latency (p50/p95/max ms):"
+                for stage, timing in sorted(self.stage_timer.get_stats().items()):
+                    info += (f"\n  {stage:<18} {timing['p50_ms']:7.1f} {timing['p95_ms']:7.1f} "
+                             f"{timing['max_ms']:7.1f}  ({timing['count']}×)")
             
             self.model_info.insert("1.0", info)
         except Exception as e:
@@ -885,8 +1245,11 @@ Patterns Detected: {metrics.get('patterns_detected', 0)}
         
         try:
             # Force analysis to update model weights
-            self.ai_analyzer.ml_analyzer.predict_issues(code)
-            self.ai_analyzer.ml_analyzer.save_model()
+            with self.analysis_worker.lock:
+                self.ai_analyzer.ml_analyzer.predict_issues(code)
+                self.ai_analyzer.ml_analyzer.save_model()
+                # Pick up a classifier trained offline since startup
+                self.ai_analyzer.ml_analyzer.classifier = self.ai_analyzer.ml_analyzer.load_classifier()
             
             self.output_text.insert(tk.END, "\n🧠 ML model trained with current code patterns\n")
             self.update_model_info()
@@ -906,21 +1269,32 @@ Patterns Detected: {metrics.get('patterns_detected', 0)}
         stats_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
         history = self.ai_analyzer.history
-        if not history:
+        summary = history.summary()
+        if not summary['entries']:
             stats_text.insert(tk.END, "No analysis history yet.")
         else:
             stats_text.insert(tk.END, "📊 ANALYSIS HISTORY\n")
             stats_text.insert(tk.END, "="*50 + "\n\n")
             
-            for entry in history[-10:]:  # Show last 10 entries
-                timestamp = entry['timestamp'][11:19]  # Just time
+            # Aggregates are maintained on append; reading them is O(1)
+            trend = summary['suggestion_trend']
+            direction = "rising" if trend > 0.5 else "falling" if trend < -0.5 else "steady"
+            stats_text.insert(tk.END, f"Analyses: {summary['total']} "
+                                      f"(last {summary['entries']} kept)\n")
+            stats_text.insert(tk.END, f"Complexity: mean {summary['mean_complexity']:.1f}, "
+                                      f"p50 {summary['p50_complexity']:.1f}, "
+                                      f"p95 {summary['p95_complexity']:.1f}\n")
+            stats_text.insert(tk.END, f"Suggestions: mean {summary['mean_suggestions']:.1f}, "
+                                      f"recent {summary['recent_suggestions']:.1f} ({direction})\n\n")
+            
+            for entry in history.recent(10):  # Show last 10 entries
+                timestamp = time.strftime('%H:%M:%S', time.localtime(entry['timestamp']))
                 count = entry['suggestion_count']
-                features = entry['features']
                 
                 stats_text.insert(tk.END, f"{timestamp} - {count} suggestions\n")
-                stats_text.insert(tk.END, f"  Lines: {features.get('line_count', 0)}")
-                stats_text.insert(tk.END, f" | Functions: {features.get('function_count', 0)}")
-                stats_text.insert(tk.END, f" | Complexity: {features.get('complexity_score', 0)}\n\n")
+                stats_text.insert(tk.END, f"  Lines: {entry['line_count']}")
+                stats_text.insert(tk.END, f" | Functions: {entry['function_count']}")
+                stats_text.insert(tk.END, f" | Complexity: {entry['complexity_score']:g}\n\n")
         
         stats_text.config(state='disabled')
     
@@ -996,6 +1370,9 @@ Patterns Detected: {metrics.get('patterns_detected', 0)}
     
     def goto_line(self, line_num):
         """Navigate to a specific line in editor"""
+        if self.line_index is not None:
+            line_num = max(1, min(line_num, self.line_index.line_count))
+        
         self.editor.focus_set()
         self.editor.mark_set("insert", f"{line_num}.0")
         self.editor.see(f"{line_num}.0")
@@ -1012,12 +1389,13 @@ Patterns Detected: {metrics.get('patterns_detected', 0)}
             suggestion = self.all_suggestions[index]
             
             if suggestion.get('line') > 0:
-                # Get the line
-                code = self.editor.get("1.0", tk.END)
-                lines = code.split('\n')
+                # Get the line from the revision the suggestion was made for
+                line_index = self.line_index
+                if line_index is None:
+                    line_index = LineIndex(self.editor.get("1.0", tk.END))
                 
-                if suggestion['line'] <= len(lines):
-                    current_line = lines[suggestion['line'] - 1]
+                if suggestion['line'] <= line_index.line_count:
+                    current_line = line_index.line_text(suggestion['line'])
                     messagebox.showinfo("Apply Suggestion",
                                       f"Line {suggestion['line']}:\n{current_line}\n\n"
                                       f"Suggestion: {suggestion['suggestion']}")
@@ -1031,56 +1409,551 @@ Patterns Detected: {metrics.get('patterns_detected', 0)}
         self.recommendation_list.delete(0, tk.END)
         self.recommendation_list.insert(0, "Suggestions cleared")
     
-    def run_code(self):
-        """Execute Python code"""
+    def profile_code(self):
+        """Run the code under cProfile and show where the time went"""
+        self.run_code(profile=True)
+    
+    def memory_profile_code(self):
+        """Run the code under tracemalloc and show which lines allocate"""
+        self.run_code(memory=True)
+    
+    def run_code(self, profile=False, memory=False):
+        """Execute Python code in a child process without blocking the UI"""
+        if self.runner is not None:
+            return  # One run at a time; Stop ends the current one
+        
         code = self.editor.get("1.0", tk.END)
         
-        # Clear output
+        # Clear output; the previous run's spilled log goes too
+        if self.last_output is not None:
+            self.last_output.discard()
+            self.last_output = None
+        self.full_log_button.config(state='disabled')
         self.output_text.delete("1.0", tk.END)
-        self.output_text.insert(tk.END, "🚀 Running code...\n" + "="*50 + "\n\n")
-        self.root.update()
+        if memory:
+            header = "📦 Memory profiling code..."
+            self.editor.tag_remove('memory_hotspot', "1.0", tk.END)
+        else:
+            header = "🔍 Profiling code..." if profile else "🚀 Running code..."
+        self.output_text.insert(tk.END, header + "\n" + "="*50 + "\n\n")
+        self.output_text.mark_set('output_start', 'end-1c')
+        self.output_text.mark_gravity('output_start', tk.LEFT)
+        self.output_truncated = False
+        
+        timeout = self.get_run_timeout()
+        cpu_limit, memory_limit = self.get_run_limits()
+        template = self.warm_pool.acquire() if self.warm_pool is not None else None
+        if template is not None:
+            self.runner = WarmRunner(code, self.warm_pool, template, timeout=timeout,
+                                     cpu_limit=cpu_limit, memory_limit=memory_limit,
+                                     profile=profile, memory_profile=memory).start()
+        else:
+            # Warm start off, still importing, or all templates busy
+            self.runner = ProcessRunner(code, timeout=timeout, cpu_limit=cpu_limit,
+                                        memory_limit=memory_limit, profile=profile,
+                                        memory_profile=memory).start()
+        self.stop_button.config(state='normal')
+        self.root.after(self.run_poll_ms, self.poll_run)
+    
+    def toggle_warm_start(self):
+        """Start or shut down the warm interpreter pool"""
+        if self.warm_start.get():
+            if self.warm_pool is None:
+                self.warm_pool = WarmPool(size=2, preload=self.warm_preload).start()
+        elif self.warm_pool is not None:
+            self.warm_pool.close()
+            self.warm_pool = None
+    
+    def get_run_timeout(self):
+        """Timeout from the toolbar spinbox; falls back to 10 s on bad input"""
+        try:
+            return max(0.0, float(self.run_timeout.get()))
+        except ValueError:
+            return 10.0
+    
+    def get_run_limits(self):
+        """(CPU seconds, memory bytes) from the limit spinboxes; None = no limit"""
+        def read(var):
+            try:
+                return max(0, int(float(var.get())))
+            except ValueError:
+                return 0
+        
+        cpu, memory_mb = read(self.cpu_limit), read(self.memory_limit)
+        return cpu or None, memory_mb * 1024 * 1024 or None
+    
+    def poll_run(self):
+        """Append the output that arrived since the last poll
+        
+        At most output_max_lines lines are inserted per poll and the panel
+        is trimmed back to that many, so a program printing gigabytes costs
+        one bounded widget update every run_poll_ms.
+        """
+        runner = self.runner
+        if runner is None:
+            return
         
+        # Exit first: once it is seen, the output buffer holds everything
+        done = any(stream == 'exit' for stream, _ in runner.drain())
+        chunks, dropped = runner.output.take()
+        chunks, cut = tail_lines(chunks, self.output_max_lines, self.output_max_chars)
+        if dropped or cut:
+            self.output_truncated = True
+            self.output_text.delete('output_start', tk.END)
+        
+        for stream, text in chunks:
+            self.output_text.insert(tk.END, text, (stream,))
+        if chunks:
+            self.trim_output()
+            self.output_text.see(tk.END)
+        
+        if done:
+            self.finish_run(runner)
+        else:
+            self.root.after(self.run_poll_ms, self.poll_run)
+    
+    def trim_output(self):
+        """Drop the oldest output lines beyond output_max_lines"""
+        first = int(self.output_text.index('output_start').split('.')[0])
+        last = int(self.output_text.index('end-1c').split('.')[0])
+        excess = last - first + 1 - self.output_max_lines
+        if excess > 0:
+            self.output_text.delete('output_start', f'output_start + {excess} lines')
+            self.output_truncated = True
+    
+    def finish_run(self, runner):
+        """Write the run summary and re-enable Run"""
+        self.runner = None
+        self.stop_button.config(state='disabled')
+        
+        output = runner.output
+        self.last_output = output
+        if output.spill_path is not None:
+            self.full_log_button.config(state='normal')
+        
+        self.output_text.insert(tk.END, "\n" + "="*50 + "\n")
+        if self.output_truncated:
+            self.output_text.insert(tk.END, f"✂ {output.total_lines:,} lines "
+                                            f"({output.total_chars / 1e6:.1f} MB) of output, "
+                                            f"showing the last {self.output_max_lines:,}; "
+                                            f"📄 Full log has everything\n")
+        if runner.status == 'timeout':
+            self.output_text.insert(tk.END, f"⏰ Timeout: stopped after {runner.timeout:g}s\n")
+        elif runner.status == 'stopped':
+            self.output_text.insert(tk.END, "⏹ Stopped by user\n")
+        elif runner.status == 'cpu_limit':
+            self.output_text.insert(tk.END, f"🛑 CPU limit reached: killed after "
+                                            f"{runner.cpu_limit:g}s of CPU time\n")
+        elif runner.status == 'error':
+            self.output_text.insert(tk.END, "❌ Error: could not start Python\n")
+        elif runner.returncode == 0:
+            self.output_text.insert(tk.END, "✅ Execution successful!\n")
+        else:
+            self.output_text.insert(tk.END, f"⚠️ Exit code: {runner.returncode}\n")
+        
+        usage = runner.usage_summary()
+        self.run_count += 1
+        usage['run'] = self.run_count
+        usage['timestamp'] = time.time()
+        previous = self.run_history[-1] if self.run_history else None
+        self.run_history.append(usage)
+        
+        self.output_text.insert(tk.END, f"⏱ {self.format_run_usage(usage)}\n")
+        if previous is not None and previous['wall_s'] and usage['wall_s'] is not None:
+            change = (usage['wall_s'] / previous['wall_s'] - 1) * 100
+            self.output_text.insert(tk.END, f"   {change:+.0f}% wall time vs run "
+                                            f"#{previous['run']}; 📈 Runs compares all\n")
+        
+        if runner.profile:
+            self.finish_profile(runner)
+        if runner.memory_profile:
+            self.finish_memory_profile(runner)
+        self.output_text.see(tk.END)
+    
+    def finish_profile(self, runner):
+        """Save the run's profile and open the profile panel"""
+        stats = runner.load_profile()
+        if stats is None:
+            self.output_text.insert(tk.END, "🔍 No profile: the run ended before it was written\n")
+            return
         try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-                f.write(code)
-                temp_file = f.name
-            
-            # Run the code
-            result = subprocess.run(
-                ["python", temp_file],
-                capture_output=True,
-                text=True,
-                timeout=10
+            path = save_profile(stats, self.profile_dir, 'profile')
+        except OSError as e:
+            self.output_text.insert(tk.END, f"🔍 Profile not saved: {e}\n")
+            path = None
+        else:
+            self.output_text.insert(tk.END, f"🔍 Profile saved to {path}\n")
+        
+        previous, self.last_profile = self.last_profile, path or self.last_profile
+        self.show_profile(profile_rows(stats), path, previous)
+    
+    def show_profile(self, rows, path, previous=None):
+        """Sortable table of the profiled functions; double-click jumps to
+        the function in the editor"""
+        profile_window = tk.Toplevel(self.root)
+        profile_window.title(f"🔍 Profile - {os.path.basename(path) if path else 'unsaved'}")
+        profile_window.geometry("820x480")
+        
+        bar = tk.Frame(profile_window)
+        bar.pack(fill=tk.X, padx=10, pady=(10, 0))
+        total = max((row['cumulative_s'] for row in rows), default=0.0)
+        tk.Label(bar, text=f"{len(rows)} functions, {total:.3f}s profiled; "
+                           f"click a heading to sort").pack(side=tk.LEFT)
+        if path is not None:
+            tk.Button(bar, text="Compare with...", font=("Arial", 9),
+                      command=lambda: self.compare_profile(path)).pack(side=tk.RIGHT, padx=2)
+            if previous is not None:
+                tk.Button(bar, text="Compare with previous", font=("Arial", 9),
+                          command=lambda: self.show_profile_diff(previous, path)
+                          ).pack(side=tk.RIGHT, padx=2)
+        
+        self.build_profile_table(profile_window, [
+            ('function', "Function", 240, '{}'),
+            ('location', "Location", 150, '{}'),
+            ('calls', "Calls", 80, '{:d}'),
+            ('self_s', "Self (s)", 90, '{:.4f}'),
+            ('cumulative_s', "Cumulative (s)", 110, '{:.4f}'),
+        ], rows, 'cumulative_s')
+    
+    def compare_profile(self, path):
+        """Diff a saved profile (picked in a file dialog) against path"""
+        from tkinter import filedialog
+        
+        other = filedialog.askopenfilename(
+            initialdir=self.profile_dir,
+            filetypes=[("Profiles", "*.prof"), ("All files", "*.*")]
+        )
+        if other:
+            self.show_profile_diff(other, path)
+    
+    def show_profile_diff(self, old_path, new_path):
+        """Per-function time change between two saved profiles"""
+        old_stats, new_stats = load_profile(old_path), load_profile(new_path)
+        if old_stats is None or new_stats is None:
+            messagebox.showerror("Profile", "Could not read both profiles")
+            return
+        rows = diff_profiles(profile_rows(old_stats), profile_rows(new_stats))
+        
+        diff_window = tk.Toplevel(self.root)
+        diff_window.title(f"🔍 {os.path.basename(old_path)} → {os.path.basename(new_path)}")
+        diff_window.geometry("900x480")
+        
+        old_total = max((row['old_cumulative_s'] for row in rows), default=0.0)
+        new_total = max((row['new_cumulative_s'] for row in rows), default=0.0)
+        tk.Label(diff_window, text=f"Total {old_total:.3f}s → {new_total:.3f}s "
+                                   f"({new_total - old_total:+.3f}s)").pack(anchor=tk.W, padx=10,
+                                                                           pady=(10, 0))
+        
+        self.build_profile_table(diff_window, [
+            ('function', "Function", 220, '{}'),
+            ('location', "Location", 130, '{}'),
+            ('old_cumulative_s', "Cum. before", 95, '{:.4f}'),
+            ('new_cumulative_s', "Cum. after", 95, '{:.4f}'),
+            ('delta_cumulative_s', "Δ cum. (s)", 95, '{:+.4f}'),
+            ('delta_self_s', "Δ self (s)", 95, '{:+.4f}'),
+            ('new_calls', "Calls after", 80, '{:d}'),
+        ], rows, None)
+    
+    def build_profile_table(self, window, columns, rows, sort_key, limit=500):
+        """Treeview of rows sorted by sort_key (None: keep the given order);
+        clicking a heading re-sorts, largest first"""
+        frame = tk.Frame(window)
+        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        tree = ttk.Treeview(frame, columns=[key for key, *_ in columns], show='headings')
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True)
+        tree.tag_configure('editor', foreground="#2B6CB0")
+        
+        shown = []
+        
+        def fill(key):
+            if key is not None:
+                numeric = isinstance(rows[0][key], (int, float)) if rows else False
+                ordered = sorted(rows, key=lambda row: abs(row[key]) if numeric else row[key],
+                                 reverse=numeric)
+            else:
+                ordered = rows
+            # Only the top rows; big programs have thousands of functions
+            shown[:] = ordered[:limit]
+            tree.delete(*tree.get_children())
+            for index, row in enumerate(shown):
+                tree.insert('', tk.END, iid=str(index),
+                            values=[template.format(row[key]) for key, _, _, template in columns],
+                            tags=('editor',) if row['editor_line'] else ())
+        
+        for key, heading, width, template in columns:
+            tree.heading(key, text=heading, command=lambda k=key: fill(k))
+            # Text columns left, numbers right
+            tree.column(key, width=width, anchor=tk.W if template == '{}' else tk.E)
+        
+        def jump(event):
+            selection = tree.selection()
+            if selection:
+                line = shown[int(selection[0])]['editor_line']
+                if line:
+                    self.goto_line(line)
+        
+        tree.bind('<Double-1>', jump)
+        fill(sort_key)
+        return tree
+    
+    def finish_memory_profile(self, runner):
+        """Save the run's allocation summary, highlight the heaviest lines and
+        open the memory panel"""
+        data = runner.load_memory_profile()
+        if data is None:
+            self.output_text.insert(tk.END, "📦 No memory profile: the run ended before it was written\n")
+            return
+        end = data['snapshots'][-1]
+        lines, _ = memory_rows(end)
+        self.output_text.insert(tk.END, f"📦 {end['current_bytes'] / 1e6:.2f} MB allocated and live "
+                                        f"at the end, peak {end['peak_bytes'] / 1e6:.2f} MB\n")
+        if lines:
+            self.output_text.insert(tk.END, f"   Heaviest: line {lines[0]['line']} "
+                                            f"({lines[0]['size'] / 1e6:.2f} MB in "
+                                            f"{lines[0]['count']:,} blocks)\n")
+        try:
+            path = save_memory_profile(data, self.profile_dir)
+        except OSError as e:
+            self.output_text.insert(tk.END, f"📦 Memory profile not saved: {e}\n")
+            path = None
+        else:
+            self.output_text.insert(tk.END, f"📦 Memory profile saved to {path}\n")
+        
+        self.highlight_memory_lines(lines)
+        previous, self.last_memory_profile = self.last_memory_profile, path or self.last_memory_profile
+        self.show_memory_profile(data, path, previous)
+    
+    def highlight_memory_lines(self, rows, top=10):
+        """Mark the lines that hold the most memory (at least 1% of it)"""
+        self.editor.tag_remove('memory_hotspot', "1.0", tk.END)
+        total = sum(row['size'] for row in rows)
+        for row in rows[:top]:
+            if row['size'] < total * 0.01:
+                break
+            self.editor.tag_add('memory_hotspot', f"{row['line']}.0", f"{row['line']}.end")
+    
+    def with_source(self, rows):
+        """Add the editor text of each row's line as 'code'"""
+        for row in rows:
+            line = row['editor_line']
+            row['code'] = self.editor.get(f"{line}.0", f"{line}.end").strip() if line else ""
+        return rows
+    
+    def show_memory_profile(self, data, path, previous=None):
+        """Allocation tables of the end snapshot: per editor line (including
+        what library calls on that line allocated) and per allocation site"""
+        snapshots = data['snapshots']
+        end = snapshots[-1]
+        
+        memory_window = tk.Toplevel(self.root)
+        memory_window.title(f"📦 Memory - {os.path.basename(path) if path else 'unsaved'}")
+        memory_window.geometry("820x480")
+        
+        bar = tk.Frame(memory_window)
+        bar.pack(fill=tk.X, padx=10, pady=(10, 0))
+        tk.Label(bar, text=f"{end['current_bytes'] / 1e6:.2f} MB live at the end, "
+                           f"peak {end['peak_bytes'] / 1e6:.2f} MB").pack(side=tk.LEFT)
+        for snapshot in snapshots[:-1]:
+            tk.Button(bar, text=f"Δ {snapshot['label']} → end", font=("Arial", 9),
+                      command=lambda s=snapshot: self.show_memory_diff(
+                          s, end, f"{s['label']} → end")).pack(side=tk.RIGHT, padx=2)
+        if path is not None:
+            tk.Button(bar, text="Compare with...", font=("Arial", 9),
+                      command=lambda: self.compare_memory_profile(end)).pack(side=tk.RIGHT, padx=2)
+            if previous is not None:
+                tk.Button(bar, text="Compare with previous", font=("Arial", 9),
+                          command=lambda: self.compare_memory_profile(end, previous)
+                          ).pack(side=tk.RIGHT, padx=2)
+        
+        lines, sites = memory_rows(end)
+        columns = [
+            ('location', "Line", 150, '{}'),
+            ('code', "Code", 330, '{}'),
+            ('size', "Bytes", 110, '{:,}'),
+            ('count', "Blocks", 90, '{:,}'),
+        ]
+        notebook = ttk.Notebook(memory_window)
+        notebook.pack(fill=tk.BOTH, expand=True)
+        for title, rows in (("Editor lines", lines), ("Allocation sites", sites)):
+            tab = tk.Frame(notebook)
+            notebook.add(tab, text=title)
+            self.build_profile_table(tab, columns, self.with_source(rows), 'size')
+    
+    def compare_memory_profile(self, end, other_path=None):
+        """Diff a saved memory profile's end snapshot against end"""
+        if other_path is None:
+            from tkinter import filedialog
+            other_path = filedialog.askopenfilename(
+                initialdir=self.profile_dir,
+                filetypes=[("Memory profiles", "memory-*.json"), ("All files", "*.*")]
             )
+            if not other_path:
+                return
+        other = load_memory_profile(other_path)
+        if other is None:
+            messagebox.showerror("Memory profile", f"Could not read {other_path}")
+            return
+        self.show_memory_diff(other['snapshots'][-1], end,
+                              f"{os.path.basename(other_path)} → this run")
+    
+    def show_memory_diff(self, old, new, title):
+        """Per-line growth between two snapshots, biggest first"""
+        diff_window = tk.Toplevel(self.root)
+        diff_window.title(f"📦 {title}")
+        diff_window.geometry("860x480")
+        tk.Label(diff_window, text=f"Live {old['current_bytes'] / 1e6:.2f} MB → "
+                                   f"{new['current_bytes'] / 1e6:.2f} MB "
+                                   f"({(new['current_bytes'] - old['current_bytes']) / 1e6:+.2f} MB)"
+                 ).pack(anchor=tk.W, padx=10, pady=(10, 0))
+        
+        columns = [
+            ('location', "Line", 150, '{}'),
+            ('code', "Code", 260, '{}'),
+            ('old_size', "Bytes before", 100, '{:,}'),
+            ('new_size', "Bytes after", 100, '{:,}'),
+            ('delta_size', "Δ bytes", 100, '{:+,}'),
+            ('delta_count', "Δ blocks", 80, '{:+,}'),
+        ]
+        notebook = ttk.Notebook(diff_window)
+        notebook.pack(fill=tk.BOTH, expand=True)
+        for title, (old_rows, new_rows) in (("Editor lines", (memory_rows(old)[0], memory_rows(new)[0])),
+                                            ("Allocation sites", (memory_rows(old)[1], memory_rows(new)[1]))):
+            tab = tk.Frame(notebook)
+            notebook.add(tab, text=title)
+            self.build_profile_table(tab, columns, self.with_source(diff_memory(old_rows, new_rows)),
+                                     None)
+    
+    def format_run_usage(self, usage):
+        """One-line cost of a run; parts the platform can't measure are left out"""
+        parts = [f"wall {usage['wall_s']:.2f}s"] if usage['wall_s'] is not None else []
+        if usage['user_s'] is not None:
+            parts.append(f"CPU {usage['user_s']:.2f}s user + {usage['sys_s']:.2f}s sys")
+        if usage['peak_rss_mb'] is not None:
+            parts.append(f"peak RSS {usage['peak_rss_mb']:.1f} MB")
+            if usage['preload_rss_mb'] is not None:
+                # A warm child starts out with the template's resident set
+                parts[-1] += f" (incl. {usage['preload_rss_mb']:.1f} MB preloaded)"
+        if usage['children'] is not None:
+            parts.append(f"children {usage['children']}")
+        if usage['first_output_s'] is not None:
+            parts.append(f"first output {usage['first_output_s'] * 1000:.0f} ms")
+        parts.append(f"{usage['mode']} start")
+        return " | ".join(parts)
+    
+    def show_run_history(self):
+        """Compare the runs of this session"""
+        history_window = tk.Toplevel(self.root)
+        history_window.title("📈 Run History")
+        history_window.geometry("760x400")
+        
+        history_text = scrolledtext.ScrolledText(history_window,
+                                                 bg="#2D3748", fg="white",
+                                                 font=("Consolas", 10))
+        history_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        if not self.run_history:
+            history_text.insert(tk.END, "No runs yet.")
+        else:
+            def value(number, template):
+                return template.format(number) if number is not None else "-"
             
-            # Display output
-            if result.stdout:
-                self.output_text.insert(tk.END, "📤 OUTPUT:\n")
-                self.output_text.insert(tk.END, result.stdout)
-                self.output_text.insert(tk.END, "\n")
-            
-            if result.stderr:
-                self.output_text.insert(tk.END, "❌ ERRORS:\n")
-                self.output_text.insert(tk.END, result.stderr)
-                self.output_text.insert(tk.END, "\n")
+            history_text.insert(tk.END, f"{'#':>4} {'time':<8} {'mode':<5} {'status':<10} "
+                                        f"{'wall s':>8} {'user s':>8} {'sys s':>8} "
+                                        f"{'RSS MB':>8} {'kids':>5} {'limits':<12}\n")
+            history_text.insert(tk.END, "-" * 86 + "\n")
+            for usage in reversed(self.run_history):
+                rss = value(usage['peak_rss_mb'], '{:.1f}')
+                if usage['preload_rss_mb'] is not None and usage['peak_rss_mb'] is not None:
+                    rss += "*"
+                limits = []
+                if usage['cpu_limit']:
+                    limits.append(f"{usage['cpu_limit']:g}s")
+                if usage['memory_limit']:
+                    limits.append(f"{usage['memory_limit'] // (1024 * 1024)}MB")
+                status = usage['status'] if usage['status'] != 'finished' else \
+                    f"exit {usage['returncode']}"
+                history_text.insert(tk.END,
+                    f"{usage['run']:>4} "
+                    f"{time.strftime('%H:%M:%S', time.localtime(usage['timestamp'])):<8} "
+                    f"{usage['mode']:<5} {status:<10} "
+                    f"{value(usage['wall_s'], '{:.3f}'):>8} {value(usage['user_s'], '{:.3f}'):>8} "
+                    f"{value(usage['sys_s'], '{:.3f}'):>8} {rss:>8} "
+                    f"{value(usage['children'], '{}'):>5} {'/'.join(limits) or '-':<12}\n")
             
-            self.output_text.insert(tk.END, "="*50 + "\n")
+            if any(usage['preload_rss_mb'] is not None for usage in self.run_history):
+                history_text.insert(tk.END, "\n* warm run: includes the template's preloaded modules\n")
             
-            if result.returncode == 0:
-                self.output_text.insert(tk.END, "✅ Execution successful!\n")
-            else:
-                self.output_text.insert(tk.END, f"⚠️ Exit code: {result.returncode}\n")
-                
-        except subprocess.TimeoutExpired:
-            self.output_text.insert(tk.END, "⏰ Timeout: Code took too long to execute\n")
-        except Exception as e:
-            self.output_text.insert(tk.END, f"❌ Error: {str(e)}\n")
-        finally:
-            try:
-                os.unlink(temp_file)
-            except:
-                pass
+            walls = [usage['wall_s'] for usage in self.run_history if usage['wall_s'] is not None]
+            if walls:
+                history_text.insert(tk.END, f"\nWall time: best {min(walls):.3f}s, "
+                                            f"worst {max(walls):.3f}s over {len(walls)} runs\n")
+        
+        history_text.config(state='disabled')
+    
+    def open_full_log(self):
+        """Page through the last run's complete output"""
+        output = self.last_output
+        if output is None or output.spill_path is None:
+            return
+        try:
+            reader = SpillReader(output.spill_path)
+        except OSError as e:
+            messagebox.showerror("Full log", f"Log is no longer available:\n{e}")
+            return
+        
+        log_window = tk.Toplevel(self.root)
+        log_window.title(f"📄 Full log ({output.total_lines:,} lines)")
+        log_window.geometry("800x600")
+        
+        nav = tk.Frame(log_window)
+        nav.pack(fill=tk.X, padx=10, pady=(10, 0))
+        log_text = scrolledtext.ScrolledText(log_window, bg="black", fg="#00FF00",
+                                             font=("Consolas", 10))
+        log_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        page_label = tk.Label(nav)
+        current = [0]
+        
+        def show(number):
+            # Pages are read on demand; only the one on screen is in memory
+            current[0], text = reader.page(number)
+            total = f"{len(reader.offsets)}" if reader.complete else f"{len(reader.offsets)}+"
+            page_label.config(text=f"Page {current[0] + 1} of {total}")
+            log_text.config(state='normal')
+            log_text.delete("1.0", tk.END)
+            log_text.insert(tk.END, text)
+            log_text.config(state='disabled')
+        
+        for text, target in (("⏮ First", lambda: 0),
+                             ("◀ Prev", lambda: current[0] - 1),
+                             ("Next ▶", lambda: current[0] + 1),
+                             ("Last ⏭", lambda: reader.page_count() - 1)):
+            tk.Button(nav, text=text, command=lambda t=target: show(t()),
+                      font=("Arial", 9)).pack(side=tk.LEFT, padx=2)
+        page_label.pack(side=tk.LEFT, padx=10)
+        show(0)
+    
+    def stop_code(self):
+        """Kill the running program and everything it started"""
+        if self.runner is not None:
+            self.runner.stop()
+    
+    def on_close(self):
+        """Don't leave a running program behind when the window closes"""
+        self.stop_code()
+        if self.file_loader is not None:
+            self.file_loader.cancel()
+        if self.runner is not None:
+            self.runner.output.discard()
+        if self.last_output is not None:
+            self.last_output.discard()
+        if self.warm_pool is not None:
+            self.warm_pool.close()
+        self.analysis_worker.stop()
+        self.analysis_cache.close()
+        self.root.destroy()
     
     def save_file(self):
         """Save current code to file"""
@@ -1107,49 +1980,112 @@ Patterns Detected: {metrics.get('patterns_detected', 0)}
         )
         
         if filepath:
+            if self.file_loader is not None:
+                self.file_loader.cancel()
+                self.finish_large_file(None)
+            try:
+                size = os.path.getsize(filepath)
+            except OSError as e:
+                messagebox.showerror("Open", f"Could not open {filepath}:\n{e}")
+                return
+            if size >= self.large_file_bytes:
+                self.open_large_file(filepath, size)
+                return
+            
+            self.large_file = False
             with open(filepath, 'r') as f:
                 self.editor.delete("1.0", tk.END)
                 self.editor.insert("1.0", f.read())
             
-            self.update_line_numbers()
             self.root.title(f"AI Python Editor with ML - {os.path.basename(filepath)}")
+            
+            # Show cached results straight away; analyze only unseen content
+            self.on_editor_modified()
+            code = self.editor.get("1.0", tk.END)
+            key = FeatureCache.key_for(code)
+            cached = self.analysis_cache.get(code, self.incremental_analyzer.fingerprint(), key)
+            if cached is not None:
+                self.on_analysis_result(self.buffer_revision, cached[0], cached[1], LineIndex(code))
+            else:
+                self.pending_cache_store = (self.buffer_revision, code, key)
+                self.analyze_with_ai()
+    
+    def open_large_file(self, filepath, size):
+        """Load a big file in chunks with a progress bar; analysis waits for 🤖 Analyze"""
+        loader = ChunkedFileLoader(self.root, self.editor, filepath,
+                                   lambda fraction: self.load_progress.configure(value=fraction),
+                                   lambda: self.finish_large_file(filepath))
+        try:
+            loader.start()
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Open", f"Could not open {filepath}:\n{e}")
+            return
+        
+        self.file_loader = loader
+        self.large_file = True
+        self.analysis_scheduler.cancel()
+        self.clear_suggestions()
+        self.load_progress.configure(value=0)
+        self.load_progress.pack(side=tk.LEFT, padx=10)
+        self.root.title(f"AI Python Editor with ML - {os.path.basename(filepath)} (loading...)")
+        self.output_text.insert(tk.END, f"\n📂 Loading {os.path.basename(filepath)} "
+                                        f"({size / 1e6:.1f} MB) in chunks\n")
+    
+    def finish_large_file(self, filepath):
+        """The chunked load ended (filepath None: cancelled)"""
+        self.file_loader = None
+        self.load_progress.pack_forget()
+        if filepath is None:
+            return
+        lines = int(self.editor.index("end-1c").split('.')[0])
+        self.root.title(f"AI Python Editor with ML - {os.path.basename(filepath)}")
+        self.output_text.insert(tk.END, f"📂 Loaded {lines:,} lines. Automatic analysis is off "
+                                        f"for files over {self.large_file_bytes / 1e6:.1f} MB; "
+                                        f"🤖 Analyze runs it in the background\n")
+        self.output_text.see(tk.END)
     
     def clear_editor(self):
         """Clear editor content"""
         if messagebox.askyesno("Clear", "Clear all code?"):
+            self.large_file = False
             self.editor.delete("1.0", tk.END)
             self.output_text.delete("1.0", tk.END)
-            self.update_line_numbers()
             self.clear_suggestions()
             self.metrics_text.config(state='normal')
             self.metrics_text.delete("1.0", tk.END)
             self.metrics_text.config(state='disabled')
     
     def update_line_numbers(self):
-        """Update line numbers display"""
-        lines = self.editor.get("1.0", tk.END).count("\n")
-        
-        self.line_numbers.config(state='normal')
-        self.line_numbers.delete("1.0", tk.END)
-        
-        for i in range(1, lines + 1):
-            self.line_numbers.insert(tk.END, f"{i}\n")
-        
-        self.line_numbers.config(state='disabled')
+        """Redraw the line number gutter now (edits and scrolling schedule it)"""
+        self.line_numbers.redraw()
+    
+    def on_editor_scroll(self, *fractions):
+        """The editor's view moved or resized: follow with the gutter and highlighting"""
+        if fractions:
+            self.editor.vbar.set(*fractions)
+        self.line_numbers.schedule()
+        self.highlighter.schedule()
+    
+    def on_editor_modified(self, event=None):
+        """Bump the buffer revision whenever the text actually changes"""
+        if not self.editor.edit_modified():
+            return  # Triggered by our own reset below
+        self.buffer_revision += 1
+        self.editor.edit_modified(False)
     
     def on_editor_change(self, event=None):
         """Handle editor changes"""
-        self.update_line_numbers()
-        
-        # Auto-analyze if enabled
-        if self.auto_analyze.get():
-            code = self.editor.get("1.0", tk.END)
-            if len(code.strip()) > 10:  # Only if there's actual code
-                self.root.after(1000, self.analyze_with_ai)  # Delay 1 second
+        # Auto-analyze if enabled (large files only on request)
+        if self.auto_analyze.get() and not self.large_file:
+            # Only if there's actual code; compare the index rather than copy
+            # the buffer on every key, the scheduled analysis reads it once
+            if self.editor.compare("end-1c", ">", "1.10"):
+                self.analysis_scheduler.request()  # Debounced, coalesced per buffer
 
 def main():
     root = tk.Tk()
     editor = AIPythonEditorWithML(root)
+    root.protocol("WM_DELETE_WINDOW", editor.on_close)
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,2440 @@
+# ai_analyzer.py
+"""
+Analysis engine for the AI Python Editor: rule engine, AST metrics, ML
+pattern model and its write-behind store, the trained feature classifier,
+the combined analyzer, incremental re-analysis, one-pass streaming
+analysis of large files and the persistent result cache.
+
+Has no GUI dependencies, so it can be used headless (see ai_batch.py).
+"""
+import re
+import ast
+import hashlib
+import os
+import json
+import sqlite3
+import tempfile
+import threading
+import time
+import tokenize
+import atexit
+import functools
+import weakref
+import heapq
+import numpy as np
+import pickle
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, OrderedDict, deque
+from itertools import accumulate
+
+try:
+    import fcntl  # POSIX file locking
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt  # Windows file locking
+except ImportError:
+    msvcrt = None
+
+# Bump when a change to the analysis code alters its results, so persisted
+# cache entries from older versions are not reused
+ANALYSIS_VERSION = 2
+
+# ========================================================
+# COMPILED RULE ENGINE
+# ========================================================
+
+class RuleEngine:
+    """Multi-pattern engine that scans the text once for every rule
+    
+    Each rule is anchored on a trigger (a literal prefix or a short regex)
+    that must match where the rule starts. All triggers are combined into
+    one lookahead so the text is walked once; at each candidate position
+    only the rules whose trigger can start with that character are tried.
+    Per-rule results match running ``finditer`` for each rule, except that
+    assignment-shaped rules no longer match starting mid-identifier.
+    """
+    
+    REGEX_META = set('.^$*+?{}[]|()')
+    
+    # Rules shaped like "name = ..." are anchored at the start of the identifier
+    ASSIGNMENT_PREFIX = re.compile(r'\(?\\w\+\)?\\s\*=')
+    ASSIGNMENT_TRIGGER = r'(?<!\w)\w+\s*='
+    
+    def __init__(self):
+        self.rules = []  # [{'pattern', 'trigger', 'first_chars'}]
+        self.names = {}  # rule name -> index into self.rules
+        self.by_key = {}  # (pattern, flags) -> index, so duplicates share a scan
+        self._compiled = False
+    
+    def add_rule(self, name, pattern, flags=0, trigger=None):
+        """Register a rule; identical patterns are deduplicated"""
+        key = (pattern, flags)
+        
+        if key not in self.by_key:
+            if trigger is None and self.ASSIGNMENT_PREFIX.match(pattern):
+                trigger = self.ASSIGNMENT_TRIGGER
+            
+            if trigger is None:
+                trigger = self.literal_prefix(pattern)
+                trigger_regex = re.escape(trigger) if trigger else None
+                first_chars = {trigger[0]} if trigger else None
+            else:
+                trigger_regex = trigger
+                first_chars = None  # Regex triggers must start at a word character
+            
+            if first_chars and flags & re.IGNORECASE:
+                first_chars = {c for ch in first_chars for c in (ch.lower(), ch.upper())}
+            if trigger_regex and flags & re.IGNORECASE:
+                trigger_regex = f'(?i:{trigger_regex})'
+            
+            self.by_key[key] = len(self.rules)
+            self.rules.append({
+                'pattern': re.compile(pattern, flags),
+                'trigger': trigger_regex,
+                'first_chars': first_chars
+            })
+            self._compiled = False
+        
+        index = self.by_key[key]
+        self.names[name] = index
+        return index
+    
+    @classmethod
+    def literal_prefix(cls, pattern):
+        """Return the literal text every match of pattern must start with"""
+        # Top-level alternation means there is no common prefix
+        depth = 0
+        escaped = False
+        for ch in pattern:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '(':
+                depth += 1
+            elif ch == ')':
+                depth -= 1
+            elif ch == '|' and depth == 0:
+                return ''
+        
+        prefix = []
+        i = 0
+        while i < len(pattern):
+            ch = pattern[i]
+            if ch == '\\' and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+                prefix.append(pattern[i + 1])
+                i += 2
+            elif ch == '\\' or ch in cls.REGEX_META:
+                break
+            else:
+                prefix.append(ch)
+                i += 1
+        
+        # A quantifier right after the prefix makes its last character optional
+        if prefix and i < len(pattern) and pattern[i] in '*?{':
+            prefix.pop()
+        return ''.join(prefix)
+    
+    def _compile(self):
+        """Build the combined trigger regex and per-character dispatch tables"""
+        triggers = list(dict.fromkeys(r['trigger'] for r in self.rules if r['trigger']))
+        self.trigger_regex = re.compile('(?=' + '|'.join(triggers) + ')') if triggers else None
+        
+        self.by_char = {}
+        self.word_rules = []
+        self.fallback_rules = []
+        for index, rule in enumerate(self.rules):
+            if not rule['trigger']:
+                self.fallback_rules.append(index)
+            elif rule['first_chars'] is None:
+                self.word_rules.append(index)
+            else:
+                for ch in rule['first_chars']:
+                    self.by_char.setdefault(ch, []).append(index)
+        
+        self.dispatch_cache = {}
+        self._compiled = True
+    
+    def _rules_for_char(self, ch):
+        """Rules that can start at a position holding ch"""
+        rules = self.dispatch_cache.get(ch)
+        if rules is None:
+            rules = list(self.by_char.get(ch, []))
+            if ch.isalnum() or ch == '_':
+                rules.extend(self.word_rules)
+            rules = self.dispatch_cache[ch] = tuple(rules)
+        return rules
+    
+    def scan(self, code):
+        """Scan code once and return {rule name: [match, ...]}"""
+        if not self._compiled:
+            self._compile()
+        
+        found = [[] for _ in self.rules]
+        next_pos = [0] * len(self.rules)
+        rules = self.rules
+        
+        if self.trigger_regex is not None:
+            for candidate in self.trigger_regex.finditer(code):
+                pos = candidate.start()
+                for index in self._rules_for_char(code[pos]):
+                    if pos < next_pos[index]:
+                        continue  # Inside this rule's previous match
+                    match = rules[index]['pattern'].match(code, pos)
+                    if match:
+                        found[index].append(match)
+                        next_pos[index] = max(match.end(), pos + 1)
+        
+        # Rules without any usable anchor still get their own pass
+        for index in self.fallback_rules:
+            found[index] = list(rules[index]['pattern'].finditer(code))
+        
+        return {name: found[index] for name, index in self.names.items()}
+
+class LineIndex:
+    """Line-start offsets of one revision for O(log n) offset-to-line lookups"""
+    
+    def __init__(self, code):
+        self.lines = code.split('\n')
+        self._starts = None
+    
+    @property
+    def starts(self):
+        """Offset of each line start, built on first lookup"""
+        if self._starts is None:
+            self._starts = [0]
+            self._starts.extend(accumulate(len(line) + 1 for line in self.lines[:-1]))
+        return self._starts
+    
+    @property
+    def line_count(self):
+        return len(self.lines)
+    
+    def line_of(self, offset):
+        """1-based line number containing a character offset"""
+        return bisect_right(self.starts, offset)
+    
+    def line_text(self, line_num):
+        """Text of a 1-based line, or '' when out of range"""
+        if 1 <= line_num <= len(self.lines):
+            return self.lines[line_num - 1]
+        return ''
+
+# ========================================================
+# AST METRICS
+# ========================================================
+
+class ASTMetricsVisitor(ast.NodeVisitor):
+    """Single AST walk collecting complexity, nesting and function spans"""
+    
+    # Statements that open an indented block
+    BLOCK_NODES = tuple(getattr(ast, name) for name in (
+        'For', 'AsyncFor', 'While', 'With', 'AsyncWith', 'Try', 'TryStar', 'Match'
+    ) if hasattr(ast, name))
+    
+    # Each adds one independent path (McCabe)
+    DECISION_NODES = tuple(getattr(ast, name) for name in (
+        'IfExp', 'For', 'AsyncFor', 'While', 'ExceptHandler', 'Assert', 'match_case'
+    ) if hasattr(ast, name))
+    
+    def __init__(self):
+        self.functions = []
+        self.class_count = 0
+        self.module_complexity = 0
+        self.max_depth = 0
+        self._depth = 0
+        self._function_stack = []
+    
+    def _add_complexity(self, amount):
+        if self._function_stack:
+            self._function_stack[-1]['complexity'] += amount
+        else:
+            self.module_complexity += amount
+    
+    def _visit_body(self, nodes):
+        """Visit statements one block level deeper"""
+        self._depth += 1
+        self.max_depth = max(self.max_depth, self._depth)
+        if self._function_stack:
+            record = self._function_stack[-1]
+            record['nesting'] = max(record['nesting'], self._depth - record['depth'])
+        
+        for child in nodes:
+            self.visit(child)
+        self._depth -= 1
+    
+    def visit_FunctionDef(self, node):
+        record = {
+            'name': node.name,
+            'line': node.lineno,
+            'end_line': node.end_lineno,
+            'length': node.end_lineno - node.lineno + 1,
+            'complexity': 1,
+            'nesting': 0,
+            'depth': self._depth + 1  # Depth of the function body
+        }
+        self.functions.append(record)
+        
+        for child in node.decorator_list + [node.args]:
+            self.visit(child)
+        
+        self._function_stack.append(record)
+        self._visit_body(node.body)
+        self._function_stack.pop()
+    
+    visit_AsyncFunctionDef = visit_FunctionDef
+    
+    def visit_ClassDef(self, node):
+        self.class_count += 1
+        for child in node.decorator_list + node.bases + node.keywords:
+            self.visit(child)
+        self._visit_body(node.body)
+    
+    def visit_If(self, node):
+        self._add_complexity(1)
+        self.visit(node.test)
+        self._visit_body(node.body)
+        
+        orelse = node.orelse
+        if len(orelse) == 1 and isinstance(orelse[0], ast.If) and orelse[0].col_offset == node.col_offset:
+            self.visit(orelse[0])  # elif stays at this level
+        elif orelse:
+            self._visit_body(orelse)
+    
+    def visit_BoolOp(self, node):
+        self._add_complexity(len(node.values) - 1)
+        self.generic_visit(node)
+    
+    def visit_comprehension(self, node):
+        self._add_complexity(1 + len(node.ifs))
+        self.generic_visit(node)
+    
+    def generic_visit(self, node):
+        if isinstance(node, self.DECISION_NODES):
+            self._add_complexity(1)
+        
+        if not isinstance(node, self.BLOCK_NODES):
+            super().generic_visit(node)
+            return
+        
+        # Block statement: headers at this level, bodies one deeper
+        for field, value in ast.iter_fields(node):
+            if field in ('body', 'orelse', 'finalbody', 'handlers', 'cases') and isinstance(value, list):
+                if value:
+                    self._visit_body(value)
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        self.visit(item)
+            elif isinstance(value, ast.AST):
+                self.visit(value)
+
+def collect_ast_metrics(code):
+    """Parse code once and return its AST metrics, or None if it doesn't parse"""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+    
+    visitor = ASTMetricsVisitor()
+    visitor.visit(tree)
+    functions = visitor.functions
+    
+    return {
+        'functions': functions,
+        'function_count': len(functions),
+        'class_count': visitor.class_count,
+        'complexity_score': visitor.module_complexity + sum(f['complexity'] for f in functions),
+        'max_function_complexity': max((f['complexity'] for f in functions), default=0),
+        'max_function_length': max((f['length'] for f in functions), default=0),
+        'nesting_depth': visitor.max_depth
+    }
+
+def heuristic_function_spans(lines):
+    """(start line, length) of each def, for buffers that don't parse"""
+    spans = []
+    function_start = -1
+    for i, line in enumerate(lines):
+        if line.strip().startswith('def '):
+            if function_start != -1:
+                spans.append((function_start + 1, i - function_start))
+            function_start = i
+    
+    if function_start != -1:
+        spans.append((function_start + 1, len(lines) - function_start))
+    return spans
+
+# ========================================================
+# ARRAY-BACKED PATTERN MODEL
+# ========================================================
+
+class PatternModel:
+    """Pattern weights and counts as NumPy vectors plus a pattern index
+    
+    keys[i] is the (category, pattern) pair behind weights[i] and counts[i].
+    Scoring and weight updates take a (documents x patterns) presence
+    matrix, so a batch of files is handled with a few array operations.
+    The pickle on disk keeps the original nested-dict layout
+    ({category: {pattern: {'weight', 'count'}}}), which from_dict/to_dict
+    convert.
+    """
+    
+    CONFIDENCE_BOOST = 1.5
+    MAX_CONFIDENCE = 0.95
+    
+    def __init__(self, keys=(), weights=(), counts=()):
+        self.keys = list(keys)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.patterns = [pattern for category, pattern in self.keys]
+        self.weights = np.array(weights, dtype=np.float64).reshape(len(self.keys))
+        self.counts = np.array(counts, dtype=np.int64).reshape(len(self.keys))
+    
+    @classmethod
+    def from_dict(cls, model):
+        """Build from the nested-dict model (the original pickle format)"""
+        keys, weights, counts = [], [], []
+        for category, patterns in model.items():
+            for pattern, data in patterns.items():
+                keys.append((category, pattern))
+                weights.append(data['weight'])
+                counts.append(data['count'])
+        return cls(keys, weights, counts)
+    
+    def to_dict(self):
+        """Nested-dict copy in the pickle format"""
+        model = {}
+        for (category, pattern), weight, count in zip(self.keys, self.weights.tolist(),
+                                                     self.counts.tolist()):
+            model.setdefault(category, {})[pattern] = {'weight': weight, 'count': count}
+        return model
+    
+    def copy(self):
+        return PatternModel(self.keys, self.weights, self.counts)
+    
+    def assign(self, other):
+        """Replace this model's contents with other's, in place"""
+        self.keys = list(other.keys)
+        self.index = dict(other.index)
+        self.patterns = list(other.patterns)
+        self.weights = other.weights.copy()
+        self.counts = other.counts.copy()
+    
+    def add(self, category, pattern, weight, count=0):
+        """Append a pattern; returns its index"""
+        key = (category, pattern)
+        if key in self.index:
+            return self.index[key]
+        self.index[key] = len(self.keys)
+        self.keys.append(key)
+        self.patterns.append(pattern)
+        self.weights = np.append(self.weights, float(weight))
+        self.counts = np.append(self.counts, int(count))
+        return self.index[key]
+    
+    def __len__(self):
+        return len(self.keys)
+    
+    def items(self):
+        """(category, {pattern: {'weight', 'count'}}) pairs, for display code"""
+        return self.to_dict().items()
+    
+    def confidences(self):
+        """Per-pattern confidence when a pattern is present"""
+        return np.minimum(self.weights * self.CONFIDENCE_BOOST, self.MAX_CONFIDENCE)
+    
+    def score(self, presence):
+        """Confidence matrix for a (documents x patterns) presence matrix; 0 where absent"""
+        presence = np.atleast_2d(np.asarray(presence, dtype=bool))
+        return np.where(presence, self.confidences(), 0.0)
+    
+    def update(self, presence, learning_rate):
+        """Apply a batch of weight updates; returns (weight deltas, count deltas)
+        
+        Each present pattern moves its weight towards its confidence,
+        w += learning_rate * (confidence - w), once per document. With the
+        confidence taken at the start of the batch, k such steps collapse to
+        w += (1 - (1 - learning_rate) ** k) * (c - w), so the whole batch is
+        one vector expression. For a single document this is exactly the
+        per-prediction update.
+        """
+        presence = np.atleast_2d(np.asarray(presence, dtype=bool))
+        hits = presence.sum(axis=0, dtype=np.int64)
+        # Use learning_rate itself for k == 1 so single updates round identically
+        step = np.where(hits == 1, learning_rate, 1.0 - (1.0 - learning_rate) ** hits)
+        updated = self.weights + step * (self.confidences() - self.weights)
+        
+        deltas = updated - self.weights
+        self.weights = updated
+        self.counts += hits
+        return deltas, hits
+
+# ========================================================
+# MODEL STORE
+# ========================================================
+
+class ModelStore:
+    """Write-behind, atomic persistence for the pattern model
+    
+    Weight updates to a PatternModel are recorded as per-pattern deltas and written out at
+    most once per flush_interval (and on exit) instead of on every analysis.
+    A flush takes an exclusive lock on a sidecar .lock file, re-reads the
+    model on disk, adds our pending deltas to it and writes the result to a
+    temp file that is renamed over the original. Concurrent editors
+    therefore merge their updates instead of overwriting each other, and a
+    crash mid-write never leaves a truncated model behind.
+    """
+    
+    def __init__(self, path="code_patterns_model.pkl", flush_interval=30.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.deltas = {}  # (category, pattern) -> [weight delta, count delta]
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self.stats = {'flushes': 0, 'failed': 0, 'merged': 0,
+                      'last_ms': 0.0, 'max_ms': 0.0, 'total_ms': 0.0}
+    
+    def load(self):
+        """Return the model on disk as a PatternModel, or None if missing or unreadable"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                return PatternModel.from_dict(pickle.load(f))
+        except Exception:
+            return None
+    
+    def record(self, category, pattern, weight_delta, count_delta=1):
+        """Queue a weight/count change for the next flush"""
+        with self.lock:
+            delta = self.deltas.setdefault((category, pattern), [0.0, 0])
+            delta[0] += weight_delta
+            delta[1] += count_delta
+    
+    def record_many(self, model, weight_deltas, count_deltas):
+        """Queue the vector deltas returned by PatternModel.update"""
+        with self.lock:
+            for i in np.flatnonzero(count_deltas):
+                delta = self.deltas.setdefault(model.keys[i], [0.0, 0])
+                delta[0] += float(weight_deltas[i])
+                delta[1] += int(count_deltas[i])
+    
+    @property
+    def dirty(self):
+        return bool(self.deltas)
+    
+    def maybe_flush(self, model):
+        """Flush if there are pending deltas and the interval has elapsed"""
+        if self.deltas and time.monotonic() - self.last_flush >= self.flush_interval:
+            return self.flush(model)
+        return False
+    
+    def flush(self, model):
+        """Merge pending deltas into the file on disk and refresh model in place"""
+        start = time.perf_counter()
+        with self.lock:
+            deltas, self.deltas = self.deltas, {}
+            try:
+                with self._file_lock():
+                    merged = self._merge(self.load(), model, deltas)
+                    self._atomic_write(merged)
+            except OSError:
+                # Keep the deltas for the next attempt
+                for key, (weight, count) in deltas.items():
+                    delta = self.deltas.setdefault(key, [0.0, 0])
+                    delta[0] += weight
+                    delta[1] += count
+                self.stats['failed'] += 1
+                return False
+            
+            # Pick up what other writers saved since we last looked
+            model.assign(merged)
+            
+            self.last_flush = time.monotonic()
+            elapsed = (time.perf_counter() - start) * 1000
+            self.stats['flushes'] += 1
+            self.stats['merged'] += len(deltas)
+            self.stats['last_ms'] = elapsed
+            self.stats['max_ms'] = max(self.stats['max_ms'], elapsed)
+            self.stats['total_ms'] += elapsed
+            return True
+    
+    @staticmethod
+    def _merge(on_disk, model, deltas):
+        """Apply deltas to the on-disk model; patterns it lacks come from ours"""
+        if on_disk is None:
+            return model.copy()
+        
+        merged = on_disk
+        for (category, pattern), weight, count in zip(model.keys, model.weights, model.counts):
+            if (category, pattern) not in merged.index:
+                merged.add(category, pattern, weight, count)
+        
+        for key, (weight_delta, count_delta) in deltas.items():
+            i = merged.index.get(key)
+            if i is not None:
+                merged.weights[i] = min(max(merged.weights[i] + weight_delta, 0.0), 1.0)
+                merged.counts[i] += count_delta
+        return merged
+    
+    def _atomic_write(self, model):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(prefix='.model-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(model.to_dict(), f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    
+    def _file_lock(self):
+        return _LockFile(self.path + '.lock')
+    
+    def get_stats(self):
+        """Return flush counts and latency in milliseconds"""
+        stats = dict(self.stats)
+        stats['pending'] = len(self.deltas)
+        stats['avg_ms'] = stats['total_ms'] / stats['flushes'] if stats['flushes'] else 0.0
+        return stats
+
+
+class _LockFile:
+    """Exclusive inter-process lock held for the duration of a with block"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+    
+    def __enter__(self):
+        self.file = open(self.path, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+    
+    def __exit__(self, *exc):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.file.close()
+        return False
+
+# ========================================================
+# FEATURE CLASSIFIER
+# ========================================================
+
+class FeatureClassifier:
+    """Multi-label logistic regression over extract_features vectors
+    
+    One-vs-rest, fitted by mini-batch SGD through partial_fit so a corpus
+    can be streamed in chunks (see ai_train.py). Inputs are log1p-scaled,
+    then standardized with running mean/variance updated on every chunk.
+    save() writes each array as a .npy file in a directory; load() maps
+    them read-only, so opening a model costs no parsing and no copies.
+    """
+    
+    FORMAT_VERSION = 1
+    ARRAYS = ('coef', 'intercept', 'mean', 'm2')
+    
+    def __init__(self, feature_names, labels=(), learning_rate=0.1, l2=1e-4, batch_size=256):
+        self.feature_names = list(feature_names)
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.batch_size = batch_size
+        self.samples = 0  # Rows seen by the running statistics
+        
+        n_features = len(self.feature_names)
+        self.labels = []
+        self.coef = np.zeros((0, n_features))
+        self.intercept = np.zeros(0)
+        self.mean = np.zeros(n_features)
+        self.m2 = np.zeros(n_features)
+        self.add_labels(labels)
+    
+    def add_labels(self, labels):
+        """Add output labels not seen before; new rows start at zero"""
+        new = [label for label in dict.fromkeys(labels) if label not in self.labels]
+        if new:
+            self.labels.extend(new)
+            self.coef = np.vstack([self.coef, np.zeros((len(new), len(self.feature_names)))])
+            self.intercept = np.concatenate([self.intercept, np.zeros(len(new))])
+    
+    def _prepare(self, X):
+        """log1p-scale and standardize a raw feature matrix"""
+        Z = np.log1p(np.maximum(np.asarray(X, dtype=np.float64), 0.0))
+        if self.samples < 2:
+            return Z - self.mean
+        scale = np.sqrt(self.m2 / self.samples)
+        scale[scale == 0] = 1.0
+        return (Z - self.mean) / scale
+    
+    def _update_stats(self, X):
+        """Fold a chunk into the running mean/variance (Chan et al.)"""
+        Z = np.log1p(np.maximum(np.asarray(X, dtype=np.float64), 0.0))
+        n = len(Z)
+        batch_mean = Z.mean(axis=0)
+        batch_m2 = ((Z - batch_mean) ** 2).sum(axis=0)
+        total = self.samples + n
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * n / total
+        self.m2 = self.m2 + batch_m2 + delta ** 2 * self.samples * n / total
+        self.samples = total
+    
+    def indicator(self, y):
+        """(rows x labels) 0/1 matrix for a list of label collections"""
+        Y = np.zeros((len(y), len(self.labels)))
+        column = {label: i for i, label in enumerate(self.labels)}
+        for row, labels in enumerate(y):
+            for label in labels:
+                Y[row, column[label]] = 1.0
+        return Y
+    
+    def partial_fit(self, X, y):
+        """One SGD pass over a chunk; y holds each row's collection of labels"""
+        X = np.asarray(X, dtype=np.float64)
+        if not len(X):
+            return self
+        self.add_labels(label for labels in y for label in labels)
+        
+        # Loaded arrays are read-only maps; train on private copies
+        self.coef = np.array(self.coef)
+        self.intercept = np.array(self.intercept)
+        
+        self._update_stats(X)
+        Z = self._prepare(X)
+        Y = self.indicator(y)
+        
+        for start in range(0, len(Z), self.batch_size):
+            Zb = Z[start:start + self.batch_size]
+            error = self._sigmoid(Zb @ self.coef.T + self.intercept) - Y[start:start + self.batch_size]
+            self.coef -= self.learning_rate * (error.T @ Zb / len(Zb) + self.l2 * self.coef)
+            self.intercept -= self.learning_rate * error.mean(axis=0)
+        return self
+    
+    @staticmethod
+    def _sigmoid(z):
+        return 0.5 * (1.0 + np.tanh(0.5 * z))  # Overflow-free logistic
+    
+    def predict_proba(self, X):
+        """(rows x labels) matrix of label probabilities"""
+        return self._sigmoid(self._prepare(X) @ self.coef.T + self.intercept)
+    
+    def predict(self, X, threshold=0.5):
+        """Labels whose probability reaches threshold, per row"""
+        return [[self.labels[i] for i in np.flatnonzero(row >= threshold)]
+                for row in self.predict_proba(X)]
+    
+    def save(self, path):
+        """Write the model as a directory of .npy arrays plus meta.json"""
+        temp_path = path + '.tmp'
+        os.makedirs(temp_path, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(temp_path, name + '.npy'), np.asarray(getattr(self, name)))
+        meta = {
+            'format_version': self.FORMAT_VERSION,
+            'feature_names': self.feature_names,
+            'labels': self.labels,
+            'samples': self.samples,
+            'learning_rate': self.learning_rate,
+            'l2': self.l2,
+            'batch_size': self.batch_size
+        }
+        with open(os.path.join(temp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        
+        # Swap the finished directory in so readers never see a partial model
+        if os.path.isdir(path):
+            old_path = path + '.old'
+            os.replace(path, old_path)
+            os.replace(temp_path, path)
+            for name in os.listdir(old_path):
+                os.remove(os.path.join(old_path, name))
+            os.rmdir(old_path)
+        else:
+            os.replace(temp_path, path)
+    
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Load a saved model with memory-mapped arrays, or None if there is none"""
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('format_version') != cls.FORMAT_VERSION:
+            return None
+        
+        model = cls(meta['feature_names'], learning_rate=meta['learning_rate'],
+                    l2=meta['l2'], batch_size=meta['batch_size'])
+        model.labels = list(meta['labels'])
+        model.samples = meta['samples']
+        for name in cls.ARRAYS:
+            setattr(model, name, np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode))
+        return model
+
+# ========================================================
+# ML MODEL IMPLEMENTATIONS
+# ========================================================
+
+class FeatureCache:
+    """LRU cache of extracted features keyed by content hash"""
+    
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+    
+    @staticmethod
+    def key_for(code):
+        """Content hash used as the cache key
+        
+        Every method takes it as key=, so a caller that consults several
+        caches for one revision hashes the source once.
+        """
+        return hashlib.sha1(code.encode('utf-8', 'surrogatepass')).hexdigest()
+    
+    def get_or_compute(self, code, compute, key=None):
+        """Return cached features for code, computing them on a miss"""
+        key = key or self.key_for(code)
+        value = self.lookup(code, self.MISSING, key)
+        if value is self.MISSING:
+            value = compute(code)
+            self.store(code, value, key)
+        return value
+    
+    MISSING = object()
+    
+    def lookup(self, code, default=None, key=None):
+        """Return the cached value for code, or default (counted as a miss)"""
+        key = key or self.key_for(code)
+        
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return self.entries[key]
+        
+        self.stats['misses'] += 1
+        return default
+    
+    def store(self, code, value, key=None):
+        """Cache value for code, evicting the least recently used entry"""
+        self.entries[key or self.key_for(code)] = value
+        
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.stats['evictions'] += 1
+    
+    def clear(self):
+        """Drop all cached entries"""
+        self.entries.clear()
+    
+    def get_stats(self):
+        """Return a copy of the hit/miss counters"""
+        stats = dict(self.stats)
+        stats['size'] = len(self.entries)
+        return stats
+
+# Analyzers whose pending weight updates are flushed at exit; weak, so
+# registering one does not keep it alive
+_open_analyzers = weakref.WeakSet()
+
+
+@atexit.register
+def _close_open_analyzers():
+    for analyzer in list(_open_analyzers):
+        analyzer.close()
+
+
+class MLCodeAnalyzer:
+    """Machine Learning-based code analyzer"""
+    
+    # Rules behind count_patterns: feature name -> (regex, flags)
+    COUNT_RULES = {
+        'range_len': (r'range\s*\(\s*len\s*\(', re.IGNORECASE),
+        'string_concat': (r'\w+\s*=\s*\w+\s*\+\s*["\']', 0),
+        'for_loops': (r'for\s+\w+\s+in\s+\w+\s*:', 0),
+        'list_comps': (r'\[\s*.*?\s+for\s+.*?\s+in\s+.*?\]', 0),
+        'bare_except': (r'except\s*:', 0),
+        'print_statements': (r'print\s*\(', 0),
+        'todo_comments': (r'#\s*(TODO|FIXME|HACK)', re.IGNORECASE),
+        'function_count': (r'def\s+\w+', 0),
+        'class_count': (r'class\s+\w+', 0)
+    }
+    
+    # Rules behind check_pattern_existence: pattern name -> (regex, flags)
+    EXISTENCE_RULES = {
+        'range_len_pattern': (r'range\s*\(\s*len\s*\(', 0),
+        'inefficient_concatenation': (r'\w+\s*=\s*\w+\s*\+\s*["\']', 0),
+        'list_membership': (r'in\s+\[', 0),
+        'redundant_bool': (r'bool\s*\(.*?\)\s*==\s*(True|False)', 0),
+        'bare_except': (r'except\s*:', 0),
+        'print_debugging': (r'print\s*\(.*?(debug|test|temp)', re.IGNORECASE),
+        'eval_usage': (r'eval\s*\(', 0),
+        'exec_usage': (r'exec\s*\(', 0)
+    }
+    
+    # extract_features keys, in the column order the classifier is trained on
+    FEATURE_NAMES = [
+        'line_count', 'indentation_depth', 'function_count', 'class_count',
+        'complexity_score', 'nesting_depth', 'max_function_complexity',
+        'max_function_length', 'performance_range_len', 'performance_string_concat',
+        'performance_list_comp_missing', 'style_bare_except', 'style_print_statements',
+        'style_todo_comments'
+    ]
+    
+    CLASSIFIER_PATH = "code_classifier"
+    
+    def __init__(self):
+        self.model_store = ModelStore()
+        self.pattern_model = self.load_or_create_model()
+        # Weights drift a little on every analysis; the fingerprint only
+        # moves when the model is loaded or saved, so cached results stay valid
+        self.model_fingerprint = self.weights_digest()
+        self.code_features = {}
+        self.learning_rate = 0.1
+        self.autosave = True  # Write weight updates behind to model_store
+        _open_analyzers.add(self)
+        
+        # Shared by predict_issues, history and metrics so each revision is scanned once
+        self.feature_cache = FeatureCache(maxsize=32)
+        
+        # One compiled scan serves both the rule-based and the ML paths
+        self.rule_engine = RuleEngine()
+        self.scan_cache = FeatureCache(maxsize=8)
+        self.line_index_cache = FeatureCache(maxsize=8)
+        self.ast_cache = FeatureCache(maxsize=8)
+        for name, (pattern, flags) in self.COUNT_RULES.items():
+            self.add_rule(f'count:{name}', pattern, flags)
+        for name, (pattern, flags) in self.EXISTENCE_RULES.items():
+            self.add_rule(f'ml:{name}', pattern, flags)
+        
+        # Offline-trained classifier (ai_train.py), memory-mapped if present
+        self.classifier = self.load_classifier()
+    
+    def load_classifier(self, path=None):
+        """Load the trained classifier; None if missing or built for other features"""
+        try:
+            classifier = FeatureClassifier.load(path or self.CLASSIFIER_PATH)
+        except (OSError, ValueError, KeyError):
+            return None
+        if classifier is not None and classifier.feature_names != self.FEATURE_NAMES:
+            return None
+        return classifier
+    
+    def feature_vector(self, features):
+        """extract_features dict as a row in FEATURE_NAMES order (missing -> 0)"""
+        return [float(features.get(name, 0)) for name in self.FEATURE_NAMES]
+    
+    def feature_matrix(self, codes):
+        """(documents x FEATURE_NAMES) matrix for a batch of sources"""
+        return np.array([self.feature_vector(self.extract_features(code)) for code in codes],
+                        dtype=np.float64).reshape(len(codes), len(self.FEATURE_NAMES))
+    
+    def predict_many(self, codes, threshold=0.5):
+        """Classify a batch of sources: [{label: probability}] plus the labels at threshold"""
+        if self.classifier is None:
+            raise RuntimeError(f"No trained classifier at {self.CLASSIFIER_PATH}; run ai_train.py first")
+        
+        probabilities = self.classifier.predict_proba(self.feature_matrix(codes))
+        labels = self.classifier.labels
+        return [
+            {
+                'probabilities': dict(zip(labels, row.tolist())),
+                'labels': [labels[i] for i in np.flatnonzero(row >= threshold)]
+            }
+            for row in probabilities
+        ]
+    
+    def add_rule(self, name, pattern, flags=0, trigger=None):
+        """Register a rule with the shared engine"""
+        self.rule_engine.add_rule(name, pattern, flags, trigger)
+        self.scan_cache.clear()  # Cached scans don't know about the new rule
+    
+    # The per-revision accessors below take the FeatureCache.key_for(code)
+    # content key where the caller already has it
+    
+    def get_ast_metrics(self, code, key=None):
+        """Return AST metrics for code (None on syntax errors), parsing once per revision"""
+        return self.ast_cache.get_or_compute(code, collect_ast_metrics, key)
+    
+    def get_line_index(self, code, key=None):
+        """Return the LineIndex for code, building it once per revision"""
+        return self.line_index_cache.get_or_compute(code, LineIndex, key)
+    
+    def scan(self, code, key=None):
+        """Return {rule name: [match, ...]} for code, scanning once per revision"""
+        return self.scan_cache.get_or_compute(code, self.rule_engine.scan, key)
+        
+    def load_or_create_model(self):
+        """Load existing model or create new one"""
+        model = self.model_store.load()
+        if model is not None:
+            return model
+        
+        # Initialize with basic patterns
+        base_patterns = {
+            'performance': {
+                'range_len_pattern': {'weight': 0.9, 'count': 0},
+                'inefficient_concatenation': {'weight': 0.8, 'count': 0},
+                'list_membership': {'weight': 0.7, 'count': 0}
+            },
+            'style': {
+                'redundant_bool': {'weight': 0.6, 'count': 0},
+                'bare_except': {'weight': 0.8, 'count': 0},
+                'print_debugging': {'weight': 0.5, 'count': 0}
+            },
+            'security': {
+                'eval_usage': {'weight': 0.95, 'count': 0},
+                'exec_usage': {'weight': 0.9, 'count': 0}
+            }
+        }
+        return PatternModel.from_dict(base_patterns)
+    
+    def save_model(self):
+        """Save trained model to file now, merging with other writers"""
+        if self.model_store.flush(self.pattern_model):
+            self.model_fingerprint = self.weights_digest()
+    
+    def close(self):
+        """Flush pending weight updates (also run at exit while this is alive)"""
+        if self.autosave and self.model_store.dirty:
+            self.save_model()
+    
+    def weights_digest(self):
+        """Hash of the current pattern weights"""
+        model = self.pattern_model
+        weights = sorted(zip(model.keys, np.round(model.weights, 4).tolist()))
+        return hashlib.sha1(repr(weights).encode('utf-8')).hexdigest()
+    
+    def get_features(self, code, key=None):
+        """Return features for code, extracting them at most once per revision"""
+        key = key or FeatureCache.key_for(code)
+        return self.feature_cache.get_or_compute(
+            code, lambda code: self.extract_features(code, key), key)
+    
+    def extract_features(self, code, key=None):
+        """Extract features from code for ML analysis"""
+        features = {}
+        
+        # Basic metrics
+        features['line_count'] = code.count('\n') + 1
+        features['indentation_depth'] = self.calculate_avg_indentation(code)
+        
+        ast_metrics = self.get_ast_metrics(code, key)
+        if ast_metrics is not None:
+            # Structural metrics from one AST walk
+            for name in ('function_count', 'class_count', 'complexity_score',
+                         'nesting_depth', 'max_function_complexity', 'max_function_length'):
+                features[name] = ast_metrics[name]
+        else:
+            # Buffer doesn't parse (mid-edit) - fall back to text heuristics
+            scan = self.scan(code, key)
+            features['function_count'] = len(scan['count:function_count'])
+            features['class_count'] = len(scan['count:class_count'])
+            features['complexity_score'] = self.calculate_complexity(code)
+            features['nesting_depth'] = self.calculate_max_nesting(code)
+            # No per-function complexity without a tree, as in the block and streaming paths
+            spans = heuristic_function_spans(self.get_line_index(code, key).lines)
+            features['max_function_complexity'] = 0
+            features['max_function_length'] = max((length for _, length in spans), default=0)
+        
+        # Pattern frequencies
+        pattern_counts = self.count_patterns(code, key)
+        for category, patterns in pattern_counts.items():
+            for pattern, count in patterns.items():
+                features[f'{category}_{pattern}'] = count
+        
+        return features
+    
+    # ADDED THIS MISSING METHOD
+    def calculate_complexity(self, code):
+        """Calculate code complexity score"""
+        return int(sum(self.line_complexity(line) for line in code.split('\n')))
+    
+    @staticmethod
+    def line_complexity(line):
+        """One line's share of calculate_complexity"""
+        # Skip comments and empty lines
+        if line.strip().startswith('#') or not line.strip():
+            return 0
+        
+        score = 0
+        # Add points for control structures
+        if any(keyword in line for keyword in ['if ', 'elif ', 'else:', 'for ', 'while ', 
+                                              'try:', 'except ', 'finally:', 'with ']):
+            score += 1
+        
+        # Add points for logical operators
+        if ' and ' in line or ' or ' in line:
+            score += 0.5
+        
+        # Add points for function definitions
+        if 'def ' in line:
+            score += 1
+        
+        # Add points for class definitions
+        if 'class ' in line:
+            score += 2
+        
+        return score
+    
+    def calculate_avg_indentation(self, code):
+        """Calculate average indentation level"""
+        lines = code.split('\n')
+        indent_levels = []
+        
+        for line in lines:
+            if line.strip():
+                indent = len(line) - len(line.lstrip())
+                indent_levels.append(indent // 4)  # Assuming 4-space indents
+        
+        return np.mean(indent_levels) if indent_levels else 0
+    
+    def calculate_max_nesting(self, code):
+        """Calculate maximum nesting depth"""
+        max_depth = 0
+        current_depth = 0
+        
+        for line in code.split('\n'):
+            line_depth, current_depth = self.line_nesting(line, current_depth)
+            if line_depth is not None:
+                max_depth = max(max_depth, line_depth)
+        
+        return max_depth
+    
+    @staticmethod
+    def line_nesting(line, current_depth):
+        """(depth of line, depth carried to the next line) for calculate_max_nesting;
+        comment lines have no depth of their own (None)"""
+        # Skip comments
+        if line.strip().startswith('#'):
+            return None, current_depth
+        
+        # Count opening braces and colons
+        line_depth = current_depth
+        for char in line:
+            if char == ':' and line.strip().endswith(':'):
+                line_depth += 1
+            elif char == '(' or char == '[' or char == '{':
+                line_depth += 0.5  # Partial depth for brackets
+        
+        # Reset for next line if not continuing
+        if line.strip() and not line.strip().endswith(':'):
+            current_depth = line_depth
+        return line_depth, current_depth
+    
+    def count_patterns(self, code, key=None):
+        """Count pattern occurrences"""
+        scan = self.scan(code, key)
+        return self.pattern_counts_from({name: len(matches) for name, matches in scan.items()})
+    
+    def pattern_counts_from(self, counts):
+        """Group per-rule match counts into the count_patterns layout"""
+        patterns = {
+            'performance': {
+                'range_len': counts['count:range_len'],
+                'string_concat': counts['count:string_concat'],
+                'list_comp_missing': counts['count:for_loops'] - 
+                                   counts['count:list_comps']
+            },
+            'style': {
+                'bare_except': counts['count:bare_except'],
+                'print_statements': counts['count:print_statements'],
+                'todo_comments': counts['count:todo_comments']
+            }
+        }
+        return patterns
+    
+    def predict_issues(self, code, key=None):
+        """Predict potential issues using ML"""
+        scan = self.scan(code, key)
+        return self.predict_from_existence(lambda pattern_name: scan.get(f'ml:{pattern_name}'))
+    
+    def predict_from_existence(self, exists):
+        """Score every model pattern for which exists(pattern_name) is true"""
+        presence = np.fromiter((bool(exists(pattern)) for pattern in self.pattern_model.patterns),
+                               dtype=bool, count=len(self.pattern_model))
+        return self.predict_batch(presence[np.newaxis])[0]
+    
+    def presence_matrix(self, codes):
+        """(documents x patterns) matrix of which model patterns occur in each code"""
+        model = self.pattern_model
+        presence = np.zeros((len(codes), len(model)), dtype=bool)
+        for row, code in enumerate(codes):
+            scan = self.rule_engine.scan(code)
+            for col, pattern in enumerate(model.patterns):
+                presence[row, col] = bool(scan.get(f'ml:{pattern}'))
+        return presence
+    
+    def predict_issues_batch(self, codes, update=True):
+        """predict_issues for many documents, scored and learned from in one batch"""
+        return self.predict_batch(self.presence_matrix(codes), update)
+    
+    def predict_batch(self, presence, update=True):
+        """[(predictions, confidence_scores)] per row of a presence matrix
+        
+        All rows are scored with the weights as they are before the batch;
+        with update the weights then learn from the whole batch at once.
+        """
+        model = self.pattern_model
+        presence = np.atleast_2d(np.asarray(presence, dtype=bool))
+        scores = model.score(presence)
+        weights = model.weights.tolist()
+        
+        results = []
+        for row, present in zip(scores, presence):
+            found = np.flatnonzero(present)
+            confidence_scores = {}
+            for i in found.tolist():
+                category, pattern_name = model.keys[i]
+                confidence_scores[f"{category}_{pattern_name}"] = float(row[i])
+            
+            # Highest confidence first; ties keep model order
+            predictions = []
+            for i in found[np.argsort(-row[found], kind='stable')][:10].tolist():
+                category, pattern_name = model.keys[i]
+                predictions.append({
+                    'category': category,
+                    'pattern': pattern_name,
+                    'confidence': float(row[i]),
+                    'weight': weights[i],
+                    'suggestion': self.get_suggestion(category, pattern_name)
+                })
+            results.append((predictions, confidence_scores))
+        
+        if update:
+            self.adjust_weights_batch(presence)
+        
+        return results
+    
+    def check_pattern_existence(self, code, pattern_name):
+        """Check if a specific pattern exists in code"""
+        return bool(self.scan(code).get(f'ml:{pattern_name}'))
+    
+    def get_suggestion(self, category, pattern_name):
+        """Get suggestion for a pattern"""
+        suggestions = {
+            'range_len_pattern': 'Use enumerate() for index and value access',
+            'inefficient_concatenation': 'Use str.join() for string concatenation in loops',
+            'list_membership': 'Convert to set for faster membership testing',
+            'redundant_bool': 'Direct boolean evaluation is cleaner',
+            'bare_except': 'Specify exception types for better error handling',
+            'print_debugging': 'Consider using logging module for debugging',
+            'eval_usage': 'Avoid eval() - use ast.literal_eval() for safety',
+            'exec_usage': 'exec() is a security risk - find alternatives'
+        }
+        return suggestions.get(pattern_name, 'Consider refactoring')
+    
+    def adjust_weights(self, code, predictions):
+        """Adjust ML model weights based on findings"""
+        model = self.pattern_model
+        presence = np.zeros(len(model), dtype=bool)
+        for prediction in predictions:
+            i = model.index.get((prediction['category'], prediction['pattern']))
+            if i is not None:
+                presence[i] = True
+        self.adjust_weights_batch(presence[np.newaxis])
+    
+    def adjust_weights_batch(self, presence):
+        """Learn from a (documents x patterns) presence matrix in one vector update"""
+        weight_deltas, count_deltas = self.pattern_model.update(presence, self.learning_rate)
+        self.model_store.record_many(self.pattern_model, weight_deltas, count_deltas)
+        
+        # Periodically write the accumulated updates behind
+        if self.autosave and self.model_store.maybe_flush(self.pattern_model):
+            self.model_fingerprint = self.weights_digest()
+
+# ========================================================
+# ANALYSIS HISTORY
+# ========================================================
+
+class AnalysisHistory:
+    """Fixed-capacity ring buffer of analyses with running aggregates
+    
+    Each column lives in its own typed NumPy array; once full, the oldest
+    row is overwritten. Window sums, a sorted copy of the complexity column
+    (for p50/p95) and fast/slow moving averages of the suggestion count are
+    updated on every append, so summary() is a handful of O(1) reads however
+    long the session runs.
+    """
+    
+    COLUMNS = {
+        'timestamp': np.float64,
+        'suggestion_count': np.int32,
+        'line_count': np.int32,
+        'function_count': np.int32,
+        'class_count': np.int32,
+        'complexity_score': np.float64,
+        'nesting_depth': np.float64
+    }
+    FEATURE_COLUMNS = ('line_count', 'function_count', 'class_count',
+                       'complexity_score', 'nesting_depth')
+    
+    FAST_ALPHA = 0.3   # Smoothing for the recent suggestion-count average
+    SLOW_ALPHA = 0.05  # Smoothing for the long-run suggestion-count average
+    
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.columns = {name: np.zeros(capacity, dtype=dtype)
+                        for name, dtype in self.COLUMNS.items()}
+        self.head = 0   # Next slot to write
+        self.size = 0   # Rows currently held
+        self.total = 0  # Rows ever appended
+        self.lock = threading.Lock()
+        
+        # Aggregates over the rows in the window
+        self.sums = dict.fromkeys(self.COLUMNS, 0.0)
+        self.sorted_complexity = []
+        self.fast_suggestions = None
+        self.slow_suggestions = None
+    
+    def append(self, suggestion_count, features, timestamp=None):
+        """Record one analysis, evicting the oldest row when full"""
+        row = {name: features.get(name, 0) for name in self.FEATURE_COLUMNS}
+        row['timestamp'] = time.time() if timestamp is None else timestamp
+        row['suggestion_count'] = suggestion_count
+        
+        with self.lock:
+            slot = self.head
+            if self.size == self.capacity:
+                for name, column in self.columns.items():
+                    self.sums[name] -= float(column[slot])
+                old = float(self.columns['complexity_score'][slot])
+                del self.sorted_complexity[bisect_left(self.sorted_complexity, old)]
+            else:
+                self.size += 1
+            
+            for name, column in self.columns.items():
+                column[slot] = row[name]
+                self.sums[name] += float(column[slot])
+            insort(self.sorted_complexity, float(self.columns['complexity_score'][slot]))
+            
+            if self.fast_suggestions is None:
+                self.fast_suggestions = self.slow_suggestions = float(suggestion_count)
+            else:
+                self.fast_suggestions += self.FAST_ALPHA * (suggestion_count - self.fast_suggestions)
+                self.slow_suggestions += self.SLOW_ALPHA * (suggestion_count - self.slow_suggestions)
+            
+            self.head = (slot + 1) % self.capacity
+            self.total += 1
+    
+    def __len__(self):
+        return self.size
+    
+    def percentile(self, fraction):
+        """Nearest-rank percentile of complexity_score over the window"""
+        values = self.sorted_complexity
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(fraction * len(values)))]
+    
+    def summary(self):
+        """Window aggregates; every value is an O(1) read"""
+        with self.lock:
+            if not self.size:
+                return {'entries': 0, 'total': self.total, 'capacity': self.capacity}
+            
+            trend = self.fast_suggestions - self.slow_suggestions
+            return {
+                'entries': self.size,
+                'total': self.total,
+                'capacity': self.capacity,
+                'mean_lines': self.sums['line_count'] / self.size,
+                'mean_complexity': self.sums['complexity_score'] / self.size,
+                'p50_complexity': self.percentile(0.50),
+                'p95_complexity': self.percentile(0.95),
+                'mean_suggestions': self.sums['suggestion_count'] / self.size,
+                'recent_suggestions': self.fast_suggestions,
+                'suggestion_trend': trend
+            }
+    
+    def recent(self, count=10):
+        """The last count rows, oldest first, as dicts"""
+        with self.lock:
+            count = min(count, self.size)
+            rows = []
+            for offset in range(count, 0, -1):
+                slot = (self.head - offset) % self.capacity
+                rows.append({name: column[slot].item() for name, column in self.columns.items()})
+            return rows
+
+# ========================================================
+# STAGE TIMING
+# ========================================================
+
+class StageTimer:
+    """Per-stage latency counters with rolling p50/p95/max
+    
+    attach() names the methods of an object that make up each stage. While
+    enabled, those methods are shadowed by timing wrappers on the instance;
+    disable() deletes the wrappers again, so the plain class methods run
+    and switching timing off costs nothing. Only calls that look the method
+    up at call time are timed - callbacks bound before enable() are not.
+    """
+    
+    def __init__(self, window=200, enabled=False):
+        self.window = window  # Samples per stage behind the rolling figures
+        self.enabled = False
+        self.targets = []  # (object, {method name: stage})
+        self.samples = {}  # stage -> deque of recent durations in seconds
+        self.counts = Counter()
+        self.totals = Counter()
+        self.lock = threading.Lock()
+        if enabled:
+            self.enable()
+    
+    def attach(self, obj, stages):
+        """Time obj's methods as stages: {method name: stage name}"""
+        self.targets.append((obj, stages))
+        if self.enabled:
+            self._wrap(obj, stages)
+    
+    def enable(self):
+        if not self.enabled:
+            self.enabled = True
+            for obj, stages in self.targets:
+                self._wrap(obj, stages)
+    
+    def disable(self):
+        if self.enabled:
+            self.enabled = False
+            for obj, stages in self.targets:
+                for name in stages:
+                    obj.__dict__.pop(name, None)
+    
+    def _wrap(self, obj, stages):
+        for name, stage in stages.items():
+            if name not in obj.__dict__:
+                setattr(obj, name, self._timed(stage, getattr(obj, name)))
+    
+    def _timed(self, stage, method):
+        record = self.record
+        clock = time.perf_counter
+        
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                record(stage, clock() - start)
+        return timed
+    
+    def record(self, stage, seconds):
+        """Add one sample; also usable directly for code that isn't a method"""
+        with self.lock:
+            samples = self.samples.get(stage)
+            if samples is None:
+                samples = self.samples[stage] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self.counts[stage] += 1
+            self.totals[stage] += seconds
+    
+    def get_stats(self):
+        """{stage: count, total/last and rolling p50/p95/max in ms}"""
+        with self.lock:
+            snapshot = {stage: list(samples) for stage, samples in self.samples.items()}
+        
+        stats = {}
+        for stage, samples in snapshot.items():
+            ordered = sorted(samples)
+            stats[stage] = {
+                'count': self.counts[stage],
+                'total_ms': self.totals[stage] * 1000,
+                'last_ms': samples[-1] * 1000,
+                'p50_ms': ordered[len(ordered) // 2] * 1000,
+                'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                'max_ms': ordered[-1] * 1000
+            }
+        return stats
+    
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.counts.clear()
+            self.totals.clear()
+
+# ========================================================
+# ENHANCED AI ANALYZER WITH ML
+# ========================================================
+
+class EnhancedAIAnalyzer:
+    # Code smell thresholds
+    LONG_FUNCTION_LINES = 30  # Longer functions are reported
+    DUPLICATE_MIN_COUNT = 3  # Lines repeated more often are reported...
+    DUPLICATE_MIN_CHARS = 20  # ...if longer than this, stripped
+    
+    def __init__(self):
+        self.ml_analyzer = MLCodeAnalyzer()
+        self.patterns = self.initialize_patterns()
+        self.history = AnalysisHistory()
+        
+        # Per-stage latency, off until timer.enable() (the editor, which shows it)
+        self.timer = StageTimer()
+        self.timer.attach(self, {
+            'analyze_code': 'analyze',
+            'analyze_stream': 'stream',
+            'rule_based_analysis': 'rules',
+            'detect_code_smells': 'smells',
+            'get_advanced_metrics': 'metrics',
+            'finalize_suggestions': 'finalize'
+        })
+        self.timer.attach(self.ml_analyzer, {
+            'extract_features': 'features',
+            'predict_batch': 'ml'
+        })
+        
+        # Rules share the ML analyzer's engine, so the text is scanned once
+        for index, (pattern, advice) in enumerate(self.patterns):
+            self.ml_analyzer.add_rule(f'rule:{index}', pattern)
+        
+    def fingerprint(self):
+        """Hash of the rules and saved model weights that shape analysis results"""
+        ml = self.ml_analyzer
+        payload = repr((ANALYSIS_VERSION, self.patterns,
+                        sorted(ml.COUNT_RULES.items()),
+                        sorted(ml.EXISTENCE_RULES.items()), ml.model_fingerprint))
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+    
+    def initialize_patterns(self):
+        return [
+            # Performance patterns
+            (r'for\s+i\s+in\s+range\s*\(\s*len\s*\(\s*(\w+)\s*\)\s*\)', 
+             'Use enumerate() for index and value: for idx, item in enumerate(\\1)'),
+            (r'(\w+)\s*=\s*\1\s*\+\s*(\w+)', 
+             'Use augmented assignment: \\1 += \\2'),
+            (r'if\s+(\w+)\s+in\s+\[', 
+             'Use set for membership testing: if \\1 in {value1, value2}'),
+            
+            # Pythonic patterns
+            (r'if\s+bool\s*\(\s*(\w+)\s*\)\s*==\s*True', 
+             'Directly use: if \\1'),
+            (r'if\s+len\s*\(\s*(\w+)\s*\)\s*>\s*0', 
+             'Directly use: if \\1'),
+            (r'if\s+(\w+)\s*==\s*False', 
+             'Use: if not \\1'),
+            
+            # Security patterns
+            (r'eval\s*\(', '⚠️ SECURITY: Avoid eval() - use ast.literal_eval() instead'),
+            (r'exec\s*\(', '⚠️ SECURITY: Avoid exec() - potential security risk'),
+            
+            # Style patterns
+            (r'except\s*:', 'Specify exception type: except ValueError:'),
+            (r'print\s+"', 'Use print() function: print("text")'),
+        ]
+    
+    def analyze_code(self, code, key=None):
+        """Analyze code with both rule-based and ML approaches
+        
+        key is FeatureCache.key_for(code); it is computed here if not given
+        and shared by every per-revision cache the stages consult.
+        """
+        key = key or FeatureCache.key_for(code)
+        suggestions = []
+        
+        # Get rule-based suggestions
+        suggestions.extend(self.rule_based_analysis(code, key))
+        
+        # Get ML-based predictions
+        ml_predictions, confidence_scores = self.ml_analyzer.predict_issues(code, key)
+        suggestions.extend(self.ml_to_suggestions(ml_predictions))
+        
+        # Add code smell detection
+        suggestions.extend(self.detect_code_smells(code, key))
+        
+        return self.finalize_suggestions(suggestions, self.ml_analyzer.get_features(code, key))
+    
+    def analyze_stream(self, lines):
+        """(suggestions, metrics) for a file object or any iterable of lines,
+        analyzed in one pass without holding the source; see StreamingAnalysis"""
+        if isinstance(lines, (str, bytes)):
+            raise TypeError("analyze_stream takes lines or a text file; use analyze_code for a string")
+        stream = StreamingAnalysis(self)
+        for line in lines:
+            stream.feed(line)
+        return stream.finish()
+    
+    def finalize_suggestions(self, suggestions, features, omitted=0):
+        """Rank suggestions, record the analysis in history and keep the top 20
+        
+        omitted counts suggestions the caller already knew could not make the
+        top 20; they only contribute to the history's suggestion count.
+        """
+        # Sort by priority and confidence
+        suggestions.sort(key=lambda x: (
+            {'high': 0, 'medium': 1, 'low': 2}.get(x['priority'], 3),
+            -x.get('confidence', 0)
+        ))
+        
+        # Store in history
+        self.history.append(len(suggestions) + omitted, features)
+        
+        return suggestions[:20]
+    
+    def rule_based_analysis(self, code, key=None):
+        """Traditional rule-based analysis"""
+        key = key or FeatureCache.key_for(code)
+        suggestions = []
+        scan = self.ml_analyzer.scan(code, key)
+        line_index = self.ml_analyzer.get_line_index(code, key)
+        
+        for index, (pattern, advice) in enumerate(self.patterns):
+            for match in scan[f'rule:{index}']:
+                line_num = line_index.line_of(match.start())
+                suggestions.append(self.make_rule_suggestion(line_num, pattern, advice))
+        
+        return suggestions
+    
+    def make_rule_suggestion(self, line_num, pattern, advice):
+        """Build the suggestion dict for one rule match"""
+        suggestion_text = f"Line {line_num}: {advice}"
+        return {
+            'line': line_num,
+            'suggestion': suggestion_text,
+            'category': self.get_category(pattern),
+            'priority': 'high' if '⚠️' in advice else 'medium',
+            'source': 'rule_based',
+            'confidence': 0.8
+        }
+    
+    def ml_to_suggestions(self, ml_predictions):
+        """Convert ML predictions to suggestion format"""
+        suggestions = []
+        
+        for pred in ml_predictions:
+            suggestions.append({
+                'line': 0,  # ML doesn't give line numbers
+                'suggestion': f"[ML] {pred['suggestion']} (confidence: {pred['confidence']:.2f})",
+                'category': pred['category'],
+                'priority': 'high' if pred['confidence'] > 0.8 else 'medium' if pred['confidence'] > 0.5 else 'low',
+                'source': 'ml',
+                'confidence': pred['confidence']
+            })
+        
+        return suggestions
+    
+    def detect_code_smells(self, code, key=None):
+        """Detect common code smells"""
+        key = key or FeatureCache.key_for(code)
+        lines = self.ml_analyzer.get_line_index(code, key).lines
+        ast_metrics = self.ml_analyzer.get_ast_metrics(code, key)
+        
+        if ast_metrics is not None:
+            function_spans = [(f['line'], f['length']) for f in ast_metrics['functions']]
+        else:
+            function_spans = heuristic_function_spans(lines)
+        
+        max_nesting = self.ml_analyzer.get_features(code, key)['nesting_depth']
+        return self.smell_suggestions(function_spans, max_nesting, Counter(lines).items())
+    
+    def smell_suggestions(self, function_spans, max_nesting, line_counts):
+        """Code smell suggestions from function spans, nesting and (line, count) pairs"""
+        suggestions = []
+        
+        # Long function detection
+        for start_line, func_length in function_spans:
+            if func_length > self.LONG_FUNCTION_LINES:
+                suggestions.append({
+                    'line': start_line,
+                    'suggestion': f"Long function detected ({func_length} lines). Consider splitting.",
+                    'category': 'maintainability',
+                    'priority': 'medium',
+                    'source': 'heuristic',
+                    'confidence': 0.7
+                })
+        
+        # Deep nesting detection
+        if max_nesting > 4:
+            suggestions.append({
+                'line': 0,
+                'suggestion': f"Deep nesting detected (depth: {max_nesting}). Consider refactoring.",
+                'category': 'complexity',
+                'priority': 'medium',
+                'source': 'heuristic',
+                'confidence': 0.6
+            })
+        
+        # Duplicate code detection (simplified)
+        for line, count in line_counts:
+            if count > self.DUPLICATE_MIN_COUNT and len(line.strip()) > self.DUPLICATE_MIN_CHARS:
+                suggestions.append({
+                    'line': 0,
+                    'suggestion': f"Possible duplicate code detected (occurs {count} times).",
+                    'category': 'duplication',
+                    'priority': 'low',
+                    'source': 'heuristic',
+                    'confidence': 0.5
+                })
+        
+        return suggestions
+    
+    def get_category(self, pattern):
+        """Get category based on pattern"""
+        if 'eval' in pattern or 'exec' in pattern:
+            return 'security'
+        elif 'for' in pattern or 'range' in pattern:
+            return 'performance'
+        elif 'if' in pattern or 'bool' in pattern:
+            return 'pythonic'
+        elif 'except' in pattern or 'print' in pattern:
+            return 'style'
+        else:
+            return 'general'
+    
+    def get_advanced_metrics(self, code, key=None):
+        """Get advanced ML-based metrics"""
+        return self.metrics_from_features(self.ml_analyzer.get_features(code, key))
+    
+    def metrics_from_features(self, features):
+        """Build the metrics report from a features dict"""
+        metrics = {
+            'total_lines': features.get('line_count', 0),
+            'avg_indentation': features.get('indentation_depth', 0),
+            'max_nesting': features.get('nesting_depth', 0),
+            'complexity_score': features.get('complexity_score', 0),
+            'function_count': features.get('function_count', 0),
+            'class_count': features.get('class_count', 0),
+            'max_function_complexity': features.get('max_function_complexity', 0),
+            'max_function_length': features.get('max_function_length', 0),
+            'quality_score': self.calculate_quality_score(features),
+            'patterns_detected': sum(features.get(f'{cat}_{pat}', 0) 
+                                   for cat in ['performance', 'style'] 
+                                   for pat in ['range_len', 'bare_except', 'todo_comments'])
+        }
+        
+        return metrics
+    
+    def calculate_quality_score(self, features):
+        """Calculate overall code quality score (0-100)"""
+        score = 100
+        
+        # Penalize for complexity
+        complexity = features.get('complexity_score', 0)
+        score -= min(complexity * 2, 30)
+        
+        # Penalize for deep nesting
+        nesting = features.get('nesting_depth', 0)
+        score -= min(nesting * 5, 20)
+        
+        # Penalize for anti-patterns
+        anti_patterns = sum(
+            features.get(f'{cat}_{pat}', 0) 
+            for cat in ['performance', 'style'] 
+            for pat in ['range_len', 'bare_except']
+        )
+        score -= min(anti_patterns * 3, 25)
+        
+        # Bonus for functions and classes
+        functions = features.get('function_count', 0)
+        classes = features.get('class_count', 0)
+        score += min((functions + classes) * 2, 15)
+        
+        return max(0, min(100, score))
+
+# ========================================================
+# INCREMENTAL ANALYSIS
+# ========================================================
+
+class IncrementalAnalyzer:
+    """Re-analyzes only the top-level blocks touched by an edit
+    
+    The buffer is split into top-level blocks (a def/class/statement with its
+    decorators, continuation clauses and trailing comments). Each block's rule
+    matches, pattern counts and structural metrics are cached by its text, and
+    file-level results are spliced together from the per-block pieces. The
+    blocks of the last revision are kept with their boundaries; an edit only
+    re-splits and re-analyzes the blocks around it, so the work per edit is
+    proportional to the edited block. Regex matches that would span two
+    top-level blocks are not reported.
+    """
+    
+    # Clauses that continue the statement above rather than start a block
+    CONTINUATIONS = frozenset(('else', 'elif', 'except', 'finally'))
+    # Tokens that don't start a logical line
+    NON_CODE = frozenset((tokenize.NL, tokenize.COMMENT, tokenize.INDENT,
+                          tokenize.DEDENT, tokenize.ENDMARKER))
+    OPENERS = frozenset('([{')
+    CLOSERS = frozenset(')]}')
+    
+    def __init__(self, analyzer, maxsize=4096):
+        self.analyzer = analyzer
+        self.ml_analyzer = analyzer.ml_analyzer
+        self.block_cache = FeatureCache(maxsize=maxsize)
+        
+        # The last revision and its blocks
+        self.code = None
+        self.line_count = 0
+        self.offsets = []  # Offset of each block in self.code
+        self.firsts = []  # First line of each block
+        self.results = []  # analyze_block result of each block
+        
+        self.line_counts = Counter()  # Whole-buffer line counts, kept up to date per block
+        self.duplicates = {}  # line -> count for lines that qualify as duplicates
+        self.totals = Counter()  # Summed rule counts and metrics of the current blocks
+        self.stats = {'analyses': 0, 'blocks': 0, 'dirty_blocks': 0,
+                      'recomputed': 0, 'reused': 0, 'full_passes': 0}
+        
+        analyzer.timer.attach(self, {
+            'analyze': 'incremental',
+            'split_blocks': 'split',
+            '_apply_block_changes': 'totals'
+        })
+    
+    def fingerprint(self):
+        """The analyzer's fingerprint, tagged as incremental
+        
+        Where the buffer doesn't parse, results spliced from blocks differ
+        from analyze_code's, so AnalysisCache keeps the two kinds apart.
+        """
+        return self.analyzer.fingerprint() + '+incremental'
+    
+    def block_starts(self, code, start=0):
+        """Yield (offset, is_decorator) for each top-level block start in code[start:]
+        
+        A block starts on a logical line at column 0 that doesn't continue the
+        statement above (else/elif/except/finally); comment and blank lines
+        stay with the block above. Lines inside strings, brackets and
+        backslash continuations are part of their logical line, so they never
+        start a block.
+        
+        Mid-edit code is cut short instead of swallowing the rest of the
+        buffer: an unterminated string or bracket ends on the line it opens
+        (a bracket also at a def/class line, which no bracket can contain),
+        and after an unmatched closing bracket or any other tokenize error,
+        tokenizing restarts on the next line. The tokenizer is thus in its
+        initial state at every block start, and splitting from any block start
+        gives the same blocks as splitting from the top.
+        """
+        lines = []  # Offset of each line read by the current tokenizer
+        pos = start
+        
+        def readline():
+            nonlocal pos
+            if pos >= len(code):
+                return ''
+            end = code.find('\n', pos) + 1 or len(code)
+            lines.append(pos)
+            line = code[pos:end]
+            pos = end
+            return line
+        
+        # Each pass tokenizes until an error; row is then the last line of
+        # the broken construct, and the next pass starts on the line after it
+        while pos < len(code):
+            lines = []
+            opened = []  # Row of each open bracket
+            at_line_start = True
+            try:
+                for token in tokenize.generate_tokens(readline):
+                    if token.type == tokenize.NEWLINE:
+                        at_line_start = True
+                        continue
+                    if token.type in self.NON_CODE:
+                        continue
+                    row, col = token.start
+                    if at_line_start:
+                        at_line_start = False
+                        if col == 0 and token.string not in self.CONTINUATIONS:
+                            yield lines[row - 1], token.string == '@'
+                    elif col == 0 and opened and token.string in ('def', 'class'):
+                        row -= 1
+                        break
+                    if token.type == tokenize.OP:
+                        if token.string in self.OPENERS:
+                            opened.append(row)
+                        elif token.string in self.CLOSERS:
+                            if not opened:
+                                break
+                            opened.pop()
+                else:
+                    return
+            except tokenize.TokenError as e:
+                message, (row, col) = e.args  # An unclosed string reports where it starts
+                if message == 'EOF in multi-line statement' and opened:
+                    row = opened[0]
+            except SyntaxError as e:  # IndentationError
+                row = e.lineno
+            if row >= len(lines):
+                return
+            pos = lines[row]
+    
+    def split_blocks(self, code, start=0, first_line=1, stop=None):
+        """Return [(first_line, text)] for the top-level blocks of code[start:]
+        
+        start must be a block start, on line first_line. stop(offset) is asked
+        at each later block boundary and ends the split there if it returns
+        True; otherwise the last block runs to the end of code.
+        """
+        bounds = [start]
+        decorator = code.startswith('@', start)
+        end = len(code)
+        for offset, is_decorator in self.block_starts(code, start):
+            if offset == start:
+                continue
+            if not decorator:  # Decorators belong to the def/class below
+                if stop is not None and stop(offset):
+                    end = offset
+                    break
+                bounds.append(offset)
+            decorator = is_decorator
+        bounds.append(end)
+        
+        blocks = []
+        line = first_line
+        for block_start, block_end in zip(bounds, bounds[1:]):
+            text = code[block_start:block_end]
+            blocks.append((line, text))
+            line += text.count('\n')
+        return blocks
+    
+    def analyze_block(self, text):
+        """Analyze one block in isolation; line numbers are block-relative"""
+        ml = self.ml_analyzer
+        scan = ml.rule_engine.scan(text)
+        line_index = LineIndex(text)
+        lines = line_index.lines
+        
+        rule_matches = []
+        for index in range(len(self.analyzer.patterns)):
+            for match in scan[f'rule:{index}']:
+                rule_matches.append((index, line_index.line_of(match.start())))
+        
+        ast_metrics = collect_ast_metrics(text)
+        if ast_metrics is not None:
+            structure = {key: ast_metrics[key] for key in self.SUMMED + self.MAXED}
+            function_spans = [(f['line'], f['length']) for f in ast_metrics['functions']]
+        else:
+            function_spans = heuristic_function_spans(lines)
+            structure = {
+                'function_count': len(scan['count:function_count']),
+                'class_count': len(scan['count:class_count']),
+                'complexity_score': ml.calculate_complexity(text),
+                'nesting_depth': ml.calculate_max_nesting(text),
+                'max_function_complexity': 0,
+                'max_function_length': max((length for _, length in function_spans), default=0)
+            }
+        
+        indents = [(len(line) - len(line.lstrip())) // 4 for line in lines if line.strip()]
+        
+        return {
+            'rule_matches': rule_matches,
+            'counts': {name: len(matches) for name, matches in scan.items()},
+            'parsed': ast_metrics is not None,
+            'structure': structure,
+            'function_spans': function_spans,
+            'indent_sum': sum(indents),
+            'indent_lines': len(indents),
+            'line_counts': Counter(lines)
+        }
+    
+    # How per-block structural metrics combine into file-level features
+    SUMMED = ('function_count', 'class_count', 'complexity_score')
+    MAXED = ('nesting_depth', 'max_function_complexity', 'max_function_length')
+    
+    def analyze(self, code, dirty_ranges=None):
+        """Analyze code, re-splitting and recomputing only the edited blocks
+        
+        dirty_ranges lists (first_line, last_line) edited since the previous
+        call; None means everything may have changed. The ranges point at the
+        edit, and the last revision's blocks before and after it are checked
+        against code and kept as they are. The blocks in between are split
+        again and looked up in the cache (a miss is recomputed). If a block
+        doesn't parse on its own but the whole of code does, the split has
+        cut a statement, so the result comes from one analyze_code pass.
+        
+        Returns (suggestions, metrics) like analyze_code/get_advanced_metrics.
+        """
+        line_count = code.count('\n') + 1
+        head, tail = self._unchanged_blocks(code, line_count, dirty_ranges)
+        
+        # Re-split from the block before the edit, as the edited line may now
+        # continue it, until a boundary of the unchanged tail comes up again
+        first = max(head - 1, 0)
+        offsets, firsts, results = self.offsets, self.firsts, self.results
+        start = offsets[first] if offsets else 0
+        shift = len(code) - len(self.code or '')
+        tail_start = (offsets[tail] if tail < len(offsets) else len(self.code or '')) + shift
+        resync = len(offsets)
+        
+        def stop(offset):
+            nonlocal resync
+            if offset < tail_start:
+                return False
+            index = bisect_left(offsets, offset - shift, tail)
+            if index < len(offsets) and offsets[index] == offset - shift:
+                resync = index
+                return True
+            return False
+        
+        blocks = self.split_blocks(code, start, firsts[first] if firsts else 1, stop)
+        
+        new_results = []
+        recomputed = 0
+        for _, text in blocks:
+            key = FeatureCache.key_for(text)
+            result = self.block_cache.lookup(text, None, key)
+            if result is None:
+                result = self.analyze_block(text)
+                self.block_cache.store(text, result, key)
+                recomputed += 1
+            new_results.append(result)
+        
+        line_shift = line_count - self.line_count
+        removed = results[first:resync]
+        self.offsets = offsets[:first] + [start + offset for offset in accumulate(
+            [0] + [len(text) for _, text in blocks[:-1]])] + [o + shift for o in offsets[resync:]]
+        self.firsts = (firsts[:first] + [line for line, _ in blocks] +
+                       [line + line_shift for line in firsts[resync:]])
+        self.results = results[:first] + new_results + results[resync:]
+        self.code = code
+        self.line_count = line_count
+        self._apply_block_changes(removed, new_results)
+        
+        self.stats['analyses'] += 1
+        self.stats['blocks'] += len(self.results)
+        self.stats['dirty_blocks'] += len(blocks)
+        self.stats['recomputed'] += recomputed
+        self.stats['reused'] += len(self.results) - recomputed
+        
+        analyzer = self.analyzer
+        if self.totals['unparsed']:
+            key = FeatureCache.key_for(code)
+            if self.ml_analyzer.get_ast_metrics(code, key) is not None:
+                self.stats['full_passes'] += 1
+                return analyzer.analyze_code(code, key), analyzer.get_advanced_metrics(code, key)
+        
+        results = self.results
+        features = self._assemble_features(code, results)
+        
+        # Rule-based suggestions, ordered like rule_based_analysis. All rule
+        # suggestions of one priority tie in the final sort, so only the first
+        # 20 of each priority can reach the top 20.
+        rule_hits = sorted((index, line + first_line - 1)
+                           for first_line, result in zip(self.firsts, results)
+                           for index, line in result['rule_matches'])
+        suggestions = []
+        kept = Counter()
+        for index, line in rule_hits:
+            pattern, advice = analyzer.patterns[index]
+            priority = '⚠️' in advice
+            if kept[priority] < 20:
+                kept[priority] += 1
+                suggestions.append(analyzer.make_rule_suggestion(line, pattern, advice))
+        skipped = len(rule_hits) - len(suggestions)
+        
+        # ML predictions from the summed existence counts
+        totals = self.totals
+        ml_predictions, confidence_scores = self.ml_analyzer.predict_from_existence(
+            lambda pattern_name: totals[f'ml:{pattern_name}'] > 0)
+        suggestions.extend(analyzer.ml_to_suggestions(ml_predictions))
+        
+        # Code smells
+        function_spans = [(line + first_line - 1, length)
+                          for first_line, result in zip(self.firsts, results)
+                          for line, length in result['function_spans']]
+        suggestions.extend(analyzer.smell_suggestions(
+            function_spans, features['nesting_depth'], self.ordered_duplicates()))
+        
+        suggestions = analyzer.finalize_suggestions(suggestions, features, skipped)
+        return suggestions, analyzer.metrics_from_features(features)
+    
+    def ordered_duplicates(self):
+        """(line, count) of the duplicate lines in order of first occurrence,
+        as Counter(lines) lists them in detect_code_smells"""
+        order = {}
+        pending = set(self.duplicates)
+        for index, result in enumerate(self.results):
+            if not pending:
+                break
+            found = pending.intersection(result['line_counts'])
+            if found:
+                pending -= found
+                lines = list(result['line_counts'])
+                for line in found:
+                    order[line] = (index, lines.index(line))
+        return sorted(self.duplicates.items(), key=lambda item: order[item[0]])
+    
+    def _unchanged_blocks(self, code, line_count, dirty_ranges):
+        """(head, tail): the last revision's blocks [0, head) start code and
+        blocks [tail, end) end it, unchanged
+        
+        The dirty ranges give a first guess, which is checked against the
+        text; a wrong guess (such as ranges merged from snapshots the worker
+        skipped, whose line numbers are stale) falls back to a binary search.
+        """
+        old, offsets = self.code, self.offsets
+        if old is None:
+            return 0, 0
+        count = len(offsets)
+        
+        def bound(index):
+            return offsets[index] if index < count else len(old)
+        
+        if dirty_ranges:
+            first_dirty = min(first for first, _ in dirty_ranges)
+            last_dirty = max(last for _, last in dirty_ranges) - (line_count - self.line_count)
+            head_guess = bisect_right(self.firsts, first_dirty) - 1
+            tail_guess = bisect_right(self.firsts, last_dirty)
+        else:
+            head_guess, tail_guess = 0, count
+        
+        head = self._last_true(lambda index: code.startswith(old[:bound(index)]),
+                               count, head_guess)
+        
+        # Tail blocks are counted from the end and may not overlap the head
+        shift = len(code) - len(old)
+        head_end = bound(head)
+        kept = self._last_true(
+            lambda kept: (bound(count - kept) + shift >= head_end and
+                          code.endswith(old[bound(count - kept):])),
+            count - head, count - tail_guess)
+        return head, count - kept
+    
+    @staticmethod
+    def _last_true(test, high, guess):
+        """Largest index in [0, high] that passes test, where test passes from
+        0 up to some index and fails after it; guess is tried first"""
+        guess = min(max(guess, 0), high)
+        if test(guess):
+            if guess == high or not test(guess + 1):
+                return guess
+            low = guess + 1
+        else:
+            low, high = 0, guess - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if test(middle):
+                low = middle
+            else:
+                high = middle - 1
+        return low
+    
+    def _assemble_features(self, code, results):
+        """File-level features (extract_features layout) from block results"""
+        totals = self.totals
+        features = {'line_count': code.count('\n') + 1}
+        
+        indent_lines = totals['indent_lines']
+        features['indentation_depth'] = totals['indent_sum'] / indent_lines if indent_lines else 0
+        
+        for key in self.SUMMED:
+            features[key] = totals[key]
+        for key in self.MAXED:
+            features[key] = max((r['structure'][key] for r in results), default=0)
+        
+        pattern_counts = self.ml_analyzer.pattern_counts_from(totals)
+        for category, patterns in pattern_counts.items():
+            for pattern, count in patterns.items():
+                features[f'{category}_{pattern}'] = count
+        
+        return features
+    
+    def _apply_block_changes(self, removed, added):
+        """Subtract the results of the blocks that went away from the running
+        totals and add those of the blocks that replaced them"""
+        changed = set()
+        for results, sign in ((removed, -1), (added, 1)):
+            for result in results:
+                for name, count in result['counts'].items():
+                    self.totals[name] += count * sign
+                for key in self.SUMMED:
+                    self.totals[key] += result['structure'][key] * sign
+                self.totals['indent_sum'] += result['indent_sum'] * sign
+                self.totals['indent_lines'] += result['indent_lines'] * sign
+                self.totals['unparsed'] += (not result['parsed']) * sign
+                
+                for line, count in result['line_counts'].items():
+                    self.line_counts[line] += count * sign
+                    changed.add(line)
+        
+        for line in changed:
+            count = self.line_counts[line]
+            if count <= 0:
+                del self.line_counts[line]
+            if (count > self.analyzer.DUPLICATE_MIN_COUNT and
+                    len(line.strip()) > self.analyzer.DUPLICATE_MIN_CHARS):
+                self.duplicates[line] = count
+            else:
+                self.duplicates.pop(line, None)
+    
+    def get_stats(self):
+        """Return a copy of the block counters"""
+        return dict(self.stats)
+
+# ========================================================
+# STREAMING ANALYSIS
+# ========================================================
+
+class StreamingAnalysis:
+    """analyze_code over a source fed one line at a time
+    
+    Every line passes once through all the line-oriented detectors: rule
+    and pattern matching, indentation, complexity and nesting, function
+    spans and duplicate lines. Only their running state is kept, not the
+    source: sums and maxima, the open function, the first rule matches of
+    each priority (only those can make the top 20), and for duplicates a
+    hash per distinct long line, with the text kept only once a line
+    repeats. Rules see one line at a time, so a match spanning lines is
+    not reported. The structural metrics are the text heuristics that
+    extract_features falls back to when code does not parse.
+    """
+    
+    RULE_SUGGESTIONS_KEPT = 20  # Per priority
+    
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+        self.ml_analyzer = analyzer.ml_analyzer
+        self.rules = [(f'rule:{index}', index, '⚠️' in advice)
+                      for index, (pattern, advice) in enumerate(analyzer.patterns)]
+        self.counted = [name for name in self.ml_analyzer.rule_engine.names
+                        if not name.startswith('rule:')]
+        
+        self.line_count = 0
+        self.ended_with_newline = True  # So an empty source is one empty line, like split
+        self.indent_sum = 0
+        self.indent_lines = 0
+        self.complexity = 0
+        self.nesting = 0  # Depth carried into the next line
+        self.max_nesting = 0
+        self.function_start = None  # Line of the def still open
+        self.function_spans = []  # (line, length) of the long functions
+        self.max_function_length = 0
+        self.totals = Counter()  # Matches per count:/ml: rule
+        self.rule_hits = {False: [], True: []}  # Per priority: max-heap of (-index, -line)
+        self.skipped = 0  # Rule matches that could not make the top 20
+        self.seen = set()  # hash() of long lines seen once
+        self.repeats = Counter()  # Long lines seen more than once -> count
+    
+    def feed(self, line):
+        """Analyze the next line; a trailing newline is dropped"""
+        self.ended_with_newline = line.endswith('\n')
+        if self.ended_with_newline:
+            line = line[:-1]
+        self.line_count += 1
+        number = self.line_count
+        stripped = line.strip()
+        
+        # Indentation, complexity, nesting
+        if stripped:
+            self.indent_sum += (len(line) - len(line.lstrip())) // 4
+            self.indent_lines += 1
+        self.complexity += MLCodeAnalyzer.line_complexity(line)
+        depth, self.nesting = MLCodeAnalyzer.line_nesting(line, self.nesting)
+        if depth is not None and depth > self.max_nesting:
+            self.max_nesting = depth
+        
+        # Function spans, as heuristic_function_spans finds them
+        if stripped.startswith('def '):
+            self.end_function(number)
+            self.function_start = number
+        
+        # Duplicate lines
+        if len(stripped) > self.analyzer.DUPLICATE_MIN_CHARS:
+            if line in self.repeats:
+                self.repeats[line] += 1
+            else:
+                key = hash(line)
+                if key in self.seen:
+                    self.seen.discard(key)
+                    self.repeats[line] = 2
+                else:
+                    self.seen.add(key)
+        
+        # Rules
+        scan = self.ml_analyzer.rule_engine.scan(line)
+        for name in self.counted:
+            matches = scan[name]
+            if matches:
+                self.totals[name] += len(matches)
+        for name, index, priority in self.rules:
+            for _ in scan[name]:
+                heap = self.rule_hits[priority]
+                heapq.heappush(heap, (-index, -number))
+                if len(heap) > self.RULE_SUGGESTIONS_KEPT:
+                    heapq.heappop(heap)
+                    self.skipped += 1
+    
+    def end_function(self, next_line):
+        """Close the open function where next_line starts"""
+        if self.function_start is None:
+            return
+        length = next_line - self.function_start
+        self.max_function_length = max(self.max_function_length, length)
+        if length > self.analyzer.LONG_FUNCTION_LINES:
+            self.function_spans.append((self.function_start, length))
+    
+    def features(self):
+        """extract_features layout, from the heuristics"""
+        totals = self.totals
+        features = {
+            'line_count': self.line_count,
+            'indentation_depth': self.indent_sum / self.indent_lines if self.indent_lines else 0,
+            'function_count': totals['count:function_count'],
+            'class_count': totals['count:class_count'],
+            'complexity_score': int(self.complexity),
+            'nesting_depth': self.max_nesting,
+            'max_function_complexity': 0,
+            'max_function_length': self.max_function_length
+        }
+        pattern_counts = self.ml_analyzer.pattern_counts_from(totals)
+        for category, patterns in pattern_counts.items():
+            for pattern, count in patterns.items():
+                features[f'{category}_{pattern}'] = count
+        return features
+    
+    def finish(self):
+        """(suggestions, metrics) like analyze_code/get_advanced_metrics"""
+        if self.ended_with_newline:
+            self.feed('')  # The empty line after the last newline
+        self.end_function(self.line_count + 1)
+        analyzer = self.analyzer
+        features = self.features()
+        
+        # Rule-based suggestions, in rule_based_analysis order
+        suggestions = []
+        hits = sorted((-index, -line) for heap in self.rule_hits.values() for index, line in heap)
+        for index, line in hits:
+            pattern, advice = analyzer.patterns[index]
+            suggestions.append(analyzer.make_rule_suggestion(line, pattern, advice))
+        
+        totals = self.totals
+        ml_predictions, confidence_scores = self.ml_analyzer.predict_from_existence(
+            lambda pattern_name: totals[f'ml:{pattern_name}'] > 0)
+        suggestions.extend(analyzer.ml_to_suggestions(ml_predictions))
+        
+        suggestions.extend(analyzer.smell_suggestions(
+            self.function_spans, self.max_nesting, self.repeats.items()))
+        
+        suggestions = analyzer.finalize_suggestions(suggestions, features, self.skipped)
+        return suggestions, analyzer.metrics_from_features(features)
+
+# ========================================================
+# PERSISTENT ANALYSIS CACHE
+# ========================================================
+
+class AnalysisCache:
+    """SQLite cache of analyze_code/get_advanced_metrics results
+    
+    Entries are keyed by the content hash plus the analyzer fingerprint
+    (rules, model weights, ANALYSIS_VERSION), so editing a rule or retraining
+    the model invalidates them. Several processes may share one file: the
+    database runs in WAL mode with a busy timeout, and a failed read or
+    write just counts as a miss. The least recently used entries are evicted
+    once the stored payload exceeds max_bytes.
+    """
+    
+    EVICT_CHECK_EVERY = 16  # Puts between size checks
+    
+    def __init__(self, path="analysis_cache.db", max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0, 'errors': 0}
+        self._puts_since_check = 0
+        
+        self.conn = sqlite3.connect(path, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used)")
+        self.conn.commit()
+    
+    @staticmethod
+    def key_for(code, fingerprint, content_key=None):
+        return (content_key or FeatureCache.key_for(code)) + ':' + fingerprint
+    
+    def get(self, code, fingerprint, content_key=None):
+        """Return (suggestions, metrics) for code, or None on a miss
+        
+        content_key is FeatureCache.key_for(code), if the caller has it.
+        """
+        key = self.key_for(code, fingerprint, content_key)
+        try:
+            row = self.conn.execute("SELECT payload FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                with self.conn:
+                    self.conn.execute("UPDATE entries SET last_used = ? WHERE key = ?",
+                                      (time.time(), key))
+        except sqlite3.Error:
+            self.stats['errors'] += 1
+            row = None
+        
+        if row is None:
+            self.stats['misses'] += 1
+            return None
+        
+        self.stats['hits'] += 1
+        payload = json.loads(row[0])
+        return payload['suggestions'], payload['metrics']
+    
+    def put(self, code, fingerprint, suggestions, metrics, content_key=None):
+        """Store results for code; errors (e.g. a locked database) are counted, not raised"""
+        payload = json.dumps({'suggestions': suggestions, 'metrics': metrics},
+                             ensure_ascii=False, default=float)
+        try:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, payload, size, last_used) VALUES (?, ?, ?, ?)",
+                    (self.key_for(code, fingerprint, content_key), payload, len(payload), time.time()))
+            self.stats['writes'] += 1
+            
+            self._puts_since_check += 1
+            if self._puts_since_check >= self.EVICT_CHECK_EVERY:
+                self._puts_since_check = 0
+                self.evict()
+        except sqlite3.Error:
+            self.stats['errors'] += 1
+    
+    def analyze(self, analyzer, code):
+        """(suggestions, metrics, hit) for code, analyzing and storing on a miss"""
+        fingerprint = analyzer.fingerprint()
+        key = FeatureCache.key_for(code)
+        cached = self.get(code, fingerprint, key)
+        if cached is not None:
+            return cached[0], cached[1], True
+        
+        suggestions = analyzer.analyze_code(code, key)
+        metrics = analyzer.get_advanced_metrics(code, key)
+        self.put(code, fingerprint, suggestions, metrics, key)
+        return suggestions, metrics, False
+    
+    def evict(self):
+        """Drop least recently used entries until the payload fits in max_bytes"""
+        with self.conn:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            
+            # Free down to 90% so we don't evict again on the next put
+            to_free = total - int(self.max_bytes * 0.9)
+            victims = []
+            for key, size in self.conn.execute("SELECT key, size FROM entries ORDER BY last_used"):
+                victims.append((key,))
+                to_free -= size
+                if to_free <= 0:
+                    break
+            
+            self.conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+            self.stats['evictions'] += len(victims)
+    
+    def get_stats(self):
+        """Return a copy of the hit/miss/write counters"""
+        return dict(self.stats)
+    
+    def close(self):
+        self.conn.close()
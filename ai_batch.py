@@ -0,0 +1,167 @@
+# ai_batch.py
+"""
+Headless batch analysis for CI.
+
+Walks directory trees for .py files, analyzes them on a process pool and
+streams one JSON object per file (in completion order) to stdout or a file.
+A throughput summary is printed to stderr at the end. Results are cached in
+a SQLite file shared by all workers, so unchanged files are not re-analyzed
+on the next run.
+
+Usage:
+    python ai_batch.py src/ tests/ -j 8 -o results.jsonl
+
+Does not import tkinter.
+"""
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool, util
+
+from ai_analyzer import AnalysisCache, EnhancedAIAnalyzer, FeatureCache
+
+DEFAULT_EXCLUDES = ['.git', '.hg', '.svn', '__pycache__', '.tox', '.nox',
+                    '.venv', 'venv', 'node_modules', '*.egg-info']
+
+# Per-process analyzer and cache connection, created once by the pool initializer
+_analyzer = None
+_cache = None
+
+
+def init_worker(update_model=False, cache_path=None):
+    """Create this process's analyzer and open its cache connection"""
+    global _analyzer, _cache
+    _analyzer = EnhancedAIAnalyzer()
+    _analyzer.ml_analyzer.autosave = update_model
+    # Pool workers skip atexit; flush pending model updates when they shut down
+    util.Finalize(None, _analyzer.ml_analyzer.close, exitpriority=10)
+    _cache = AnalysisCache(cache_path) if cache_path else None
+
+
+def analyze_file(path):
+    """Analyze one file and return a JSON-serializable result"""
+    start = time.perf_counter()
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            code = f.read()
+
+        if _cache is not None:
+            suggestions, metrics, cached = _cache.analyze(_analyzer, code)
+        else:
+            key = FeatureCache.key_for(code)
+            suggestions = _analyzer.analyze_code(code, key)
+            metrics = _analyzer.get_advanced_metrics(code, key)
+            cached = False
+
+        return {
+            'path': path,
+            'lines': code.count('\n') + 1,
+            'suggestions': suggestions,
+            'metrics': {key: float(value) if isinstance(value, float) else value
+                        for key, value in metrics.items()},
+            'cached': cached,
+            'seconds': round(time.perf_counter() - start, 6)
+        }
+    except Exception as e:
+        return {
+            'path': path,
+            'lines': 0,
+            'error': f"{type(e).__name__}: {e}",
+            'seconds': round(time.perf_counter() - start, 6)
+        }
+
+
+def iter_python_files(paths, excludes):
+    """Yield .py files under paths, skipping excluded directory/file names"""
+    def excluded(name):
+        return any(fnmatch.fnmatch(name, pattern) for pattern in excludes)
+
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(d for d in dirnames if not excluded(d))
+            for filename in sorted(filenames):
+                if filename.endswith('.py') and not excluded(filename):
+                    yield os.path.join(dirpath, filename)
+
+
+def run(paths, jobs, out, excludes, update_model=False, cache_path=None, chunksize=4):
+    """Analyze every file, writing JSONL to out; returns the summary dict"""
+    files = list(iter_python_files(paths, excludes))
+    summary = {'files': 0, 'lines': 0, 'errors': 0, 'suggestions': 0, 'cached': 0}
+
+    def emit(result):
+        summary['files'] += 1
+        summary['lines'] += result['lines']
+        summary['errors'] += 'error' in result
+        summary['suggestions'] += len(result.get('suggestions', ()))
+        summary['cached'] += result.get('cached', False)
+        out.write(json.dumps(result, ensure_ascii=False) + '\n')
+        out.flush()
+
+    start = time.perf_counter()
+    if jobs == 1:
+        init_worker(update_model, cache_path)
+        for path in files:
+            emit(analyze_file(path))
+    else:
+        with Pool(processes=jobs, initializer=init_worker,
+                  initargs=(update_model, cache_path)) as pool:
+            for result in pool.imap_unordered(analyze_file, files, chunksize=chunksize):
+                emit(result)
+            # Let workers exit normally so their finalizers run
+            pool.close()
+            pool.join()
+
+    elapsed = time.perf_counter() - start
+    summary['seconds'] = round(elapsed, 3)
+    summary['files_per_second'] = round(summary['files'] / elapsed, 1) if elapsed else 0.0
+    summary['lines_per_second'] = round(summary['lines'] / elapsed, 1) if elapsed else 0.0
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Analyze Python files headlessly and stream results as JSONL.")
+    parser.add_argument('paths', nargs='+', help="files or directories to analyze")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument('-o', '--output', default='-',
+                        help="JSONL output file (default: stdout)")
+    parser.add_argument('--exclude', action='append', default=[],
+                        help="directory/file name pattern to skip (repeatable)")
+    parser.add_argument('--update-model', action='store_true',
+                        help="let analysis update code_patterns_model.pkl")
+    parser.add_argument('--cache', default='analysis_cache.db',
+                        help="SQLite result cache (default: analysis_cache.db)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always re-analyze, ignoring the result cache")
+    args = parser.parse_args(argv)
+
+    if args.jobs < 1:
+        parser.error("-j must be at least 1")
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        summary = run(args.paths, args.jobs, out, DEFAULT_EXCLUDES + args.exclude,
+                      update_model=args.update_model,
+                      cache_path=None if args.no_cache else args.cache)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"📊 {summary['files']} files, {summary['lines']} lines, "
+          f"{summary['errors']} errors, {summary['cached']} cached in {summary['seconds']}s "
+          f"({summary['files_per_second']} files/s, {summary['lines_per_second']} lines/s)",
+          file=sys.stderr)
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1236 @@
+# ai_runner.py
+"""
+Code execution for the AI Python Editor.
+
+Runs the editor buffer in a child interpreter without blocking the caller:
+output is read on background threads into a bounded OutputBuffer that the
+GUI drains from its own loop (root.after), so the Tk thread never waits on
+the child. The full output is spilled to a temp file, so a program that
+prints gigabytes costs disk, not memory; SpillReader pages through it.
+
+Each run records what it cost (wall and CPU time, peak RSS and, with
+psutil, the most child processes alive at once) and can be capped with
+CPU-time and memory limits that are set in the child via setrlimit.
+
+With profile=True, the script runs under cProfile; load_profile(),
+profile_rows() and diff_profiles() turn the saved stats into rows for the
+editor's profile panel, with the script's functions mapped to buffer lines.
+With memory_profile=True it runs under tracemalloc instead, and
+MemoryTracer summarizes the allocations still alive at the end (and at
+any take_memory_snapshot() the script calls) per source line.
+
+A WarmPool keeps interpreters with commonly used modules already imported;
+each warm run forks a fresh child from one of them instead of starting
+(and importing) from scratch.
+
+Has no GUI dependencies. Run as a script, this module is the warm template
+process (see WarmPool).
+"""
+import argparse
+import ast
+import atexit
+import codecs
+import cProfile
+import importlib
+import importlib.util
+import io
+import json
+import os
+import pstats
+import queue
+import runpy
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import traceback
+from collections import deque
+
+try:
+    import resource  # POSIX only: rusage and rlimits
+except ImportError:
+    resource = None
+
+try:
+    import psutil  # Optional: child-process counts
+except ImportError:
+    psutil = None
+
+# ========================================================
+# RESOURCE LIMITS AND USAGE
+# ========================================================
+
+# Cold runs on POSIX go through this small (-S) interpreter: it sets the
+# rlimits, forks and execs the script's interpreter in a process group of
+# its own (set from both sides, so the group exists once the pid is
+# reported), and writes "pid" and then "user sys maxrss exitcode" lines to
+# the report fd. Linux carries the parent's RSS at fork over into the
+# child's ru_maxrss, so forking from the editor directly would report the
+# editor's size as the peak. Killing only the script's group leaves the
+# bootstrap alive to report what a stopped or timed-out run cost.
+ACCOUNTING_BOOTSTRAP = (
+    "import os, resource, sys\n"
+    "cpu, memory, report = int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3])\n"
+    "if cpu: resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))\n"
+    "if memory: resource.setrlimit(resource.RLIMIT_AS, (memory, memory))\n"
+    "pid = os.fork()\n"
+    "if pid == 0:\n"
+    "    try:\n"
+    "        os.setpgid(0, 0)\n"
+    "        os.close(report)\n"
+    "        os.execv(sys.argv[4], sys.argv[4:])\n"
+    "    finally:\n"
+    "        os._exit(127)\n"
+    "try: os.setpgid(pid, pid)\n"
+    "except OSError: pass\n"
+    "os.write(report, b'%d\\n' % pid)\n"
+    "_, status, usage = os.wait4(pid, 0)\n"
+    "os.write(report, b'%r %r %d %d\\n' % (usage.ru_utime, usage.ru_stime, usage.ru_maxrss,\n"
+    "                                    os.waitstatus_to_exitcode(status)))\n"
+)
+
+LIMITS_SUPPORTED = resource is not None
+
+
+def apply_limits(cpu_limit, memory_limit):
+    """Cap this process: CPU seconds (SIGXCPU, then SIGKILL a second later)
+    and address space in bytes (allocations fail with MemoryError)"""
+    if cpu_limit:
+        cpu = int(cpu_limit)
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (int(memory_limit), int(memory_limit)))
+
+
+def rusage_dict(rusage):
+    """CPU times and peak RSS (MB) from a struct_rusage"""
+    return usage_dict(rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss)
+
+
+def usage_dict(user, system, maxrss):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {'user_s': user, 'sys_s': system, 'peak_rss_mb': maxrss / scale}
+
+
+def current_rss_mb():
+    """This process's resident set size right now (MB), or None"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    return None
+
+
+# ========================================================
+# OUTPUT BUFFER
+# ========================================================
+
+class OutputBuffer:
+    """Bounded in-memory tail of a run's output, full text spilled to disk
+    
+    write() is called from the reader threads with (stream, text) chunks.
+    Every chunk is appended to the spill file; the chunks not yet taken by
+    the GUI are kept in a ring of at most max_chars characters, oldest
+    dropped first. take() returns them and whether any were dropped since
+    the last take, in which case the caller's view has a gap and should be
+    repainted from what it got.
+    """
+
+    def __init__(self, max_chars=1000000, spill=True):
+        self.max_chars = max_chars
+        self.spill = spill
+        self.lock = threading.Lock()
+        self.pending = deque()  # (stream, text), oldest first
+        self.pending_chars = 0
+        self.dropped = False
+        self.total_chars = 0
+        self.total_lines = 0
+        self.spill_path = None
+        self.spill_file = None
+        self.spill_bytes = 0
+
+    def write(self, stream, text):
+        with self.lock:
+            self.total_chars += len(text)
+            self.total_lines += text.count('\n')
+            if self.spill:
+                self._spill(text)
+
+            if len(text) > self.max_chars:
+                text = text[-self.max_chars:]
+                self.dropped = True
+            self.pending.append((stream, text))
+            self.pending_chars += len(text)
+            while self.pending_chars > self.max_chars:
+                _, old = self.pending.popleft()
+                self.pending_chars -= len(old)
+                self.dropped = True
+
+    def _spill(self, text):
+        if self.spill_file is None:
+            try:
+                fd, self.spill_path = tempfile.mkstemp(prefix='run-', suffix='.log')
+                self.spill_file = os.fdopen(fd, 'wb')
+            except OSError:
+                self.spill = False  # Keep running with just the in-memory tail
+                return
+        data = text.encode('utf-8', errors='replace')
+        self.spill_file.write(data)
+        self.spill_bytes += len(data)
+
+    def take(self):
+        """([(stream, text), ...] written since the last take, dropped)"""
+        with self.lock:
+            chunks = list(self.pending)
+            dropped = self.dropped
+            self.pending.clear()
+            self.pending_chars = 0
+            self.dropped = False
+        return chunks, dropped
+
+    def close(self):
+        """Flush the spill file; it stays on disk for SpillReader"""
+        with self.lock:
+            self.spill = False  # Late writes only reach the in-memory tail
+            if self.spill_file is not None:
+                self.spill_file.close()
+                self.spill_file = None
+
+    def discard(self):
+        self.close()
+        if self.spill_path is not None:
+            try:
+                os.unlink(self.spill_path)
+            except OSError:
+                pass
+            self.spill_path = None
+
+
+def tail_lines(chunks, max_lines, max_chars=None):
+    """The last max_lines lines (and at most max_chars characters) of
+    (stream, text) chunks, consecutive same-stream text merged, and whether
+    anything was cut"""
+    kept = []
+    lines = chars = 0
+    cut = False
+    for stream, text in reversed(chunks):
+        newlines = text.count('\n')
+        start = len(text)
+        # A trailing newline ends the last line rather than starting a new one
+        if not kept and text.endswith('\n'):
+            newlines -= 1
+            start -= 1
+        if lines + newlines >= max_lines:
+            for _ in range(max_lines - lines):
+                start = text.rfind('\n', 0, start)
+            text = text[start + 1:]
+            cut = True
+        if max_chars is not None and chars + len(text) > max_chars:
+            text = text[len(text) - (max_chars - chars):]
+            cut = True
+        lines += newlines
+        chars += len(text)
+        if text:
+            if kept and kept[-1][0] == stream:
+                kept[-1] = (stream, text + kept[-1][1])
+            else:
+                kept.append((stream, text))
+        if cut:
+            break
+    kept.reverse()
+    return kept, cut
+
+
+class SpillReader:
+    """Page through a spilled log without loading it
+    
+    Page start offsets are discovered on demand by reading forward from
+    the furthest page seen so far, so opening a huge log is instant and
+    memory stays at one page. Lines longer than MAX_LINE bytes are split.
+    """
+
+    MAX_LINE = 65536
+
+    def __init__(self, path, page_lines=1000):
+        self.path = path
+        self.page_lines = page_lines
+        self.offsets = [0]  # Byte offset of each page start found so far
+        self.complete = False  # True once the end of the file was reached
+        self.size = os.path.getsize(path)
+
+    def _scan_to(self, page, f):
+        while len(self.offsets) <= page and not self.complete:
+            f.seek(self.offsets[-1])
+            for _ in range(self.page_lines):
+                if not f.readline(self.MAX_LINE):
+                    self.complete = True
+                    break
+            else:
+                if f.tell() >= self.size:
+                    self.complete = True
+                else:
+                    self.offsets.append(f.tell())
+
+    def page(self, number):
+        """Text of page number (0-based), clamped to the last page"""
+        with open(self.path, 'rb') as f:
+            self._scan_to(number, f)
+            number = max(0, min(number, len(self.offsets) - 1))
+            f.seek(self.offsets[number])
+            lines = [f.readline(self.MAX_LINE) for _ in range(self.page_lines)]
+        return number, b''.join(lines).decode('utf-8', errors='replace')
+
+    def page_count(self):
+        """Total pages; reads through the rest of the file the first time"""
+        with open(self.path, 'rb') as f:
+            self._scan_to(float('inf'), f)
+        return len(self.offsets)
+
+
+# ========================================================
+# PROCESS RUNNER
+# ========================================================
+
+class ProcessRunner:
+    """Run a script in its own process group and stream its output
+
+    stdout and stderr are read in chunks on two daemon threads into
+    self.output (an OutputBuffer). A single ('exit', returncode) event is
+    queued once the process is gone and both pipes are drained, so after
+    drain() returns it, output.take() has everything. stop() and the
+    timeout kill the whole process group, so anything the script spawned
+    goes with it.
+    """
+
+    READ_SIZE = 65536
+    SAMPLE_INTERVAL = 0.05
+    HANDSHAKE_TIMEOUT = 2.0  # Seconds kill() waits for the bootstrap to report the script's pid
+
+    def __init__(self, code, timeout=10.0, python=None, output=None,
+                 cpu_limit=None, memory_limit=None, profile=False, memory_profile=False):
+        self.code = code
+        self.timeout = timeout or None  # 0/None: no limit
+        self.python = python or sys.executable
+        self.output = output if output is not None else OutputBuffer()
+        # CPU seconds and bytes of address space; ignored without resource
+        self.cpu_limit = cpu_limit or None
+        self.memory_limit = memory_limit or None
+        self.profile = profile
+        self.profile_path = None  # Where cProfile writes its stats, if profiling
+        self.memory_profile = memory_profile
+        self.memory_path = None  # Where MemoryTracer writes its summary
+        self.usage = {}  # Filled in when the run ends, see usage_summary()
+        self.peak_children = None
+        self.report_fd = None  # Read end of the bootstrap's usage report
+        self.child_pid = None  # The script's pid when started via the bootstrap
+        self.handshake = threading.Event()  # Set once child_pid is known (or never will be)
+        self.events = queue.Queue()
+        self.process = None
+        self.status = 'idle'  # idle, running, finished, timeout, stopped, error
+        self.returncode = None
+        self.started = None
+        self.first_output = None  # perf_counter of the first byte of output
+        self.finished = None
+        self.script_path = None
+        self.readers = []
+
+    mode = 'cold'
+
+    def command(self, report_fd=None):
+        """argv that runs the script; -u keeps the child's output unbuffered"""
+        command = [self.python, '-u', self.script_path]
+        if self.profile_path or self.memory_path:
+            # Profiled runs go through run_script(), as warm runs do
+            command = [self.python, '-u', RUNNER_PATH, '--run', self.script_path]
+            if self.profile_path:
+                command += ['--profile', self.profile_path]
+            if self.memory_path:
+                command += ['--memory-profile', self.memory_path]
+        if report_fd is None:
+            return command
+        return [self.python, '-S', '-c', ACCOUNTING_BOOTSTRAP, str(int(self.cpu_limit or 0)),
+                str(int(self.memory_limit or 0)), str(report_fd)] + command
+
+    def start_monitor(self, pid):
+        """Sample the number of descendants while the run lasts (needs psutil);
+        where rusage is missing (Windows), CPU times and peak memory too"""
+        if psutil is None:
+            return
+        self.peak_children = 0
+
+        def sample():
+            try:
+                process = psutil.Process(pid)
+                while self.status == 'running':
+                    # The bootstrap itself doesn't count as a child
+                    children = len(process.children(recursive=True))
+                    self.peak_children = max(self.peak_children,
+                                             children - (self.report_fd is not None))
+                    if resource is None:
+                        cpu = process.cpu_times()
+                        memory = process.memory_info()
+                        self.usage.update({
+                            'user_s': cpu.user, 'sys_s': cpu.system,
+                            'peak_rss_mb': getattr(memory, 'peak_wset', memory.rss) / (1024 * 1024)
+                        })
+                    time.sleep(self.SAMPLE_INTERVAL)
+            except psutil.Error:
+                pass  # Gone
+
+        threading.Thread(target=sample, daemon=True).start()
+
+    def write_script(self):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False,
+                                         encoding='utf-8') as f:
+            f.write(self.code)
+            self.script_path = f.name
+        stem = os.path.splitext(self.script_path)[0]
+        if self.profile:
+            self.profile_path = stem + '.prof'
+        if self.memory_profile:
+            self.memory_path = stem + '.memory.json'
+
+    def load_profile(self):
+        """The run's profile with the script mapped to SCRIPT_LABEL, or None
+        (not profiling, or killed before the stats were written); the raw
+        stats file is removed"""
+        if not self.profile_path:
+            return None
+        stats = load_profile(self.profile_path, self.script_path)
+        try:
+            os.unlink(self.profile_path)
+        except OSError:
+            pass
+        return stats
+
+    def load_memory_profile(self):
+        """The run's MemoryTracer summary, or None; the temp file is removed"""
+        if not self.memory_path:
+            return None
+        data = load_memory_profile(self.memory_path)
+        try:
+            os.unlink(self.memory_path)
+        except OSError:
+            pass
+        return data
+
+    def start_readers(self, stdout, stderr):
+        self.readers = [
+            threading.Thread(target=self._read, args=(stdout, 'stdout'), daemon=True),
+            threading.Thread(target=self._read, args=(stderr, 'stderr'), daemon=True)
+        ]
+        for reader in self.readers:
+            reader.start()
+
+    def start(self):
+        self.write_script()
+
+        # A new session/process group lets stop() kill the whole tree
+        if os.name == 'posix':
+            group = {'start_new_session': True}
+        else:
+            group = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+
+        report_write = None
+        if resource is not None:
+            self.report_fd, report_write = os.pipe()
+            group['pass_fds'] = (report_write,)
+
+        self.started = time.perf_counter()
+        try:
+            self.process = subprocess.Popen(
+                self.command(report_write), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, **group)
+        except OSError as e:
+            self.status = 'error'
+            self._cleanup()
+            self.output.write('stderr', f"{type(e).__name__}: {e}\n")
+            self.output.close()
+            self.events.put(('exit', None))
+            return self
+        finally:
+            if report_write is not None:
+                os.close(report_write)
+
+        self.status = 'running'
+        self.start_readers(self.process.stdout, self.process.stderr)
+        self.start_monitor(self.process.pid)
+        threading.Thread(target=self._wait, daemon=True).start()
+        return self
+
+    def _read(self, pipe, stream):
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        fd = pipe.fileno()
+        while True:
+            chunk = os.read(fd, self.READ_SIZE)
+            if not chunk:
+                break
+            if self.first_output is None:
+                self.first_output = time.perf_counter()
+            text = decoder.decode(chunk)
+            if text:
+                self.output.write(stream, text)
+        tail = decoder.decode(b'', final=True)
+        if tail:
+            self.output.write(stream, tail)
+        pipe.close()
+
+    def _wait(self):
+        report = os.fdopen(self.report_fd, 'rb') if self.report_fd is not None else None
+        if report is not None:
+            line = report.readline()  # Written right after the bootstrap forks
+            self.child_pid = int(line) if line.strip() else None
+        self.handshake.set()
+
+        try:
+            self.returncode = self.process.wait(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            self.status = 'timeout'
+            self.kill()
+            self.returncode = self.process.wait()
+
+        if report is not None:
+            with report:
+                fields = report.read().split()
+            if len(fields) == 4:
+                self.usage.update(usage_dict(float(fields[0]), float(fields[1]), int(fields[2])))
+                self.returncode = int(fields[3])
+        self._finish()
+
+    def _hit_cpu_limit(self):
+        """SIGXCPU at the soft limit, or SIGKILL at the hard one if ignored"""
+        if not self.cpu_limit or self.returncode is None:
+            return False
+        if self.returncode == -getattr(signal, 'SIGXCPU', 0):
+            return True
+        cpu = self.usage.get('user_s', 0) + self.usage.get('sys_s', 0)
+        return self.returncode == -signal.SIGKILL and cpu >= self.cpu_limit
+
+    def _finish(self):
+        # A detached grandchild may hold the pipes open; don't wait forever
+        for reader in self.readers:
+            reader.join(timeout=1.0)
+
+        self.finished = time.perf_counter()
+        if self.status == 'running':
+            self.status = 'cpu_limit' if self._hit_cpu_limit() else 'finished'
+        self._cleanup()
+        self.output.close()
+        self.events.put(('exit', self.returncode))
+
+    def kill(self):
+        """Kill the child's whole process group
+
+        Under the bootstrap the script has a group of its own, named by the
+        pid the bootstrap reports; wait for that report rather than killing
+        the bootstrap's group, which the script may already have left.
+        """
+        if self.process is None or self.process.poll() is not None:
+            return
+        if self.report_fd is not None:
+            self.handshake.wait(self.HANDSHAKE_TIMEOUT)
+        try:
+            if os.name == 'posix':
+                os.killpg(self.child_pid or self.process.pid, signal.SIGKILL)
+            else:
+                subprocess.run(['taskkill', '/F', '/T', '/PID', str(self.process.pid)],
+                               capture_output=True)
+        except (ProcessLookupError, PermissionError, OSError):
+            self.process.kill()
+
+    def stop(self):
+        """User-requested stop"""
+        if self.status == 'running':
+            self.status = 'stopped'
+            self.kill()
+
+    @property
+    def running(self):
+        return self.status == 'running'
+
+    @property
+    def time_to_first_output(self):
+        """Seconds from start() to the first byte of output, or None"""
+        if self.first_output is None or self.started is None:
+            return None
+        return self.first_output - self.started
+
+    def usage_summary(self):
+        """What the run cost: wall time, CPU times, peak RSS, child count
+        
+        CPU and RSS are None where the platform can't report them; children
+        is the most descendants seen alive at once (None without psutil).
+        A warm child's peak RSS includes the template's resident set at the
+        fork, given as preload_rss_mb (None for cold runs).
+        """
+        return {
+            'mode': self.mode,
+            'status': self.status,
+            'returncode': self.returncode,
+            'wall_s': self.elapsed,
+            'first_output_s': self.time_to_first_output,
+            'user_s': self.usage.get('user_s'),
+            'sys_s': self.usage.get('sys_s'),
+            'peak_rss_mb': self.usage.get('peak_rss_mb'),
+            'preload_rss_mb': self.usage.get('preload_rss_mb'),
+            'children': self.peak_children,
+            'cpu_limit': self.cpu_limit,
+            'memory_limit': self.memory_limit
+        }
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    def drain(self, limit=1000):
+        """Return up to limit queued events, oldest first"""
+        events = []
+        try:
+            while len(events) < limit:
+                events.append(self.events.get_nowait())
+        except queue.Empty:
+            pass
+        return events
+
+    def _cleanup(self):
+        if self.script_path:
+            try:
+                os.unlink(self.script_path)
+            except OSError:
+                pass
+
+# ========================================================
+# PROFILES
+# ========================================================
+
+RUNNER_PATH = os.path.abspath(__file__)
+
+# File name the editor buffer's functions are saved under in profiles, so
+# profiles of different runs (different temp scripts) line up
+SCRIPT_LABEL = '<editor>'
+
+
+def load_profile(path, script_path=None):
+    """pstats.Stats from a cProfile dump, with script_path renamed to
+    SCRIPT_LABEL; None if the file is missing or unreadable"""
+    try:
+        stats = pstats.Stats(path)
+    except (OSError, TypeError, ValueError, EOFError):
+        return None
+    if script_path:
+        def rename(key):
+            return (SCRIPT_LABEL,) + key[1:] if key[0] == script_path else key
+
+        stats.stats = {
+            rename(key): (cc, nc, tt, ct, {rename(caller): value for caller, value in callers.items()})
+            for key, (cc, nc, tt, ct, callers) in stats.stats.items()
+        }
+    return stats
+
+
+def save_profile(stats, directory, label='run'):
+    """Dump stats to directory/<label>-<timestamp>.prof; returns the path"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{label}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+    n = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f"{label}-{time.strftime('%Y%m%d-%H%M%S')}-{n}.prof")
+        n += 1
+    stats.dump_stats(path)
+    return path
+
+
+def profile_rows(stats):
+    """One dict per profiled function: function, file, line, location,
+    calls, primitive_calls, self_s, cumulative_s and editor_line (the
+    buffer line for the script's own functions, else None)"""
+    rows = []
+    for (filename, line, function), (cc, nc, tt, ct, _) in stats.stats.items():
+        in_script = filename == SCRIPT_LABEL
+        if filename == '~':
+            location = 'built-in'
+        else:
+            location = f"{'editor' if in_script else os.path.basename(filename)}:{line}"
+        rows.append({
+            'function': function,
+            'file': filename,
+            'line': line,
+            'location': location,
+            'calls': nc,
+            'primitive_calls': cc,
+            'self_s': tt,
+            'cumulative_s': ct,
+            'editor_line': line if in_script and line else None
+        })
+    return rows
+
+
+def diff_profiles(old_rows, new_rows):
+    """Rows of both profiles matched by (file, line, function) with old/new
+    self and cumulative time and calls, biggest cumulative change first"""
+    def key(row):
+        return (row['file'], row['line'], row['function'])
+
+    old = {key(row): row for row in old_rows}
+    new = {key(row): row for row in new_rows}
+    diff = []
+    for k in old.keys() | new.keys():
+        before, after = old.get(k), new.get(k)
+        row = dict(after or before)
+        for field in ('calls', 'self_s', 'cumulative_s'):
+            row['old_' + field] = before[field] if before else 0
+            row['new_' + field] = after[field] if after else 0
+        row['delta_self_s'] = row['new_self_s'] - row['old_self_s']
+        row['delta_cumulative_s'] = row['new_cumulative_s'] - row['old_cumulative_s']
+        diff.append(row)
+    diff.sort(key=lambda row: abs(row['delta_cumulative_s']), reverse=True)
+    return diff
+
+
+class MemoryTracer:
+    """tracemalloc snapshots of a running script, summarized per line
+    
+    Each snapshot keeps the top allocation sites (innermost frame) and,
+    for every line of the script, what was allocated while that line was
+    on the stack, so allocations made inside library calls are charged to
+    the editor line that made the call. The script can take extra
+    snapshots with take_memory_snapshot(label); one labelled 'end' is
+    taken when it finishes.
+    
+    Installed modules the script imports are imported before tracing
+    starts: with deep stacks recorded, importing numpy alone takes
+    seconds. Their import-time memory is not reported (as on a warm run,
+    where they are preloaded anyway).
+    """
+
+    FRAMES = 25
+    TOP_SITES = 500
+
+    def __init__(self, script):
+        self.script = script
+        self.snapshots = []
+
+    def start(self):
+        self.preload_imports()
+        tracemalloc.start(self.FRAMES)
+
+    def preload_imports(self):
+        """Import the script's third-party and stdlib modules, untraced"""
+        try:
+            with open(self.script, 'rb') as f:
+                tree = ast.parse(f.read())
+        except (SyntaxError, ValueError):
+            return
+        names = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names.update(alias.name.split('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names.add(node.module.split('.')[0])
+        local = os.path.dirname(self.script) + os.sep
+        for name in sorted(names - set(sys.modules)):
+            try:
+                spec = importlib.util.find_spec(name)
+                # The user's own modules are part of what is being measured
+                if spec is None or (spec.origin or '').startswith(local):
+                    continue
+                importlib.import_module(name)
+            except Exception:
+                pass  # The script's own import reports it
+
+    def script_globals(self):
+        return {'take_memory_snapshot': self.take}
+
+    def take(self, label=None):
+        """Record a snapshot of the memory allocated so far and still alive"""
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        self.snapshots.append(self.summarize(snapshot, label or f"snapshot {len(self.snapshots) + 1}",
+                                             current, peak))
+
+    def summarize(self, snapshot, label, current, peak):
+        sites = {}
+        lines = {}
+        ignored = {tracemalloc.__file__, __file__}
+        # Grouped by traceback: one entry per distinct call stack rather than
+        # per block, which keeps this fast with hundreds of thousands of blocks
+        for stat in snapshot.statistics('traceback'):
+            frames = stat.traceback._frames  # (filename, lineno), oldest first
+            filename, lineno = frames[-1]
+            if filename in ignored:
+                continue
+            site = sites.setdefault((SCRIPT_LABEL if filename == self.script else filename, lineno),
+                                    [0, 0])
+            site[0] += stat.size
+            site[1] += stat.count
+            for filename, lineno in reversed(frames):
+                if filename == self.script:
+                    line = lines.setdefault(lineno, [0, 0])
+                    line[0] += stat.size
+                    line[1] += stat.count
+                    break
+
+        top = sorted(sites.items(), key=lambda item: item[1][0], reverse=True)[:self.TOP_SITES]
+        return {
+            'label': label,
+            'current_bytes': current,
+            'peak_bytes': peak,
+            'sites': [[filename, line, size, count] for (filename, line), (size, count) in top],
+            'editor_lines': sorted(([line, size, count] for line, (size, count) in lines.items()),
+                                   key=lambda row: row[1], reverse=True)
+        }
+
+    def finish(self, path):
+        self.take('end')
+        tracemalloc.stop()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'snapshots': self.snapshots}, f)
+
+
+def load_memory_profile(path):
+    """A saved MemoryTracer summary, or None if missing or unreadable"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data if data.get('snapshots') else None
+
+
+def save_memory_profile(data, directory, label='memory'):
+    """Write a MemoryTracer summary to directory/<label>-<timestamp>.json"""
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(directory, f"{label}-{stamp}.json")
+    n = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f"{label}-{stamp}-{n}.json")
+        n += 1
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    return path
+
+
+def memory_rows(snapshot):
+    """(editor line rows, allocation site rows) of one summarized snapshot;
+    rows have location, line, size, count and editor_line"""
+    lines = [{'location': f"editor:{line}", 'line': line, 'size': size, 'count': count,
+              'editor_line': line} for line, size, count in snapshot['editor_lines']]
+    sites = []
+    for filename, line, size, count in snapshot['sites']:
+        in_script = filename == SCRIPT_LABEL
+        sites.append({
+            'location': f"{'editor' if in_script else filename}:{line}",
+            'line': line, 'size': size, 'count': count,
+            'editor_line': line if in_script else None
+        })
+    return lines, sites
+
+
+def diff_memory(old_rows, new_rows):
+    """Rows matched by location with old/new size and count, biggest growth first"""
+    old = {row['location']: row for row in old_rows}
+    new = {row['location']: row for row in new_rows}
+    diff = []
+    for location in old.keys() | new.keys():
+        before, after = old.get(location), new.get(location)
+        row = dict(after or before)
+        for field in ('size', 'count'):
+            row['old_' + field] = before[field] if before else 0
+            row['new_' + field] = after[field] if after else 0
+        row['delta_size'] = row['new_size'] - row['old_size']
+        row['delta_count'] = row['new_count'] - row['old_count']
+        diff.append(row)
+    diff.sort(key=lambda row: row['delta_size'], reverse=True)
+    return diff
+
+
+# ========================================================
+# WARM INTERPRETER POOL
+# ========================================================
+
+def _send_message(sock, message, fds=()):
+    data = (json.dumps(message) + '\n').encode('utf-8')
+    if fds:
+        socket.send_fds(sock, [data], list(fds))
+    else:
+        sock.sendall(data)
+
+
+class _MessageReader:
+    """Newline-delimited JSON messages from a socket, safe to use with timeouts"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b''
+
+    def read(self, timeout=None):
+        """Next message; raises socket.timeout, EOFError if the peer is gone"""
+        self.sock.settimeout(timeout)
+        while b'\n' not in self.buffer:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise EOFError("warm interpreter exited")
+            self.buffer += chunk
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return json.loads(line)
+
+
+def serve_warm(fd, preload):
+    """Main loop of a warm template process
+    
+    Imports the preload modules once, then for each request forks a child
+    that runs the script with the editor's pipes as stdout/stderr. The
+    template itself never runs user code, so every child starts from the
+    same clean, warm state.
+    """
+    sock = socket.socket(fileno=fd)
+    loaded, failed = [], []
+    for name in preload:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except Exception:
+            failed.append(name)
+    _send_message(sock, {'ready': True, 'loaded': loaded, 'failed': failed})
+
+    while True:
+        try:
+            data, fds, _, _ = socket.recv_fds(sock, 65536, 2)
+        except OSError:
+            break
+        if not data:
+            break  # Editor closed its end
+
+        request = json.loads(data)
+        # The child's ru_maxrss counts what it maps of this process at the
+        # fork, so its peak includes the preload; it reports how much first
+        rss_read, rss_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            sock.close()
+            os.close(rss_read)
+            os.write(rss_write, json.dumps(current_rss_mb()).encode())
+            os.close(rss_write)
+            _run_forked(request, fds)  # Never returns
+        os.close(rss_write)
+        for fd_ in fds:
+            os.close(fd_)
+
+        _send_message(sock, {'pid': pid})
+        with os.fdopen(rss_read, 'rb') as rss:
+            data = rss.read()  # Empty if the child died first
+        preload_rss = json.loads(data) if data else None
+        _, status, rusage = os.wait4(pid, 0)
+        usage = rusage_dict(rusage)
+        usage['preload_rss_mb'] = preload_rss
+        _send_message(sock, {'exit': os.waitstatus_to_exitcode(status), 'usage': usage})
+
+
+def run_script(script, profile_path=None, memory_path=None):
+    """Run script as __main__ in this interpreter; returns its exit code
+    
+    Errors are printed like `python script` prints them. profile_path
+    saves cProfile stats, memory_path a MemoryTracer summary.
+    """
+    sys.argv = [script]
+    sys.path[0] = os.path.dirname(script)
+
+    profiler = cProfile.Profile() if profile_path else None
+    tracer = MemoryTracer(script) if memory_path else None
+    namespace = None
+    try:
+        if profiler is not None:
+            # As `python -m cProfile script` does it
+            with open(script, 'rb') as f:
+                module = compile(f.read(), script, 'exec')
+            profiler.runctx(module, {'__file__': script, '__name__': '__main__',
+                                     '__package__': None, '__cached__': None}, None)
+        elif tracer is not None:
+            tracer.start()
+            # Keep the globals alive until the end snapshot is taken
+            namespace = runpy.run_path(script, init_globals=tracer.script_globals(),
+                                       run_name='__main__')
+        else:
+            runpy.run_path(script, run_name='__main__')
+        code = 0
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException as e:
+        # Start the traceback at the script, as a plain `python script` would
+        tb = e.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != script:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb or e.__traceback__)
+        code = 1
+
+    if profiler is not None:
+        profiler.dump_stats(profile_path)
+    if tracer is not None:
+        tracer.finish(memory_path)
+    del namespace
+    return code
+
+
+def _run_forked(request, fds):
+    """Body of a forked child: behave like `python -u script`, then _exit"""
+    code = 1
+    try:
+        os.setsid()  # Own process group, so Stop can kill everything it spawns
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+        out_fd, err_fd = fds
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(out_fd, 1)
+        os.dup2(err_fd, 2)
+        for fd in (devnull, out_fd, err_fd):
+            os.close(fd)
+
+        # Unbuffered text streams, like -u
+        sys.stdin = io.TextIOWrapper(io.FileIO(0, 'r', closefd=False), encoding='utf-8')
+        sys.stdout = io.TextIOWrapper(io.FileIO(1, 'w', closefd=False), encoding='utf-8',
+                                      errors='backslashreplace', write_through=True)
+        sys.stderr = io.TextIOWrapper(io.FileIO(2, 'w', closefd=False), encoding='utf-8',
+                                      errors='backslashreplace', write_through=True)
+
+        apply_limits(request.get('cpu_limit'), request.get('memory_limit'))
+        os.chdir(request['cwd'])
+        code = run_script(request['script'], request.get('profile'), request.get('memory'))
+
+        # What interpreter shutdown would do: wait for threads, run atexit
+        for thread in threading.enumerate():
+            if thread is not threading.current_thread() and not thread.daemon:
+                thread.join()
+        atexit._run_exitfuncs()
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+class WarmTemplate:
+    """Editor-side handle on one warm template process"""
+
+    def __init__(self, preload, python=None):
+        self.preload = list(preload)
+        parent_sock, child_sock = socket.socketpair()
+        self.sock = parent_sock
+        self.reader = _MessageReader(parent_sock)
+        self.process = subprocess.Popen(
+            [python or sys.executable, os.path.abspath(__file__),
+             '--warm-server', str(child_sock.fileno()), '--preload', ','.join(self.preload)],
+            pass_fds=(child_sock.fileno(),), stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        child_sock.close()
+        self.ready = False
+        self.busy = False
+        self.loaded = []
+        self.failed = []
+
+    def wait_ready(self, timeout=60.0):
+        """Block until the preload imports are done; False if the template died"""
+        try:
+            message = self.reader.read(timeout)
+        except (OSError, EOFError, ValueError):
+            self.close()
+            return False
+        self.loaded = message.get('loaded', [])
+        self.failed = message.get('failed', [])
+        self.ready = True
+        return True
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def close(self):
+        self.ready = False
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+
+class WarmPool:
+    """A few warm template interpreters to fork runs from
+    
+    Templates are started in the background and import the preload modules
+    (missing ones are skipped). acquire() hands out an idle, ready template
+    or None, in which case the caller should fall back to a cold run. A
+    template that dies is replaced. Needs os.fork, so POSIX only.
+    """
+
+    available = hasattr(os, 'fork') and hasattr(socket, 'send_fds')
+
+    def __init__(self, size=2, preload=('numpy', 'pandas'), python=None):
+        self.size = size
+        self.preload = list(preload)
+        self.python = python
+        self.templates = []
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def start(self):
+        for _ in range(self.size):
+            self._spawn()
+        return self
+
+    def _spawn(self):
+        template = WarmTemplate(self.preload, self.python)
+        with self.lock:
+            self.templates.append(template)
+        threading.Thread(target=template.wait_ready, daemon=True).start()
+
+    def acquire(self):
+        """An idle, ready template marked busy, or None"""
+        with self.lock:
+            if self.closed:
+                return None
+            for template in self.templates:
+                if template.ready and not template.busy and template.alive:
+                    template.busy = True
+                    return template
+        return None
+
+    def release(self, template, healthy=True):
+        with self.lock:
+            template.busy = False
+            if healthy or self.closed:
+                return
+            self.templates.remove(template)
+        template.close()
+        self._spawn()
+
+    @property
+    def ready_count(self):
+        return sum(1 for template in self.templates if template.ready and template.alive)
+
+    def loaded_modules(self):
+        for template in self.templates:
+            if template.ready:
+                return template.loaded
+        return []
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            templates, self.templates = self.templates, []
+        for template in templates:
+            template.close()
+
+
+class WarmRunner(ProcessRunner):
+    """ProcessRunner that forks the run from a WarmPool template"""
+
+    mode = 'warm'
+
+    def __init__(self, code, pool, template, timeout=10.0, **options):
+        super().__init__(code, timeout, **options)
+        self.pool = pool
+        self.template = template
+        self.pid = None
+
+    def start(self):
+        self.write_script()
+        out_read, out_write = os.pipe()
+        err_read, err_write = os.pipe()
+
+        self.started = time.perf_counter()
+        try:
+            request = {'script': self.script_path, 'cwd': os.getcwd(),
+                       'cpu_limit': self.cpu_limit, 'memory_limit': self.memory_limit,
+                       'profile': self.profile_path, 'memory': self.memory_path}
+            _send_message(self.template.sock, request, fds=(out_write, err_write))
+            self.pid = self.template.reader.read(timeout=10.0)['pid']
+        except (OSError, EOFError, ValueError, KeyError) as e:
+            for fd in (out_read, err_read):
+                os.close(fd)
+            self.status = 'error'
+            self._cleanup()
+            self.pool.release(self.template, healthy=False)
+            self.output.write('stderr', f"Warm interpreter failed: {e}\n")
+            self.output.close()
+            self.events.put(('exit', None))
+            return self
+        finally:
+            os.close(out_write)
+            os.close(err_write)
+
+        self.status = 'running'
+        self.start_readers(os.fdopen(out_read, 'rb'), os.fdopen(err_read, 'rb'))
+        self.start_monitor(self.pid)
+        threading.Thread(target=self._wait, daemon=True).start()
+        return self
+
+    def _wait(self):
+        healthy = True
+        try:
+            try:
+                message = self.template.reader.read(self.timeout)
+            except socket.timeout:
+                self.status = 'timeout'
+                self.kill()
+                message = self.template.reader.read(None)
+            self.returncode = message['exit']
+            self.usage.update(message.get('usage', {}))
+        except (OSError, EOFError, ValueError, KeyError):
+            healthy = False
+            self.kill()
+        self.pool.release(self.template, healthy)
+        self._finish()
+
+    def kill(self):
+        """Kill the forked child's process group"""
+        if self.pid is None or self.returncode is not None:
+            return
+        try:
+            os.killpg(self.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Warm interpreter template (started by WarmPool), or a profiled run.")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--warm-server', type=int, metavar='FD',
+                      help="socket file descriptor shared with the editor")
+    mode.add_argument('--run', metavar='SCRIPT', help="run SCRIPT as __main__")
+    parser.add_argument('--preload', default='', help="comma-separated modules to import")
+    parser.add_argument('--profile', metavar='PATH', help="with --run: save cProfile stats")
+    parser.add_argument('--memory-profile', metavar='PATH',
+                        help="with --run: save a tracemalloc summary")
+    args = parser.parse_args(argv)
+    if args.run:
+        return run_script(os.path.abspath(args.run), args.profile, args.memory_profile)
+    serve_warm(args.warm_server, [name for name in args.preload.split(',') if name])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
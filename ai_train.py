@@ -0,0 +1,203 @@
+# ai_train.py
+"""
+Offline training for the feature classifier.
+
+Streams a labeled corpus in fixed-size chunks, turns each file into an
+extract_features vector on a process pool and fits FeatureClassifier with
+partial_fit, so memory stays bounded by the chunk size rather than the
+corpus size. The result is saved as memory-mappable .npy arrays in
+code_classifier/ (MLCodeAnalyzer.CLASSIFIER_PATH), where the editor and
+MLCodeAnalyzer.predict_many pick it up.
+
+Corpus layouts:
+    corpus/<label>/**/*.py     one label per file, taken from the top directory
+    labels.jsonl               {"path": "...", "labels": ["security", ...]}
+                               ("code" may be given instead of "path")
+
+Usage:
+    python ai_train.py corpus/ --epochs 3 -j 8
+    python ai_train.py labels.jsonl --resume
+
+Does not import tkinter.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from itertools import islice
+from multiprocessing import Pool
+
+import numpy as np
+
+from ai_analyzer import FeatureClassifier, MLCodeAnalyzer
+
+# Per-process analyzer, created once by the pool initializer
+_analyzer = None
+
+
+def init_worker():
+    """Create this process's feature extractor"""
+    global _analyzer
+    _analyzer = MLCodeAnalyzer()
+    _analyzer.autosave = False
+
+
+def featurize(item):
+    """(feature vector, labels) for one corpus item, or None if unreadable"""
+    try:
+        code = item.get('code')
+        if code is None:
+            with open(item['path'], 'r', encoding='utf-8', errors='replace') as f:
+                code = f.read()
+        return _analyzer.feature_vector(_analyzer.extract_features(code)), list(item['labels'])
+    except (OSError, KeyError, ValueError, RecursionError):
+        return None
+
+
+def iter_corpus(source):
+    """Yield {'path' or 'code', 'labels'} items from a corpus directory or JSONL manifest"""
+    if os.path.isfile(source):
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if 'path' in item and not os.path.isabs(item['path']):
+                    item['path'] = os.path.join(base, item['path'])
+                yield item
+        return
+
+    # Round-robin over the label directories so every chunk mixes labels
+    walkers = [iter_label_dir(os.path.join(source, label), label)
+               for label in sorted(os.listdir(source))
+               if os.path.isdir(os.path.join(source, label))]
+    while walkers:
+        for walker in list(walkers):
+            item = next(walker, None)
+            if item is None:
+                walkers.remove(walker)
+            else:
+                yield item
+
+
+def iter_label_dir(label_dir, label):
+    """Yield the .py files under one label directory"""
+    for dirpath, dirnames, filenames in os.walk(label_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith('.py'):
+                yield {'path': os.path.join(dirpath, filename), 'labels': [label]}
+
+
+def iter_chunks(items, size):
+    """Group an iterable into lists of at most size items"""
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def shuffled(chunks, rng):
+    """Shuffle within each chunk; SGD converges poorly on label-sorted input"""
+    for chunk in chunks:
+        rng.shuffle(chunk)
+        yield chunk
+
+
+def train(source, output, epochs=1, chunk_size=512, jobs=1, resume=False,
+          learning_rate=0.1, seed=0, log=sys.stderr):
+    """Fit (or continue fitting) the classifier on a streamed corpus; returns a summary"""
+    classifier = FeatureClassifier.load(output) if resume else None
+    if classifier is None:
+        classifier = FeatureClassifier(MLCodeAnalyzer.FEATURE_NAMES, learning_rate=learning_rate)
+    elif classifier.feature_names != MLCodeAnalyzer.FEATURE_NAMES:
+        raise ValueError(f"{output} was trained on different features; retrain without --resume")
+
+    rng = random.Random(seed)
+    summary = {'samples': 0, 'skipped': 0, 'epochs': epochs, 'chunks': 0}
+    pool = Pool(processes=jobs, initializer=init_worker) if jobs > 1 else None
+    if pool is None:
+        init_worker()
+
+    start = time.perf_counter()
+    featurize_seconds = 0.0
+    try:
+        for epoch in range(epochs):
+            # Progressive validation: score each chunk before learning from it
+            correct = total = 0
+            for chunk in shuffled(iter_chunks(iter_corpus(source), chunk_size), rng):
+                chunk_start = time.perf_counter()
+                rows = pool.map(featurize, chunk) if pool else [featurize(item) for item in chunk]
+                featurize_seconds += time.perf_counter() - chunk_start
+
+                rows = [row for row in rows if row is not None]
+                summary['skipped'] += len(chunk) - len(rows)
+                if not rows:
+                    continue
+
+                X = np.array([vector for vector, labels in rows])
+                y = [labels for vector, labels in rows]
+                if classifier.labels and classifier.samples:
+                    predicted = classifier.predict(X)
+                    correct += sum(set(p) == set(t) for p, t in zip(predicted, y))
+                    total += len(y)
+
+                classifier.partial_fit(X, y)
+                summary['samples'] += len(rows)
+                summary['chunks'] += 1
+
+            accuracy = correct / total if total else 0.0
+            summary['accuracy'] = round(accuracy, 4)
+            print(f"epoch {epoch + 1}/{epochs}: progressive exact-match accuracy "
+                  f"{accuracy:.3f} over {total} files", file=log)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    elapsed = time.perf_counter() - start
+    classifier.save(output)
+
+    summary['labels'] = classifier.labels
+    summary['seconds'] = round(elapsed, 3)
+    summary['featurize_seconds'] = round(featurize_seconds, 3)
+    summary['samples_per_second'] = round(summary['samples'] / elapsed, 1) if elapsed else 0.0
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Train the feature classifier on a labeled corpus, streamed in chunks.")
+    parser.add_argument('corpus', help="corpus directory (<label>/**/*.py) or JSONL manifest")
+    parser.add_argument('-o', '--output', default=MLCodeAnalyzer.CLASSIFIER_PATH,
+                        help=f"model directory (default: {MLCodeAnalyzer.CLASSIFIER_PATH})")
+    parser.add_argument('--epochs', type=int, default=3, help="passes over the corpus (default: 3)")
+    parser.add_argument('--chunk-size', type=int, default=512,
+                        help="files held in memory at once (default: 512)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="feature extraction processes (default: CPU count)")
+    parser.add_argument('--learning-rate', type=float, default=0.1,
+                        help="SGD step size for a new model (default: 0.1)")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue training the model already at --output")
+    args = parser.parse_args(argv)
+
+    if args.jobs < 1 or args.epochs < 1 or args.chunk_size < 1:
+        parser.error("-j, --epochs and --chunk-size must be at least 1")
+
+    summary = train(args.corpus, args.output, epochs=args.epochs, chunk_size=args.chunk_size,
+                    jobs=args.jobs, resume=args.resume, learning_rate=args.learning_rate)
+
+    print(f"🧠 Trained on {summary['samples']} files ({summary['skipped']} skipped) in "
+          f"{summary['seconds']}s ({summary['samples_per_second']} files/s); "
+          f"labels: {', '.join(summary['labels'])} -> {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
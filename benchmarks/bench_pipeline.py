@@ -0,0 +1,245 @@
+# bench_pipeline.py
+"""
+Benchmark: analysis pipeline stages across file sizes and pattern densities.
+
+Generates synthetic, parseable Python sources (100 to 100k lines by
+default) in which a controllable fraction of statements trigger the
+analyzer's rules (initialize_patterns and count_patterns), then times each
+stage of EnhancedAIAnalyzer: rule_based_analysis, predict_issues,
+detect_code_smells, get_advanced_metrics and the end-to-end analyze_code.
+
+Every stage is timed twice: cold (all per-revision caches cleared, so the
+shared AST parse and rule scan are included) and warm (caches primed by a
+previous run, so only the stage's own work is left).
+
+Results are written as JSON. With --compare, the run is checked against a
+saved baseline and any stage that got slower than the threshold is
+flagged; the exit status is 1 if there are regressions.
+
+Run:
+    python benchmarks/bench_pipeline.py -o baseline.json
+    python benchmarks/bench_pipeline.py --compare baseline.json [--threshold 0.2]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from ai_analyzer import EnhancedAIAnalyzer
+
+
+# Statements that trigger a rule; {v} is replaced by a variable name
+PATTERN_LINES = [
+    'for i in range(len({v})):',            # range(len()), for loop
+    '{v} = {v} + other',                   # augmented assignment
+    '{v} = {v} + "suffix"',                # string concatenation
+    'if {v} in [1, 2, 3]:',                # list membership
+    'if bool({v}) == True:',               # redundant bool
+    'if len({v}) > 0:',                    # len() > 0
+    'if {v} == False:',                    # == False
+    'result = eval({v})',                  # eval
+    'exec({v})',                           # exec
+    'print("debug", {v})',                 # print debugging
+    '# TODO: revisit {v}',                 # todo comment
+    'squares = [x * x for x in {v}]',      # list comprehension
+]
+
+# Statements no rule matches
+CLEAN_LINES = [
+    'total_{v} = compute({v}, 3)',
+    'values.append({v})',
+    'name = str({v}).strip()',
+    'count += 1',
+    'return_value = helper({v})',
+]
+
+VARIABLES = ['items', 'data', 'values', 'text', 'records', 'payload']
+
+# Openers for lines ending in ':' need a body
+BLOCK_BODY = 'pass'
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+DEFAULT_DENSITIES = [0.05, 0.2, 0.5]
+STAGES = ['rule_based_analysis', 'predict_issues', 'detect_code_smells',
+          'get_advanced_metrics', 'analyze_code']
+
+
+def generate_source(line_count, density, seed=0):
+    """Build a source of at least line_count lines, ending on a complete
+    function; density is the fraction of statements that match a rule"""
+    rng = random.Random(seed)
+    lines = []
+    function = 0
+    while len(lines) < line_count:
+        if function % 10 == 0:
+            lines.append(f'class Service{function // 10}:')
+            lines.append('    """Generated service"""')
+            lines.append('')
+        lines.append(f'    def handler_{function}(self, {", ".join(VARIABLES[:3])}):')
+        lines.append(f'        """Handler {function}"""')
+        for _ in range(rng.randint(5, 25)):
+            variable = rng.choice(VARIABLES)
+            source = PATTERN_LINES if rng.random() < density else CLEAN_LINES
+            statement = rng.choice(source).format(v=variable)
+            lines.append('        ' + statement)
+            if statement.endswith(':'):
+                lines.append('            ' + BLOCK_BODY)
+        lines.append('        return None')
+        lines.append('')
+        function += 1
+    return '\n'.join(lines) + '\n'
+
+
+def clear_caches(analyzer):
+    """Drop every per-revision cache so each stage is timed cold"""
+    ml = analyzer.ml_analyzer
+    for cache in (ml.feature_cache, ml.scan_cache, ml.line_index_cache, ml.ast_cache):
+        cache.clear()
+
+
+def time_stage(analyzer, stage, code, repeats, cold=True):
+    """Seconds per run of one stage; cold clears the caches before each run"""
+    target = analyzer.ml_analyzer if stage == 'predict_issues' else analyzer
+    function = getattr(target, stage)
+    if not cold:
+        function(code)  # Prime the caches
+    samples = []
+    for _ in range(repeats):
+        if cold:
+            clear_caches(analyzer)
+        start = time.perf_counter()
+        function(code)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(sizes, densities, repeats, stages=STAGES, log=sys.stderr):
+    """Benchmark every size x density x stage; returns the JSON-ready report"""
+    analyzer = EnhancedAIAnalyzer()  # Stage timer off: stages run without its wrappers
+    analyzer.ml_analyzer.autosave = False
+
+    results = []
+    for size in sizes:
+        for density in densities:
+            code = generate_source(size, density)
+            matches = sum(len(m) for m in analyzer.ml_analyzer.scan(code).values())
+            for stage in stages:
+                # Fewer repeats on big inputs; the noise there is proportionally small
+                stage_repeats = max(1, repeats if size <= 10000 else repeats // 3)
+                samples = time_stage(analyzer, stage, code, stage_repeats)
+                warm = time_stage(analyzer, stage, code, stage_repeats, cold=False)
+                result = {
+                    'lines': code.count('\n'),
+                    'target_lines': size,
+                    'density': density,
+                    'stage': stage,
+                    'matches': matches,
+                    'repeats': stage_repeats,
+                    'median_s': statistics.median(samples),
+                    'min_s': min(samples),
+                    'max_s': max(samples),
+                    'warm_median_s': statistics.median(warm),
+                    'warm_min_s': min(warm)
+                }
+                results.append(result)
+                print(f"{size:>8} {density:>7.2f} {stage:<22} {result['median_s'] * 1000:>10.2f} ms "
+                      f"{result['warm_median_s'] * 1000:>10.2f} ms", file=log)
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform()
+        },
+        'results': results
+    }
+
+
+def compare(report, baseline, threshold, min_delta):
+    """Regressions of report against baseline: [(key, base s, new s, ratio)]
+    
+    key is (target lines, density, stage, 'cold' or 'warm'). Best-of-N
+    times are compared: on a busy machine the minimum is far more stable
+    than the median.
+    """
+    def key(result):
+        return (result['target_lines'], result['density'], result['stage'])
+
+    base = {key(result): result for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        old = base.get(key(result))
+        if old is None:
+            continue
+        for mode, field in (('cold', 'min_s'), ('warm', 'warm_min_s')):
+            before, after = old[field], result[field]
+            # Require both a relative and an absolute slowdown to filter timer noise
+            if after > before * (1 + threshold) and after - before > min_delta:
+                ratio = after / before if before else float('inf')
+                regressions.append((key(result) + (mode,), before, after, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='file sizes in lines (default: 100 1000 10000 100000)')
+    parser.add_argument('--densities', type=float, nargs='+', default=DEFAULT_DENSITIES,
+                        help='fraction of statements matching a rule (default: 0.05 0.2 0.5)')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES,
+                        help='stages to time (default: all)')
+    parser.add_argument('--repeats', type=int, default=3, help='runs per measurement (default: 3)')
+    parser.add_argument('-o', '--output', help='write the JSON report here')
+    parser.add_argument('--compare', metavar='BASELINE', help='baseline JSON report to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown flagged as a regression (default: 0.2 = 20%%)')
+    parser.add_argument('--min-delta', type=float, default=0.001,
+                        help='ignore slowdowns smaller than this many seconds (default: 0.001)')
+    args = parser.parse_args()
+
+    print(f"{'lines':>8} {'density':>7} {'stage':<22} {'cold':>13} {'warm':>13}", file=sys.stderr)
+    report = run(args.sizes, args.densities, max(1, args.repeats), args.stages)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.min_delta)
+        for (lines, density, stage, mode), before, after, ratio in regressions:
+            print(f"⚠️ REGRESSION {stage} ({mode}) @ {lines} lines, density {density}: "
+                  f"{before * 1000:.2f} ms -> {after * 1000:.2f} ms ({ratio:.2f}x)", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"✅ No regressions against {args.compare} "
+              f"(revision {baseline['meta'].get('revision')})", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# bench_runner.py
+"""
+Benchmark: time from Run to first output, cold start vs warm pool.
+
+Runs the same small script repeatedly with ProcessRunner (a fresh
+interpreter every time) and with WarmRunner (forked from a WarmPool
+template that already imported the preload modules), and reports the
+median and best time to the first byte of output and to exit.
+
+Run: python benchmarks/bench_runner.py [--runs 20] [--preload numpy pandas]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_runner import ProcessRunner, WarmPool, WarmRunner
+
+
+def script_for(modules):
+    """A script that imports the modules, then prints one line"""
+    imports = ''.join(f"import {name}\n" for name in modules)
+    return imports + 'print("ready")\n'
+
+
+def wait(runner):
+    while True:
+        if any(stream == 'exit' for stream, _ in runner.drain()):
+            return runner
+        time.sleep(0.001)
+
+
+def measure(make_runner, runs):
+    first, total = [], []
+    for _ in range(runs):
+        runner = wait(make_runner().start())
+        if runner.time_to_first_output is not None:
+            first.append(runner.time_to_first_output)
+        total.append(runner.elapsed)
+    return first, total
+
+
+def report(label, first, total):
+    print(f"{label:<6} first output: median {statistics.median(first) * 1000:8.1f} ms, "
+          f"best {min(first) * 1000:8.1f} ms   exit: median {statistics.median(total) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20, help='runs per mode (default: 20)')
+    parser.add_argument('--preload', nargs='*', default=['numpy'],
+                        help='modules the script imports and the pool preloads (default: numpy)')
+    args = parser.parse_args()
+
+    code = script_for(args.preload)
+    report('cold', *measure(lambda: ProcessRunner(code), args.runs))
+
+    if not WarmPool.available:
+        print("warm pool needs os.fork; skipped")
+        return
+    pool = WarmPool(size=1, preload=args.preload).start()
+    try:
+        while not pool.ready_count:
+            time.sleep(0.01)
+        report('warm', *measure(lambda: WarmRunner(code, pool, pool.acquire()), args.runs))
+    finally:
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# bench_streaming.py
+"""
+Benchmark: whole-text analysis vs the one-pass streaming API.
+
+Writes generated sources (bench_pipeline.generate_source) of growing size
+to a temp file, then analyzes each one twice: analyze_code on the file's
+full text, and analyze_stream on the open file. Reports the time and the
+tracemalloc peak of each; the streaming peak should stay flat as the file
+grows, bounded by detector state rather than source size.
+
+Run: python benchmarks/bench_streaming.py [--lines 10000 100000] [--density 0.2]
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ai_analyzer import EnhancedAIAnalyzer
+from bench_pipeline import clear_caches, generate_source
+
+
+def measure(function):
+    """(seconds, peak traced bytes) of one call"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        function()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='file sizes in lines (default: 1000 10000 100000)')
+    parser.add_argument('--density', type=float, default=0.2,
+                        help='fraction of statements matching a rule (default: 0.2)')
+    args = parser.parse_args()
+
+    analyzer = EnhancedAIAnalyzer()
+    analyzer.ml_analyzer.autosave = False
+
+    def whole(path):
+        with open(path, encoding='utf-8') as f:
+            analyzer.analyze_code(f.read())
+        clear_caches(analyzer)  # Don't let the cached text outlive the run
+
+    def stream(path):
+        with open(path, encoding='utf-8') as f:
+            analyzer.analyze_stream(f)
+
+    print(f"{'lines':>8} {'file MB':>8} {'text (s)':>9} {'text peak MB':>13} "
+          f"{'stream (s)':>11} {'stream peak MB':>15}")
+    with tempfile.TemporaryDirectory(prefix='bench_streaming_') as workdir:
+        path = os.path.join(workdir, 'source.py')
+        for size in args.lines:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(generate_source(size, args.density))
+            mb = os.path.getsize(path) / 2 ** 20
+            text_s, text_peak = measure(lambda: whole(path))
+            stream_s, stream_peak = measure(lambda: stream(path))
+            print(f"{size:>8} {mb:>8.2f} {text_s:>9.3f} {text_peak / 2 ** 20:>13.2f} "
+                  f"{stream_s:>11.3f} {stream_peak / 2 ** 20:>15.2f}")
+
+
+if __name__ == '__main__':
+    main()
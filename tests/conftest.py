@@ -0,0 +1,35 @@
+# conftest.py
+"""Shared fixtures; the modules under test live in the repository root."""
+import copy
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_analyzer import EnhancedAIAnalyzer
+
+
+@pytest.fixture(scope='session')
+def analyzer():
+    """One analyzer for the session; it never writes the model file"""
+    analyzer = EnhancedAIAnalyzer()
+    analyzer.ml_analyzer.autosave = False
+    return analyzer
+
+
+@pytest.fixture
+def frozen(analyzer):
+    """Call f(*args) with the pattern weights restored afterwards
+    
+    The model learns from every prediction, so two analyses of the same
+    text only agree if each starts from the same weights.
+    """
+    def call(f, *args):
+        model = copy.deepcopy(analyzer.ml_analyzer.pattern_model)
+        try:
+            return f(*args)
+        finally:
+            analyzer.ml_analyzer.pattern_model = model
+    return call
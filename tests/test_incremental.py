@@ -0,0 +1,125 @@
+# test_incremental.py
+"""IncrementalAnalyzer after edits against a fresh analysis of the same text."""
+import ast
+import random
+import textwrap
+
+import pytest
+
+from ai_analyzer import IncrementalAnalyzer
+
+SOURCE = textwrap.dedent('''\
+    """Module docstring"""
+    import os
+    
+    
+    @decorator
+    def first(items):
+        total = ''
+        for i in range(len(items)):
+            total = total + 'x'
+        return total
+    
+    
+    class Thing(Base):
+        """Class docstring
+        
+        def not_a_block(): spans the docstring
+        """
+        
+        def method(self, value):
+            if bool(value) == True:
+                try:
+                    return eval(value)
+                except:
+                    pass
+            elif value:
+                print("debug", value)
+            else:
+                return None
+    
+    
+    CONSTANT = [
+        1, 2,
+    3]
+    
+    
+    def second(flag):
+        if flag in [1, 2]:
+            return '"""'
+        # TODO: tidy
+        return """
+    x = 1
+    """
+    
+    
+    if __name__ == "__main__":
+        first([])
+''') * 3
+
+# Inserted at random offsets: block openers, continuations and the tokens
+# that change how the following lines split (brackets, quotes, decorators)
+FRAGMENTS = ['"""', "'''", '(', ')', '[', ']', "'", '\\\n', '@dec\n', '# c\n', '\n', '\n\n',
+             'def f():\n', 'else:\n', 'elif x:\n', 'x = 1\n', 'class A:\n    pass\n',
+             '    if a and b:\n        y = eval(z)\n', '        return None\n']
+
+
+def edit(rng, code):
+    """Apply one random edit; returns the new code and its dirty line range"""
+    pos = rng.randint(0, len(code))
+    first = code.count('\n', 0, pos) + 1
+    if rng.random() < 0.6:
+        text = rng.choice(FRAGMENTS)
+        return code[:pos] + text + code[pos:], (first, first + text.count('\n'))
+    end = min(len(code), pos + rng.choice([1, 3, 10, 80, 400]))
+    return code[:pos] + code[end:], (first, first)
+
+
+def parses(code):
+    try:
+        ast.parse(code)
+    except SyntaxError:
+        return False
+    return True
+
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('hints', ['exact', 'none'])
+def test_edits_match_fresh_analysis(analyzer, frozen, seed, hints):
+    rng = random.Random(seed)
+    code = SOURCE
+    incremental = IncrementalAnalyzer(analyzer)
+    frozen(incremental.analyze, code)
+    
+    for _ in range(40):
+        code, dirty = edit(rng, code)
+        result = frozen(incremental.analyze, code, [dirty] if hints == 'exact' else None)
+        
+        fresh = IncrementalAnalyzer(analyzer)
+        assert result == frozen(fresh.analyze, code)
+        assert incremental.offsets == fresh.offsets
+        assert incremental.results == fresh.results
+        assert +incremental.totals == +fresh.totals
+        
+        if parses(code):
+            full = frozen(analyzer.analyze_code, code), analyzer.get_advanced_metrics(code)
+            assert result == full
+
+
+def test_misleading_hint_is_verified(analyzer, frozen):
+    incremental = IncrementalAnalyzer(analyzer)
+    frozen(incremental.analyze, SOURCE)
+    code = SOURCE.replace('return total', 'return total * 2', 1)
+    result = frozen(incremental.analyze, code, [(400, 410)])  # Nowhere near the edit
+    assert result == frozen(IncrementalAnalyzer(analyzer).analyze, code)
+
+
+def test_unchanged_blocks_are_reused(analyzer, frozen):
+    incremental = IncrementalAnalyzer(analyzer)
+    frozen(incremental.analyze, SOURCE)
+    line = SOURCE.count('\n', 0, SOURCE.index('return total')) + 1
+    before = dict(incremental.stats)
+    frozen(incremental.analyze, SOURCE.replace('return total', 'return total * 2', 1),
+           [(line, line)])
+    assert incremental.stats['recomputed'] - before['recomputed'] == 1
+    assert incremental.stats['full_passes'] == before['full_passes']
@@ -0,0 +1,79 @@
+# test_rule_engine.py
+"""RuleEngine.scan against running re.finditer for each rule on its own."""
+import os
+import re
+import textwrap
+
+import pytest
+
+from ai_analyzer import RuleEngine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Hits every rule, including the case-insensitive one and assignments that
+# only match part way into an identifier
+SAMPLE = textwrap.dedent('''\
+    import os
+    
+    class Thing:
+        pass
+    
+    def f(items, flag):
+        total = ''
+        for i in range(len(items)):
+            total = total + 'x'
+        for item in items:
+            count = count + item
+            xtotal = total + items
+        if flag in [1, 2]:
+            pass
+        if bool(flag) == True:
+            print("debug", flag)
+        if len(items) > 0:
+            PRINT("TEMP")
+        if flag == False:
+            eval("1 + 1")
+            exec("pass")
+        try:
+            pass
+        except:
+            print "old"
+        squares = [x * x for x in items]  # TODO: remove
+        return total
+''')
+
+
+def expected_spans(pattern, code):
+    # Documented difference: assignment-shaped rules don't start mid-identifier
+    if RuleEngine.ASSIGNMENT_PREFIX.match(pattern.pattern):
+        pattern = re.compile(r'(?<!\w)' + pattern.pattern, pattern.flags)
+    return [m.span() for m in pattern.finditer(code)]
+
+
+def sources():
+    yield 'sample', SAMPLE
+    for name in ('ai.py', 'ai_analyzer.py', 'ai_runner.py'):
+        with open(os.path.join(ROOT, name), encoding='utf-8') as f:
+            yield name, f.read()
+
+
+@pytest.mark.parametrize('name, code', list(sources()), ids=lambda value: value[:20])
+def test_scan_matches_finditer(analyzer, name, code):
+    engine = analyzer.ml_analyzer.rule_engine
+    scan = engine.scan(code)
+    assert set(scan) == set(engine.names)
+    for rule, index in engine.names.items():
+        expected = expected_spans(engine.rules[index]['pattern'], code)
+        assert [m.span() for m in scan[rule]] == expected, rule
+
+
+def test_sample_hits_every_rule(analyzer):
+    scan = analyzer.ml_analyzer.rule_engine.scan(SAMPLE)
+    assert [rule for rule, matches in scan.items() if not matches] == []
+
+
+def test_literal_prefix():
+    assert RuleEngine.literal_prefix(r'eval\s*\(') == 'eval'
+    assert RuleEngine.literal_prefix(r'except\s*:') == 'except'
+    assert RuleEngine.literal_prefix(r'a|b') == ''
+    assert RuleEngine.literal_prefix(r'ab?c') == 'a'